@@ -5,7 +5,8 @@ Created on 22.02.2016
 '''
 import matplotlib.pyplot as plt
 import numpy as np
-from cbfe.scratch.fe_nls_solver_incre1 import MATSEval, FETS1D52ULRH, TStepper, TLoop
+from cbfe.fe_nls_solver_incre import TStepper, TLoop
+from cbfe.fe_nls_solver_ensemble import TStepperEnsemble, TLoopEnsemble
 from ibvpy.api import BCDof
 
 # 30-v1g-r3-f
@@ -69,7 +70,7 @@ ts = TStepper()
 n_dofs = ts.domain.n_dofs
 ts.bc_list = [BCDof(var='u', dof=n_dofs - 2, value=0.0),
               BCDof(var='u', dof=n_dofs - 1, value=5.0)]
-tl = TLoop(ts=ts)
+tl = TLoop(ts=ts, tolerance=1e-6)
 tl.ts.L_x = 400
 tl.ts.mats_eval.E_m = 1e7
 # tl.ts.mats_eval.slip = x.tolist()
@@ -99,17 +100,21 @@ plt.plot(x_true, [0, 50, 70, 40], lw=2,  color='k')
 plt.xlabel('slip [mm]')
 plt.ylabel('bond [MPa]')
 plt.figure()
-U_avg = []
-F_avg = []
 
-for i in range(100):
-    tl.ts.mats_eval.slip = (alpha[i] * x).tolist()
-    tl.ts.mats_eval.bond = (beta[i] * y).tolist()
-    U_record, F_record, sf_record = tl.eval()
-    plt.plot(U_record[:, n_dof], F_record[:, n_dof],
-             color='lightgray', alpha=0.5)
-    U_avg.append(U_record[:, n_dof])
-    F_avg.append(F_record[:, n_dof])
+# all realizations are solved at once
+ts_ens = TStepperEnsemble(L_x=400)
+ts_ens.mats_eval.E_m = 1e7
+ts_ens.mats_eval.slip = alpha[:, None] * x[None, :]
+ts_ens.mats_eval.bond = beta[:, None] * y[None, :]
+ts_ens.bc_list = [BCDof(var='u', dof=n_dofs - 2, value=0.0),
+                  BCDof(var='u', dof=n_dofs - 1, value=5.0)]
+tl_ens = TLoopEnsemble(ts=ts_ens, tolerance=1e-6)
+U_ens, F_ens, sf_ens, sig_m_ens, sig_f_ens = tl_ens.eval()
+
+plt.plot(U_ens[:, :, n_dof], F_ens[:, :, n_dof],
+         color='lightgray', alpha=0.5)
+U_avg = U_ens[:, :, n_dof].T
+F_avg = F_ens[:, :, n_dof].T
 plt.xlabel('displacement [mm]')
 plt.ylabel('pull-out force [N]')
 #
@@ -127,7 +132,7 @@ plt.plot(np.average(U_avg, axis=0), np.average(
 
 tl.ts.mats_eval.slip = x.tolist()
 tl.ts.mats_eval.bond = y.tolist()
-U_record, F_record, sf_record = tl.eval()
+U_record, F_record, sf_record, sig_m_record, sig_f_record = tl.eval()
 plt.plot(U_record[:, n_dof], F_record[:, n_dof],
          color='gray')
 
@@ -0,0 +1,568 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+from ibvpy.api import BCDof
+import numpy as np
+
+from .bond_law import PiecewiseLinearLaw
+from .eval_cache import _to_plain, get_config, cached_eval
+from .fe_nls_solver_ensemble import TStepperEnsemble, TLoopEnsemble
+from .fe_nls_solver_incre import TStepper, TLoop as TLoopIncre
+from .geo_kernel import GeoKernel
+from .nls_control import LineSearch, TLoopArcLength
+from .recorder import Recorder
+from .sweep import ResultStore, ParametricSweep, pullout
+from .tloop import TLoop
+
+
+def get_pullout(slip, bond, w_max=0.5, **tl_params):
+    '''Pull-out test of the incremental model.
+    '''
+    ts = TStepper(L_x=100., n_e_x=20)
+    ts.mats_eval.slip = slip
+    ts.mats_eval.bond = bond
+    n_dofs = ts.domain.n_dofs
+    ts.bc_list = [BCDof(var='u', dof=n_dofs - 2, value=0.0),
+                  BCDof(var='u', dof=n_dofs - 1, value=w_max)]
+    return TLoopIncre(ts=ts, **tl_params)
+
+
+def run_line(a, n=3):
+    '''Run of the parametric sweep recording its calls.
+    '''
+    if a < 0:
+        raise ValueError('negative slope')
+    run_line.calls.append((a, n))
+    return {'y': a * np.arange(n)}
+
+
+run_line.calls = []
+
+
+class TLoopCounted(TLoopIncre):
+    '''Time loop counting its evaluations.
+    '''
+
+    _n_evals = 0
+
+    def eval(self):
+        self._n_evals += 1
+        return super(TLoopCounted, self).eval()
+
+
+class TestPiecewiseLinearLaw(unittest.TestCase):
+    '''
+    Bond stress and stiffness of the tabulated bond-slip law.
+    '''
+
+    slip = [0., 0.1, 0.2, 0.3, 0.4, 0.5]
+    bond = [0., 10., 30., 35., 20., 10.]
+
+    def test_tau_G(self):
+        '''
+        The law equals the linear interpolation of the bond stress and
+        the zero-order interpolation of the slopes, constant outside.
+        '''
+        law = PiecewiseLinearLaw(slip=self.slip, bond=self.bond)
+        x = np.linspace(-0.6, 0.6, 97)
+        tau, G = law.get_tau_G(x)
+        x_abs = np.abs(x)
+        self.assertTrue(np.allclose(
+            tau, np.sign(x) * np.interp(x_abs, self.slip, self.bond)))
+        slopes = np.diff(self.bond) / np.diff(self.slip)
+        i_seg = np.clip(np.digitize(x_abs, self.slip) - 1, 0, 4)
+        G_ref = np.where(x_abs > self.slip[-1], 0., slopes[i_seg])
+        self.assertTrue(np.allclose(G, G_ref))
+
+    def test_not_symmetric(self):
+        law = PiecewiseLinearLaw(slip=self.slip, bond=self.bond,
+                                 symmetric=False)
+        tau, G = law.get_tau_G(np.array([-0.1, 0.15]))
+        self.assertTrue(np.allclose(tau, [0., 20.]))
+        self.assertAlmostEqual(G[1], 200.)
+
+    def test_dtau_dbond(self):
+        '''
+        The derivative with respect to the bond values equals
+        the difference quotient.
+        '''
+        law = PiecewiseLinearLaw(slip=self.slip, bond=self.bond)
+        x = np.linspace(-0.6, 0.6, 97)
+        tau = law.get_tau_G(x)[0]
+        for j in range(len(self.slip)):
+            bond = np.array(self.bond)
+            bond[j] += 1.
+            law_j = PiecewiseLinearLaw(slip=self.slip, bond=bond)
+            self.assertTrue(np.allclose(law.get_dtau_dbond(x, j),
+                                        law_j.get_tau_G(x)[0] - tau))
+
+    def test_append_set_bond(self):
+        '''
+        The law extended point by point beyond the initial capacity
+        and changed in place equals the law rebuilt from the points.
+        '''
+        rng = np.random.RandomState(0)
+        slip = np.cumsum(rng.rand(40))
+        bond = rng.rand(40) * 10.
+        law = PiecewiseLinearLaw(slip=slip[:2], bond=bond[:2])
+        x = np.linspace(-1., slip[-1] + 1., 500)
+        for n in range(2, 40):
+            law.append(slip[n], bond[n])
+            bond[n - 1] *= 2.
+            law.set_bond(n - 1, bond[n - 1])
+            law_n = PiecewiseLinearLaw(slip=slip[:n + 1], bond=bond[:n + 1])
+            self.assertTrue(np.array_equal(law.slip, law_n.slip))
+            self.assertTrue(np.array_equal(law.bond, law_n.bond))
+            for value, value_n in zip(law.get_tau_G(x), law_n.get_tau_G(x)):
+                self.assertTrue(np.allclose(value, value_n))
+        bond[0] = 1.
+        law.set_bond(0, 1.)
+        self.assertTrue(np.allclose(law.slopes, PiecewiseLinearLaw(
+            slip=slip, bond=bond).slopes))
+        # assignment rebuilds the buffers
+        law.bond = bond[::-1]
+        self.assertTrue(np.allclose(law.slopes, PiecewiseLinearLaw(
+            slip=slip, bond=bond[::-1]).slopes))
+
+
+class TestTLoopStepControl(unittest.TestCase):
+    '''
+    Step sizes proposed by the adaptive time loop.
+    '''
+
+    def test_step_growth(self):
+        tl = TLoop(d_t=0.2, adaptive=True)
+        self.assertAlmostEqual(tl.get_next_step(0.2, 1), 0.3)
+        # limited by t_max by default
+        self.assertAlmostEqual(tl.get_next_step(0.8, 1), 1.0)
+        tl.d_t_max = 0.25
+        self.assertAlmostEqual(tl.get_next_step(0.2, 1), 0.25)
+
+    def test_slow_convergence(self):
+        tl = TLoop(d_t=0.2, adaptive=True)
+        self.assertEqual(tl.get_next_step(0.2, tl.k_fast), 0.2)
+        tl.adaptive = False
+        self.assertEqual(tl.get_next_step(0.2, 1), 0.2)
+
+
+class TestTLoopCutback(unittest.TestCase):
+    '''
+    Cut-back of the load steps of the incremental time loop
+    at the softening of the bond law.
+    '''
+
+    slip = [0., 0.1, 0.2, 0.5]
+    bond = [0., 40., 60., 20.]
+
+    def test_rollback(self):
+        '''
+        The failed steps are repeated from the last converged state,
+        the recorded history follows the response of the fine steps.
+        '''
+        U_ref, F_ref = get_pullout(self.slip, self.bond, d_t=0.001).eval()[:2]
+
+        def matches_ref(U, F):
+            return np.allclose(F[:, -1], np.interp(
+                U[:, -1], U_ref[:, -1], F_ref[:, -1]), rtol=1e-6)
+        tl = get_pullout(self.slip, self.bond, d_t=0.25, k_max=3)
+        # continued from the failed state
+        self.assertFalse(matches_ref(*tl.eval()[:2]))
+        tl.adaptive = True
+        U, F = tl.eval()[:2]
+        # cut back and grown again
+        self.assertTrue(len(U) > 5)
+        self.assertAlmostEqual(U[-1, -1], 0.5)
+        self.assertTrue(np.all(np.diff(U[:, -1]) > 0))
+        self.assertTrue(matches_ref(U, F))
+
+
+class TestTLoopArcLength(unittest.TestCase):
+    '''
+    Arc-length continuation of the pull-out response with a sharp
+    peak of the bond law, the loaded end slip snaps back after the peak.
+    '''
+
+    slip = [0., 0.005, 0.05, 5.]
+    bond = [0., 150., 20., 20.]
+
+    def test_snap_back(self):
+        ts = get_pullout(self.slip, self.bond, w_max=1.).ts
+        tl = TLoopArcLength(ts=ts, t_max=0.3, stop_at_zero=False)
+        U, F, lam = tl.eval()
+        self.assertAlmostEqual(lam[-1], 0.3, delta=0.02)
+        # the load factor passes the limit point and decreases
+        i_lim = np.argmax(np.diff(lam) < 0)
+        self.assertTrue(i_lim > 0)
+        self.assertTrue(np.min(lam[i_lim:]) < 0.8 * lam[i_lim])
+        # the bond stress drops to the plateau along the embedded length
+        self.assertAlmostEqual(F[-1, -1], 20. * ts.L_x, places=3)
+        # the increments lie on the arcs
+        d_U = np.linalg.norm(np.diff(U, axis=0), axis=1)
+        self.assertTrue(np.allclose(d_U, tl.d_l_record[1:], rtol=1e-10))
+        # the ascending branch follows the displacement control, which
+        # jumps to the descending branch at the limit point
+        U_ref, F_ref = get_pullout(self.slip, self.bond, w_max=0.2,
+                                   d_t=0.01).eval()[:2]
+        self.assertTrue(np.allclose(
+            F[:i_lim, -1], np.interp(U[:i_lim, -1], U_ref[:, -1],
+                                     F_ref[:, -1]), rtol=1e-2))
+
+
+class TestTLoopSolver(unittest.TestCase):
+    '''
+    Iteration strategies of the incremental time loop.
+    '''
+
+    slip = [0., 0.1, 0.2, 0.3, 0.4, 0.5]
+    bond = [0., 40., 60., 70., 75., 78.]
+
+    def test_initial_stiffness(self):
+        '''
+        The first factorization is kept over all load steps
+        and the response equals the full Newton solution.
+        '''
+        tl_newton = get_pullout(self.slip, self.bond, d_t=0.1)
+        U, F = tl_newton.eval()[:2]
+        tl = get_pullout(self.slip, self.bond, d_t=0.1,
+                         solver='initial_stiffness', tolerance=1e-8)
+        U_i, F_i = tl.eval()[:2]
+        self.assertEqual(tl.ts.K.n_factorizations, 1)
+        self.assertTrue(np.allclose(U_i, U))
+        self.assertTrue(np.allclose(F_i, F, rtol=1e-4, atol=1e-3))
+        self.assertTrue(tl.reuse_factor(0, 1., 0.))
+        self.assertTrue(tl.reuse_factor(1, 0.1, 1.))
+        # slow convergence refactorizes
+        self.assertFalse(tl.reuse_factor(1, 0.9, 1.))
+
+    def test_initial_stiffness_stall(self):
+        '''
+        The iterations with the initial stiffness slow down at the
+        softening of the bond law and the stiffness is refactorized.
+        '''
+        slip, bond = [0., 0.1, 0.2, 0.5], [0., 40., 60., 20.]
+        U, F = get_pullout(slip, bond, d_t=0.05, tolerance=1e-8).eval()[:2]
+        tl = get_pullout(slip, bond, d_t=0.05, solver='initial_stiffness',
+                         tolerance=1e-8)
+        U_i, F_i = tl.eval()[:2]
+        self.assertTrue(tl.ts.K.n_factorizations > 1)
+        self.assertTrue(np.allclose(U_i, U))
+        self.assertTrue(np.allclose(F_i, F, rtol=1e-4, atol=1e-3))
+        tl.stall_ratio = 1e9
+        tl.eval()
+        self.assertEqual(tl.ts.K.n_factorizations, 1)
+
+    def test_modified_newton(self):
+        '''
+        The factorization is reused within the load step
+        and renewed if the convergence stalls.
+        '''
+        tl = TLoopIncre(solver='modified_newton')
+        self.assertFalse(tl.reuse_factor(0, 1., 0.))
+        self.assertTrue(tl.reuse_factor(1, 0.1, 1.))
+        self.assertFalse(tl.reuse_factor(1, 0.9, 1.))
+        tl.solver = 'newton'
+        self.assertFalse(tl.reuse_factor(1, 0.1, 1.))
+
+
+class TestTLoopEnsemble(unittest.TestCase):
+    '''
+    Pull-out tests of an ensemble of bond laws solved at once.
+    '''
+
+    def test_realizations(self):
+        '''
+        Each realization equals the pull-out test with its bond law.
+        '''
+        slip = np.array([0., 0.2, 0.4, 1.])
+        bond = np.array([0., 40., 60., 70.])
+        alpha = np.array([0.8, 1., 1.3])
+        ts = TStepperEnsemble(L_x=100., n_e_x=20)
+        ts.mats_eval.slip = alpha[:, None] * slip[None, :]
+        ts.mats_eval.bond = np.ones_like(alpha)[:, None] * bond[None, :]
+        n_dofs = ts.domain.n_dofs
+        ts.bc_list = [BCDof(var='u', dof=n_dofs - 2, value=0.0),
+                      BCDof(var='u', dof=n_dofs - 1, value=0.5)]
+        U, F = TLoopEnsemble(ts=ts, d_t=0.1).eval()[:2]
+        self.assertEqual(U.shape[1:], (3, n_dofs))
+        for b, alpha_b in enumerate(alpha):
+            U_b, F_b = get_pullout(list(alpha_b * slip), list(bond),
+                                   d_t=0.1).eval()[:2]
+            self.assertTrue(np.allclose(U[:, b], U_b))
+            self.assertTrue(np.allclose(F[:, b], F_b, rtol=1e-5, atol=1e-3))
+
+
+class TestGeoKernel(unittest.TestCase):
+    '''
+    Precomputed contractions against the einsums of the element
+    matrices, the internal forces and the strain increments.
+    '''
+
+    def setUp(self):
+        ts = TStepper(L_x=100., n_e_x=5)
+        self.B, self.J_det = ts.B, ts.J_det
+        self.w_ip, self.A = ts.fets_eval.ip_weights, ts.A
+        self.kernel = ts.geo_kernel
+        self.n_e, self.n_ip, self.n_dof_r, self.n_s, self.n_nodal_dofs = \
+            ts.B.shape
+        self.n_el_dofs = self.n_dof_r * self.n_nodal_dofs
+        self.rng = np.random.RandomState(0)
+
+    def get_D(self, n_b):
+        D = np.zeros((n_b, self.n_e, self.n_ip, self.n_s, self.n_s))
+        s = np.arange(self.n_s)
+        D[..., s, s] = self.rng.rand(n_b, self.n_e, self.n_ip, self.n_s)
+        return D
+
+    def check_single_batched(self, get, einsum_get, arr):
+        '''
+        The kernel method get equals einsum_get for a single array
+        and for each array of the batch arr.
+        '''
+        self.assertTrue(np.allclose(get(arr[0]), einsum_get(arr[0])))
+        batched = get(arr)
+        self.assertEqual(batched.shape[0], len(arr))
+        for arr_b, res_b in zip(arr, batched):
+            self.assertTrue(np.allclose(res_b, einsum_get(arr_b)))
+
+    def test_Ke(self):
+        def einsum_Ke(D):
+            Ke = np.einsum('i,s,einsd,eist,eimtf,ei->endmf', self.w_ip,
+                           self.A, self.B, D, self.B, self.J_det)
+            return Ke.reshape(self.n_e, self.n_el_dofs, self.n_el_dofs)
+        self.check_single_batched(self.kernel.get_Ke, einsum_Ke,
+                                  self.get_D(3))
+
+    def test_Fe_int(self):
+        def einsum_Fe_int(sig):
+            Fe_int = np.einsum('i,s,eis,einsd,ei->end', self.w_ip, self.A,
+                               sig, self.B, self.J_det)
+            return Fe_int.reshape(self.n_e, self.n_el_dofs)
+        sig = self.rng.rand(3, self.n_e, self.n_ip, self.n_s)
+        self.check_single_batched(self.kernel.get_Fe_int, einsum_Fe_int,
+                                  sig)
+
+    def test_d_eps(self):
+        def einsum_d_eps(d_u_e):
+            d_u_n = d_u_e.reshape(self.n_e, self.n_dof_r, self.n_nodal_dofs)
+            return np.einsum('einsd,end->eis', self.B, d_u_n)
+        d_u_e = self.rng.rand(3, self.n_e, self.n_el_dofs)
+        self.check_single_batched(self.kernel.get_d_eps, einsum_d_eps,
+                                  d_u_e)
+
+    def test_random_B(self):
+        '''
+        The kernel does not rely on the structure of the B matrix.
+        '''
+        self.B = self.rng.rand(*self.B.shape)
+        self.J_det = self.rng.rand(*self.J_det.shape)
+        self.kernel = GeoKernel(w_ip=self.w_ip, A=self.A, B=self.B,
+                                J_det=self.J_det)
+        self.test_Ke()
+        self.test_Fe_int()
+        self.test_d_eps()
+
+
+class TestRecorder(unittest.TestCase):
+    '''
+    Record buffers of the time loop history.
+    '''
+
+    def test_record(self):
+        '''
+        The history equals the stacked records beyond the initial
+        capacity, the fields not selected are not recorded.
+        '''
+        recorder = Recorder(n_records=2, selection={'U': None, 'F': [0, 3]})
+        recorder.setup(U=4, F=4, sf=2)
+        U_arr = np.arange(20.).reshape(5, 4)
+        for U in U_arr:
+            recorder.record(U=U, F=-U, sf=U[:2])
+        self.assertTrue(np.array_equal(recorder.get('U'), U_arr))
+        self.assertTrue(np.array_equal(recorder.get('F'), -U_arr[:, [0, 3]]))
+        self.assertIsNone(recorder.get('sf'))
+
+    def test_unknown_field(self):
+        recorder = Recorder(selection={'u': None})
+        self.assertRaises(KeyError, recorder.setup, U=4)
+
+    def test_record_fields(self):
+        '''
+        The selected records of the time loop equal the complete ones.
+        '''
+        slip, bond = [0., 0.1, 0.2, 0.3], [0., 40., 60., 70.]
+        U, F, sf = get_pullout(slip, bond, w_max=0.3, d_t=0.1).eval()[:3]
+        n_dof = U.shape[1] - 1
+        U_i, F_i, sf_i = get_pullout(
+            slip, bond, w_max=0.3, d_t=0.1,
+            record_fields={'U': [n_dof], 'F': [n_dof]}).eval()[:3]
+        self.assertTrue(np.array_equal(U_i, U[:, [n_dof]]))
+        self.assertTrue(np.array_equal(F_i, F[:, [n_dof]]))
+        self.assertIsNone(sf_i)
+
+
+class TestParametricSweep(unittest.TestCase):
+    '''
+    Result store and resumable runs of the parametric studies.
+    '''
+
+    def setUp(self):
+        self.path = tempfile.mkdtemp()
+        run_line.calls = []
+
+    def tearDown(self):
+        shutil.rmtree(self.path)
+
+    def test_store(self):
+        store = ResultStore(path=os.path.join(self.path, 'store'))
+        self.assertEqual(store.load(), ({}, {}))
+        key = store.get_key({'a': 1., 'slip': [0., 0.1]})
+        self.assertEqual(key, store.get_key({'slip': np.array([0., 0.1]),
+                                             'a': 1.}))
+        self.assertNotEqual(key, store.get_key({'a': 2., 'slip': [0., 0.1]}))
+        # integers are keyed as floats
+        self.assertEqual(store.get_key({'n': 50, 'slip': [0, 1]}),
+                         store.get_key({'n': 50., 'slip': [0., 1.]}))
+        store.write(key, {'a': 1., 'slip': [0., 0.1]}, {'y': [1., 2.]})
+        self.assertTrue(store.has(key))
+        params, results = store.read(key)
+        self.assertEqual(params['a'], 1.)
+        self.assertTrue(np.array_equal(results['y'], [1., 2.]))
+        store.write(store.get_key({'a': 2.}), {'a': 2., 'slip': [0.]},
+                    {'y': [3., 4.]})
+        # left behind by an interrupted write
+        open(os.path.join(store.path, 'x.tmp.npz'), 'w').close()
+        params, results = store.load()
+        self.assertEqual(sorted(params['a']), [1., 2.])
+        self.assertEqual(results['y'].shape, (2, 2))
+        self.assertEqual(params['slip'].dtype, object)
+
+    def test_resume(self):
+        '''
+        The runs of the grid are evaluated once, the failed ones
+        are not stored and repeated by the next run of the sweep.
+        The results are returned in the order of the grid.
+        '''
+        sweep = ParametricSweep(grid={'a': [-1., 1., 2.], 'n': [2, 3]},
+                                fixed={}, run_fn=run_line, n_workers=1,
+                                store=ResultStore(path=self.path))
+        self.assertEqual([(p['a'], p['n']) for p in sweep.runs],
+                         [(-1., 2), (-1., 3), (1., 2), (1., 3),
+                          (2., 2), (2., 3)])
+        results = sweep.run()
+        self.assertEqual(len(run_line.calls), 4)
+        self.assertEqual([r is None for r in results],
+                         [True, True, False, False, False, False])
+        for params, r in zip(sweep.runs[2:], results[2:]):
+            self.assertTrue(np.array_equal(
+                r['y'], params['a'] * np.arange(params['n'])))
+        sweep.grid = {'a': [3., -1., 1., 2.], 'n': [2, 3]}
+        results = sweep.run()
+        self.assertEqual(run_line.calls[4:], [(3., 2), (3., 3)])
+        self.assertTrue(np.array_equal(results[1]['y'], [0., 3., 6.]))
+        self.assertEqual([r is None for r in results],
+                         [False, False, True, True] + [False] * 4)
+        self.assertEqual(len(sweep.store.load()[0]['a']), 6)
+
+    def test_pullout(self):
+        '''
+        The run function of the pull-out test records the loaded end.
+        '''
+        slip, bond = [0., 0.1, 0.2, 0.3], [0., 40., 60., 70.]
+        results = pullout(u=0.3, slip=slip, bond=bond, L_x=100.,
+                          n_e_x=20, d_t=0.1)
+        U, F = get_pullout(slip, bond, w_max=0.3, d_t=0.1).eval()[:2]
+        self.assertTrue(np.array_equal(results['U'], U[:, -1]))
+        self.assertTrue(np.array_equal(results['F'], F[:, -1]))
+
+
+class TestEvalCache(unittest.TestCase):
+    '''
+    On-disk cache of the records of the time loop.
+    '''
+
+    slip = [0., 0.1, 0.2, 0.3]
+    bond = [0., 40., 60., 70.]
+
+    def setUp(self):
+        self.store = ResultStore(path=tempfile.mkdtemp(), compressed=True)
+
+    def tearDown(self):
+        shutil.rmtree(self.store.path)
+
+    def get_tloop(self, d_t=0.1, **tl_params):
+        tl = get_pullout(self.slip, self.bond, w_max=0.3)
+        return TLoopCounted(ts=tl.ts, d_t=d_t, **tl_params)
+
+    def test_to_plain(self):
+        self.assertEqual(_to_plain({'a': (np.float64(1.), np.arange(2)),
+                                    1: [None, True]}),
+                         {'a': [1., [0, 1]], '1': [None, True]})
+        self.assertRaises(TypeError, _to_plain, object())
+        self.assertRaises(TypeError, _to_plain, np.array([None]))
+
+    def test_config(self):
+        '''
+        The configuration follows the data of the model.
+        '''
+        config = get_config(self.get_tloop())
+        self.assertEqual(config, get_config(self.get_tloop()))
+        self.assertEqual(config['mats_eval']['bond'], self.bond)
+        tl = self.get_tloop()
+        tl.ts.mats_eval.bond[-1] = 80.
+        self.assertNotEqual(config, get_config(tl))
+        self.assertNotEqual(config, get_config(self.get_tloop(d_t=0.05)))
+        tl = self.get_tloop()
+        tl.ts.bc_list[-1].value = 0.2
+        self.assertNotEqual(config, get_config(tl))
+        config_ls = get_config(self.get_tloop(line_search=LineSearch()))
+        self.assertNotEqual(config, config_ls)
+        self.assertNotEqual(config_ls, get_config(
+            self.get_tloop(line_search=LineSearch(beta=0.8))))
+
+    def test_config_eval(self):
+        '''
+        The evaluation does not change the configuration.
+        '''
+        tl = self.get_tloop(line_search=LineSearch())
+        config = get_config(tl)
+        tl.eval()
+        self.assertEqual(config, get_config(tl))
+
+    def test_cached_eval(self):
+        '''
+        The records of an unchanged model are read from the store.
+        '''
+        tl = self.get_tloop()
+        records = cached_eval(tl, self.store)
+        self.assertEqual(tl._n_evals, 1)
+        tl_cached = self.get_tloop()
+        records_cached = cached_eval(tl_cached, self.store)
+        self.assertEqual(tl_cached._n_evals, 0)
+        self.assertEqual(len(records_cached), len(records))
+        for record, record_cached in zip(records, records_cached):
+            self.assertTrue(np.array_equal(record, record_cached))
+        tl.ts.mats_eval.bond[-1] = 80.
+        cached_eval(tl, self.store)
+        self.assertEqual(tl._n_evals, 2)
+
+    def test_cached_eval_record_fields(self):
+        '''
+        The fields not recorded are read from the store as None.
+        '''
+        n_dof = self.get_tloop().ts.domain.n_dofs - 1
+        record_fields = {'U': [n_dof], 'F': [n_dof]}
+        records = cached_eval(self.get_tloop(record_fields=record_fields),
+                              self.store)
+        tl_cached = self.get_tloop(record_fields=record_fields)
+        records_cached = cached_eval(tl_cached, self.store)
+        self.assertEqual(tl_cached._n_evals, 0)
+        self.assertEqual(len(records_cached), 5)
+        for record, record_cached in zip(records[:2], records_cached[:2]):
+            self.assertTrue(np.array_equal(record, record_cached))
+        self.assertEqual(records_cached[2:], (None, None, None))
+
+
+if __name__ == "__main__":
+    unittest.main()
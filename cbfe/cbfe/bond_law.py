@@ -0,0 +1,180 @@
+'''
+Tabulated piecewise linear bond-slip law shared by the material
+models of the pull-out solvers.
+
+@author: Yingxiong
+'''
+from traits.api import HasTraits, Array, Bool, Any, Property
+import numpy as np
+
+
+class PiecewiseLinearLaw(HasTraits):
+
+    '''Piecewise linear bond-slip law given by the points (slip, bond).
+
+    The slopes of the segments are computed once and cached until
+    slip or bond change, get_tau_G then evaluates the bond stress
+    and the tangential stiffness for all slips in a single searchsorted
+    pass. Outside of the tabulated range the stress is kept constant
+    and the stiffness is zero, as with np.interp and the zero-order
+    interp1d used before.
+
+    The points are held in buffers with spare capacity. append and
+    set_bond extend the law and change a bond value in O(1) by updating
+    the adjacent slopes only, the capacity is doubled when exceeded.
+    '''
+
+    slip = Array(float)
+    '''Slip values of the breakpoints in ascending order [n_pts].
+    '''
+
+    bond = Array(float)
+    '''Bond stress values of the breakpoints [n_pts].
+    '''
+
+    symmetric = Bool(True)
+    '''Antisymmetric extension to negative slips, i.e. tau(-s) = -tau(s).
+    Otherwise the bond stress of negative slips is bond[0].
+    '''
+
+    slopes = Property
+    '''Slopes of the segments, the last one repeated [n_pts].
+    '''
+
+    def _get_slopes(self):
+        self._sync()
+        return self._slopes[:len(self.slip)]
+
+    _slopes = Any
+    '''Buffer of the slopes, None if the buffers are outdated.
+    '''
+
+    def _slip_changed(self):
+        self._slopes = None
+
+    def _bond_changed(self):
+        self._slopes = None
+
+    def _sync(self):
+        # rebuild the buffers after an assignment of slip or bond
+        if self._slopes is not None:
+            return
+        n = len(self.slip)
+        capacity = max(2 * n, 16)
+        slip, bond, slopes = np.zeros((3, capacity))
+        slip[:n], bond[:n] = self.slip, self.bond
+        slopes[:n - 1] = np.diff(bond[:n]) / np.diff(slip[:n])
+        slopes[n - 1] = slopes[n - 2]
+        self.trait_setq(slip=slip[:n], bond=bond[:n])
+        self._buffers = (slip, bond)
+        self._slopes = slopes
+
+    _buffers = Any
+    '''Buffers of the slip and bond values.
+    '''
+
+    def append(self, slip, bond):
+        '''Add the point (slip, bond) at the end of the law, slip must
+        be larger than the last slip of the law.
+        '''
+        self._sync()
+        n = len(self.slip)
+        if n == len(self._slopes):
+            self._buffers = tuple(np.append(buf, np.zeros_like(buf))
+                                  for buf in self._buffers)
+            self._slopes = np.append(self._slopes,
+                                     np.zeros_like(self._slopes))
+        slip_buf, bond_buf = self._buffers
+        slip_buf[n], bond_buf[n] = slip, bond
+        self._slopes[n - 1] = (bond - bond_buf[n - 1]) / \
+            (slip - slip_buf[n - 1])
+        self._slopes[n] = self._slopes[n - 1]
+        self.trait_setq(slip=slip_buf[:n + 1], bond=bond_buf[:n + 1])
+
+    def set_bond(self, i, bond):
+        '''Change the bond value of the point i.
+        '''
+        self._sync()
+        n = len(self.slip)
+        i = i % n
+        slip_buf, bond_buf = self._buffers
+        bond_buf[i] = bond
+        slopes = self._slopes
+        for j in (i - 1, i):
+            if 0 <= j < n - 1:
+                slopes[j] = (bond_buf[j + 1] - bond_buf[j]) / \
+                    (slip_buf[j + 1] - slip_buf[j])
+        slopes[n - 1] = slopes[n - 2]
+        self.trait_setq(bond=bond_buf[:n])
+
+    def _get_segment(self, x_abs):
+        # index of the segment and the slip clipped to the table
+        slip = self.slip
+        i_seg = np.searchsorted(slip, x_abs, side='right') - 1
+        np.clip(i_seg, 0, len(slip) - 2, out=i_seg)
+        return i_seg, np.clip(x_abs, slip[0], slip[-1])
+
+    def get_tau_G(self, x):
+        '''Return the bond stress and the tangential stiffness
+        for the slip array x.
+        '''
+        slopes = self.slopes
+        slip, bond = self.slip, self.bond
+        x_abs = np.abs(x)
+        i_seg, x_c = self._get_segment(x_abs)
+        d = slopes[i_seg]
+        tau = bond[i_seg] + d * (x_c - slip[i_seg])
+        G = np.where((x_abs < slip[0]) | (x_abs > slip[-1]), 0., d)
+        if self.symmetric:
+            tau *= np.sign(x)
+        else:
+            tau = np.where(x < 0, bond[0], tau)
+        return tau, G
+
+    def get_dtau_dbond(self, x, j):
+        '''Return the derivative of the bond stress with respect to
+        the bond value of the breakpoint j for the slip array x,
+        i.e. the hat function of the breakpoint.
+        '''
+        slip = self.slip
+        j = j % len(slip)
+        i_seg, x_c = self._get_segment(np.abs(x))
+        theta = (x_c - slip[i_seg]) / (slip[i_seg + 1] - slip[i_seg])
+        dtau = np.where(i_seg == j, 1. - theta, 0.) + \
+            np.where(i_seg + 1 == j, theta, 0.)
+        if self.symmetric:
+            dtau *= np.sign(x)
+        else:
+            dtau = np.where(x < 0, float(j == 0), dtau)
+        return dtau
+
+
+if __name__ == '__main__':
+
+    #=========================================================================
+    # micro-benchmark against the per-call interp1d of MATSEval.G
+    #=========================================================================
+    import timeit
+    from scipy.interpolate import interp1d
+
+    slip = [0, 0.1, 0.2, 0.3, 0.4, 0.5]
+    bond = [0., 10., 30., 35., 20., 10.]
+    x = np.random.uniform(-0.6, 0.6, (100, 2))
+
+    def interp1d_tau_G():
+        d = np.diff(bond) / np.diff(slip)
+        d = np.append(d, d[-1])
+        G = interp1d(np.array(slip), d, kind='zero', fill_value=(0, 0),
+                     bounds_error=False)
+        return np.sign(x) * np.interp(np.abs(x), slip, bond), G(np.abs(x))
+
+    law = PiecewiseLinearLaw(slip=slip, bond=bond)
+
+    assert np.allclose(interp1d_tau_G()[0], law.get_tau_G(x)[0])
+    assert np.allclose(interp1d_tau_G()[1], law.get_tau_G(x)[1])
+
+    n = 2000
+    t_interp1d = timeit.timeit(interp1d_tau_G, number=n) / n
+    t_law = timeit.timeit(lambda: law.get_tau_G(x), number=n) / n
+    print('interp1d %8.1f us, tabulated law %8.1f us, speedup %5.1f' %
+          (t_interp1d * 1e6, t_law * 1e6, t_interp1d / t_law))
@@ -0,0 +1,117 @@
+'''
+On-disk cache of the records returned by TLoop.eval.
+
+The records are stored in a compressed cbfe.sweep.ResultStore under
+the hash of the model configuration, i.e. of the classes and the
+listed parameters of the time loop, the line search, the time stepper,
+the material model, the element and the boundary conditions. A repeated
+run of an unchanged model is read from the store instead of being
+computed. The parameters are listed explicitly, the traits added to
+the models during the evaluation would change the hash otherwise.
+
+The hash does not cover the source code of the models and the
+parameters not listed below. The cache directory has to be cleared
+after changing the implementation of a solver.
+
+@author: Yingxiong
+'''
+import hashlib
+import json
+import os
+
+from traits.api import HasTraits
+import numpy as np
+
+from cbfe.sweep import ResultStore
+
+
+# parameters of the components of the time loop entering the hash
+_tloop_params = ('d_t', 't_max', 'k_max', 'tolerance', 'solver',
+                 'stall_ratio', 'record_fields')
+_line_search_params = ('beta', 'c', 'n_max')
+_ts_params = ('L_x', 'n_e_x')
+_mats_params = ('E_m', 'E_f', 'slip', 'bond')
+_fets_params = ('A_m', 'A_f', 'L_b')
+_bc_params = ('var', 'dof', 'value', 'link_dofs', 'link_coeffs')
+_time_function_params = ('xdata', 'ydata', 'extrapolate')
+
+
+def get_cache_dir():
+    '''Cache directory, the environment variable CBFE_CACHE_DIR
+    or ~/.cbfe_cache.
+    '''
+    return os.environ.get('CBFE_CACHE_DIR',
+                          os.path.join(os.path.expanduser('~'), '.cbfe_cache'))
+
+
+def _to_plain(value):
+    # data value converted to a JSON-serializable one, TypeError otherwise
+    if value is None or isinstance(
+            value, (bool, int, float, str, np.number, np.bool_)):
+        return np.asarray(value).tolist() if value is not None else None
+    if isinstance(value, np.ndarray) and value.dtype.kind in 'biuf':
+        return value.tolist()
+    if isinstance(value, (list, tuple)):
+        return [_to_plain(v) for v in value]
+    if isinstance(value, dict):
+        return {str(k): _to_plain(v) for k, v in value.items()}
+    raise TypeError('not a data value')
+
+
+def get_traits(obj, names):
+    '''Class of obj and the values of the traits names defined by obj.
+    '''
+    cls = type(obj)
+    config = {'class': cls.__module__ + '.' + cls.__qualname__}
+    for name in names:
+        if hasattr(obj, name):
+            config[name] = _to_plain(getattr(obj, name))
+    return config
+
+
+def get_config(tl):
+    '''Configuration of the time loop tl determining its records.
+    '''
+    ts = tl.ts
+    bc_list = []
+    for bc in ts.bc_list:
+        config = get_traits(bc, _bc_params)
+        if isinstance(bc.time_function, HasTraits):
+            config['time_function'] = get_traits(bc.time_function,
+                                                 _time_function_params)
+        bc_list.append(config)
+    line_search = getattr(tl, 'line_search', None)
+    return {'tloop': get_traits(tl, _tloop_params),
+            'line_search': None if line_search is None else
+            get_traits(line_search, _line_search_params),
+            'tstepper': get_traits(ts, _ts_params),
+            'mats_eval': get_traits(ts.mats_eval, _mats_params),
+            'fets_eval': get_traits(ts.fets_eval, _fets_params),
+            'bc_list': bc_list}
+
+
+def cached_eval(tl, store=None):
+    '''Return the records of tl.eval() from the store, the time loop
+    is evaluated and its records are stored if they are not found.
+    The default store is in the directory given by get_cache_dir.
+    The records returned as None, e.g. the fields not recorded,
+    are not stored and returned as None again.
+    '''
+    if store is None:
+        store = ResultStore(path=get_cache_dir(), compressed=True)
+    config = json.dumps(get_config(tl), sort_keys=True)
+    key = hashlib.sha1(config.encode()).hexdigest()
+    if store.has(key):
+        params, results = store.read(key)
+        records = tuple(results.get(str(i))
+                        for i in range(int(params['n_records'])))
+        return records if params['is_tuple'] else records[0]
+
+    records = tl.eval()
+    is_tuple = isinstance(records, tuple)
+    records_list = records if is_tuple else (records,)
+    store.write(key, {'is_tuple': is_tuple, 'n_records': len(records_list),
+                      'config': config},
+                {str(i): record for i, record in enumerate(records_list)
+                 if record is not None})
+    return records
@@ -0,0 +1,299 @@
+'''
+Ensemble of pull-out problems with randomly varying bond laws.
+
+The realizations share the discretization and the boundary conditions
+and differ only in the bond-slip law. They are stacked along a leading
+batch axis and advanced together, i.e. the strains and stresses are
+shaped [n_batch, n_e, n_ip, n_s]. The element matrices of all
+realizations are assembled into one block-diagonal system solved
+in a single step of the sparse solver.
+
+@author: Yingxiong
+'''
+from ibvpy.api import BCDof
+from mathkit.matrix_la.sys_mtx_assembly import SysMtxAssembly
+from traits.api import Array, HasTraits, Instance, \
+    Property, cached_property, Constant, Float
+
+from cbfe.fe_nls_solver_incre import TStepper, TLoop
+import matplotlib.pyplot as plt
+import numpy as np
+
+
+class MATSEvalEnsemble(HasTraits):
+
+    '''Piecewise linear bond-slip laws of the ensemble.
+
+    Each row of slip and bond specifies the bond law of one realization.
+    All realizations must have the same number of points.
+    '''
+
+    E_m = Float(28484., tooltip='Stiffness of the matrix',
+                auto_set=False, enter_set=False)
+
+    E_f = Float(170000., tooltip='Stiffness of the fiber',
+                auto_set=False, enter_set=False)
+
+    slip = Array(float)
+    '''Slip values [n_batch, n_pts].
+    '''
+
+    bond = Array(float)
+    '''Bond stress values [n_batch, n_pts].
+    '''
+
+    n_batch = Property(depends_on='slip')
+    '''Number of realizations.
+    '''
+    @cached_property
+    def _get_n_batch(self):
+        return self.slip.shape[0]
+
+    slopes = Property(depends_on='slip, bond')
+    '''Slopes of the segments, the last one repeated [n_batch, n_pts].
+    '''
+    @cached_property
+    def _get_slopes(self):
+        d = np.diff(self.bond, axis=1) / np.diff(self.slip, axis=1)
+        return np.hstack((d, d[:, -1:]))
+
+    def get_segment(self, x):
+        '''Return the index of the segment containing |x|
+        for each realization, x is shaped [n_batch, ...].
+        '''
+        slip = self.slip.reshape(
+            (self.n_batch,) + (1,) * (x.ndim - 1) + (-1,))
+        i_seg = np.sum(np.abs(x)[..., None] >= slip, axis=-1) - 1
+        return np.clip(i_seg, 0, self.slip.shape[1] - 2)
+
+    def _take(self, arr, i_seg):
+        # pick the values of the segment start for each realization
+        arr_b = arr.reshape((self.n_batch, -1))
+        return np.take_along_axis(
+            arr_b, i_seg.reshape(self.n_batch, -1), axis=1
+        ).reshape(i_seg.shape)
+
+    def b_s_law(self, x):
+        i_seg = self.get_segment(x)
+        x_abs = np.abs(x)
+        s_0 = self._take(self.slip, i_seg)
+        b_0 = self._take(self.bond, i_seg)
+        d = self._take(self.slopes, i_seg)
+        s_max = self.slip[:, -1].reshape((-1,) + (1,) * (x.ndim - 1))
+        b_max = self.bond[:, -1].reshape((-1,) + (1,) * (x.ndim - 1))
+        b = np.where(x_abs < s_max, b_0 + d * (x_abs - s_0), b_max)
+        s_min = self.slip[:, 0].reshape((-1,) + (1,) * (x.ndim - 1))
+        b = np.where(x_abs < s_min, self.bond[:, :1].reshape(s_min.shape), b)
+        return np.sign(x) * b
+
+    def G(self, x):
+        i_seg = self.get_segment(x)
+        x_abs = np.abs(x)
+        s_min = self.slip[:, 0].reshape((-1,) + (1,) * (x.ndim - 1))
+        s_max = self.slip[:, -1].reshape((-1,) + (1,) * (x.ndim - 1))
+        inside = (x_abs >= s_min) & (x_abs <= s_max)
+        return np.where(inside, self._take(self.slopes, i_seg), 0.)
+
+    def get_corr_pred(self, eps, d_eps, sig, t_n, t_n1):
+        n_b, n_e, n_ip, n_s = eps.shape
+        D = np.zeros((n_b, n_e, n_ip, 3, 3))
+        D[..., 0, 0] = self.E_m
+        D[..., 2, 2] = self.E_f
+        D[..., 1, 1] = self.G(eps[..., 1])
+
+        d_sig = np.einsum('...st,...t->...s', D, d_eps)
+        sig += d_sig
+        sig[..., 1] = self.b_s_law(eps[..., 1])
+
+        return sig, D
+
+    n_s = Constant(3)
+
+
+class TStepperEnsemble(TStepper):
+
+    '''Time stepper advancing all realizations of the ensemble at once.
+
+    The dofs of the realization b are numbered b * n_dofs + dof,
+    the boundary conditions in bc_list refer to a single realization
+    and are repeated for each of them.
+    '''
+
+    mats_eval = Instance(MATSEvalEnsemble, arg=(), kw={})
+
+    n_batch = Property
+    '''Number of realizations.
+    '''
+
+    def _get_n_batch(self):
+        return self.mats_eval.n_batch
+
+    batch_dof_map = Property(depends_on='n_e_x, L_x, mats_eval.slip')
+    '''Element dof maps of all realizations [n_batch * n_e, n_el_dofs].
+    '''
+    @cached_property
+    def _get_batch_dof_map(self):
+        elem_dof_map = self.domain.elem_dof_map
+        n_dofs = self.domain.n_dofs
+        offsets = np.arange(self.n_batch) * n_dofs
+        return (offsets[:, None, None] +
+                elem_dof_map[None, :, :]).reshape(-1, elem_dof_map.shape[1])
+
+    def apply_essential_bc(self):
+        '''Register the boundary conditions of all realizations.
+        '''
+        self.K = SysMtxAssembly(matrix_type='csr')
+        n_dofs = self.domain.n_dofs
+        self.batch_bc_list = []
+        for b in range(self.n_batch):
+            for bc in self.bc_list:
+                bc_b = bc.clone_traits()
+                bc_b.dof = b * n_dofs + bc.dof
+                bc_b.link_dofs = [b * n_dofs + dof for dof in bc.link_dofs]
+                bc_b.apply_essential(self.K)
+                self.batch_bc_list.append(bc_b)
+
+    def apply_bc(self, step_flag, K_mtx, F_ext, t_n, t_n1):
+        '''Apply boundary conditions for the current load increement
+        '''
+        for bc in self.batch_bc_list:
+            bc.apply(step_flag, None, K_mtx, F_ext, t_n, t_n1)
+
+    def get_corr_pred(self, step_flag, d_U, eps, sig, t_n, t_n1):
+        '''Function calculationg the residuum and tangent operator
+        of all realizations, d_U is shaped [n_batch, n_dofs].
+        '''
+        mats_eval = self.mats_eval
+        domain = self.domain
+        n_b = self.n_batch
+        n_el_dofs = self.geo_kernel.B_mtx.shape[-1]
+
+        #[n_b, n_e, n_el_dofs]
+        d_u_e = d_U[:, domain.elem_dof_map]
+        #[n_b, n_e, n_ip, n_s]
+        d_eps = self.geo_kernel.get_d_eps(d_u_e)
+
+        # update strain
+        eps += d_eps
+
+        # material response state variables at integration point
+        sig, D = mats_eval.get_corr_pred(eps, d_eps, sig, t_n, t_n1)
+
+        # block-diagonal system matrix
+        # [n_b, n_e, n_el_dofs, n_el_dofs]
+        self.K.reset_mtx()
+        Ke = self.geo_kernel.get_Ke(D)
+
+        self.K.add_mtx_array(
+            Ke.reshape(-1, n_el_dofs, n_el_dofs), self.batch_dof_map)
+
+        # internal forces
+        # [n_b, n_e, n_el_dofs]
+        Fe_int = self.geo_kernel.get_Fe_int(sig)
+        F_int = -np.bincount(self.batch_dof_map.flatten(),
+                             weights=Fe_int.flatten(),
+                             minlength=n_b * domain.n_dofs)
+        self.apply_bc(step_flag, self.K, F_int, t_n, t_n1)
+        return F_int, self.K, eps, sig
+
+
+class TLoopEnsemble(TLoop):
+
+    '''Time loop of the ensemble.
+
+    A load step is accepted once the residuum of every realization
+    is below the tolerance. The records carry the batch axis
+    after the time axis, e.g. U_record is shaped [n_t, n_batch, n_dofs].
+    '''
+
+    ts = Instance(TStepperEnsemble)
+
+    def eval(self):
+
+        self.ts.apply_essential_bc()
+
+        t_n = 0.
+        t_n1 = t_n
+        n_b = self.ts.n_batch
+        n_dofs = self.ts.domain.n_dofs
+        n_e = self.ts.domain.n_active_elems
+        n_ip = self.ts.fets_eval.n_gp
+        n_s = self.ts.mats_eval.n_s
+        U_record = [np.zeros((n_b, n_dofs))]
+        F_record = [np.zeros((n_b, n_dofs))]
+        U_k = np.zeros((n_b, n_dofs))
+        eps = np.zeros((n_b, n_e, n_ip, n_s))
+        sig = np.zeros((n_b, n_e, n_ip, n_s))
+
+        sf_record = [np.zeros((n_b, 2 * n_e))]  # shear flow
+
+        sig_f_record = [np.zeros((n_b, 2 * n_e))]
+        sig_m_record = [np.zeros((n_b, 2 * n_e))]
+
+        while t_n1 <= self.t_max:
+            t_n1 = t_n + self.d_t
+            k = 0
+            step_flag = 'predictor'
+            d_U = np.zeros((n_b, n_dofs))
+            d_U_k = np.zeros((n_b, n_dofs))
+            norm_R_prev = 0.
+            while k < self.k_max:
+                R, K, eps, sig = self.ts.get_corr_pred(
+                    step_flag, d_U_k, eps, sig, t_n, t_n1)
+
+                F_ext = -R
+                K.apply_constraints(R)
+                norm_R_b = np.linalg.norm(R.reshape(n_b, n_dofs), axis=1)
+                norm_R = np.max(norm_R_b)
+                d_U_k = K.solve(
+                    reuse_factor=self.reuse_factor(k, norm_R, norm_R_prev))
+                d_U_k = d_U_k.reshape(n_b, n_dofs)
+                norm_R_prev = norm_R
+                d_U += d_U_k
+                if norm_R < self.tolerance:
+                    F_record.append(F_ext.reshape(n_b, n_dofs))
+                    U_k += d_U
+                    U_record.append(U_k.copy())
+                    sf_record.append(sig[..., 1].reshape(n_b, -1))
+                    sig_m_record.append(sig[..., 0].reshape(n_b, -1))
+                    sig_f_record.append(sig[..., 2].reshape(n_b, -1))
+                    break
+                k += 1
+                if k == self.k_max:
+                    print('nonconvergence of realizations',
+                          np.where(norm_R_b >= self.tolerance)[0])
+                step_flag = 'corrector'
+
+            t_n = t_n1
+        return (np.array(U_record), np.array(F_record), np.array(sf_record),
+                np.array(sig_m_record), np.array(sig_f_record))
+
+
+if __name__ == '__main__':
+
+    n_batch = 50
+    slip = np.array([0, 1, 3, 8], dtype=float)
+    bond = np.array([0, 50, 70, 5], dtype=float)
+    alpha = np.random.normal(loc=1.0, scale=0.1, size=n_batch)
+
+    ts = TStepperEnsemble(L_x=400.)
+    ts.mats_eval.E_m = 1e7
+    ts.mats_eval.slip = alpha[:, None] * slip[None, :]
+    ts.mats_eval.bond = np.ones_like(alpha)[:, None] * bond[None, :]
+
+    n_dofs = ts.domain.n_dofs
+    ts.bc_list = [BCDof(var='u', dof=n_dofs - 2, value=0.0),
+                  BCDof(var='u', dof=n_dofs - 1, value=5.0)]
+
+    tl = TLoopEnsemble(ts=ts)
+    U_record, F_record, sf_record, sig_m_record, sig_f_record = tl.eval()
+    n_dof = 2 * ts.domain.n_active_elems + 1
+    plt.plot(U_record[:, :, n_dof], F_record[:, :, n_dof],
+             color='lightgray')
+    plt.plot(U_record[:, :, n_dof].mean(axis=1),
+             F_record[:, :, n_dof].mean(axis=1), '--', lw=2,
+             label='average')
+    plt.xlabel('displacement [mm]')
+    plt.ylabel('pull-out force [N]')
+    plt.legend(loc='best')
+    plt.show()
@@ -5,18 +5,17 @@ Created on 12.01.2016
 '''
 import numpy as np
 from ibvpy.fets.fets_eval import FETSEval, IFETSEval
-from traits.api import implements, Int, Array, \
+from traits.api import provides, Int, Array, \
     Property, cached_property, Float
 
 
+@provides(IFETSEval)
 class FETS1D52ULRH(FETSEval):
 
     '''
     Fe Bar 2 nodes, deformation
     '''
 
-    implements(IFETSEval)
-
     debug_on = True
 
 #     A_m = Float(100 * 8 - 9 * 1.85, desc='matrix area [mm2]')
@@ -0,0 +1,141 @@
+'''
+Precomputed geometric part of the tangent operator and of the internal
+forces of the 1D pull-out elements.
+
+@author: Yingxiong
+'''
+from traits.api import HasTraits, Array, Property, cached_property
+import numpy as np
+
+
+class GeoKernel(HasTraits):
+
+    '''Contraction kernel for the element matrices and internal forces.
+
+    The element stiffness
+
+        Ke[e,l,m] = sum_{i,s,t} w[i] A[s] J_det[e,i] B[e,i,s,l] D[e,i,s,t] B[e,i,t,m]
+
+    is reduced for the diagonal material stiffness D of the pull-out
+    model (only D[0,0], D[1,1] and D[2,2] are non-zero) to
+
+        Ke[e,l,m] = sum_k D[e,k] BB[e,k,l,m],   k = (i,s),
+
+    where the geometric factor BB is constructed once per mesh.
+    The element dofs are flattened to l = n_nodal_dofs * n + d.
+    All methods accept additional leading axes of the material arrays,
+    e.g. the batch axis of an ensemble of realizations.
+    '''
+
+    w_ip = Array(float)
+    '''Integration weights [n_ip].
+    '''
+
+    A = Array(float)
+    '''Cross-sectional values of the matrix, the interface and the fiber [n_s].
+    '''
+
+    B = Array
+    '''The B matrix [n_e, n_ip, n_dof_r, n_s, n_nodal_dofs].
+    '''
+
+    J_det = Array(float)
+    '''Jacobi determinants [n_e, n_ip].
+    '''
+
+    B_mtx = Property(depends_on='B')
+    '''The B matrix with flattened element dofs [n_e, n_ip * n_s, n_el_dofs].
+    '''
+    @cached_property
+    def _get_B_mtx(self):
+        n_e, n_ip, n_dof_r, n_s, n_nodal_dofs = self.B.shape
+        return np.einsum('einsd->eisnd', self.B).reshape(
+            n_e, n_ip * n_s, n_dof_r * n_nodal_dofs).astype(float)
+
+    wB_mtx = Property(depends_on='w_ip, A, B, J_det')
+    '''The B matrix multiplied by the integration weights,
+    the cross-sectional values and the Jacobi determinants.
+    '''
+    @cached_property
+    def _get_wB_mtx(self):
+        n_e, n_ip, n_dof_r, n_s, n_nodal_dofs = self.B.shape
+        w = np.einsum('i,s,ei->eis', self.w_ip, self.A, self.J_det)
+        return w.reshape(n_e, -1, 1) * self.B_mtx
+
+    BB_mtx = Property(depends_on='w_ip, A, B, J_det')
+    '''Geometric factor of the element matrices
+    [n_e, n_ip * n_s, n_el_dofs * n_el_dofs].
+    '''
+    @cached_property
+    def _get_BB_mtx(self):
+        wB, B = self.wB_mtx, self.B_mtx
+        n_e, n_k, n_l = B.shape
+        return (wB[:, :, :, None] * B[:, :, None, :]).reshape(
+            n_e, n_k, n_l * n_l)
+
+    def get_d_eps(self, d_u_e):
+        '''Strain increments [..., n_e, n_ip, n_s] for the element
+        displacement increments [..., n_e, n_el_dofs].
+        '''
+        n_e, n_ip, n_dof_r, n_s, n_nodal_dofs = self.B.shape
+        d_eps = self.B_mtx @ d_u_e[..., None]
+        return d_eps.reshape(d_u_e.shape[:-1] + (n_ip, n_s))
+
+    def get_Ke(self, D):
+        '''Element matrices [..., n_e, n_el_dofs, n_el_dofs]
+        for the diagonal material stiffness D [..., n_e, n_ip, n_s, n_s].
+        '''
+        n_e, n_k, n_ll = self.BB_mtx.shape
+        n_l = self.B_mtx.shape[-1]
+        D_k = np.diagonal(D, axis1=-2, axis2=-1).reshape(
+            D.shape[:-4] + (n_e, 1, n_k))
+        Ke = D_k @ self.BB_mtx
+        return Ke.reshape(D.shape[:-4] + (n_e, n_l, n_l))
+
+    def get_Fe_int(self, sig):
+        '''Internal forces of the elements [..., n_e, n_el_dofs]
+        for the stresses sig [..., n_e, n_ip, n_s].
+        '''
+        n_e, n_k, n_l = self.wB_mtx.shape
+        sig_k = sig.reshape(sig.shape[:-3] + (n_e, 1, n_k))
+        Fe_int = sig_k @ self.wB_mtx
+        return Fe_int.reshape(sig.shape[:-3] + (n_e, n_l))
+
+
+if __name__ == '__main__':
+
+    #=========================================================================
+    # micro-benchmark against the einsum of TStepper.get_corr_pred,
+    # the results are compared in TestGeoKernel of cbfe.__test__
+    #=========================================================================
+    import timeit
+
+    n_ip, n_dof_r, n_s, n_nodal_dofs = 2, 2, 3, 2
+    for n_e in [20, 100, 1000]:
+        B = np.random.random((n_e, n_ip, n_dof_r, n_s, n_nodal_dofs))
+        J_det = np.random.random((n_e, n_ip))
+        w_ip = np.array([1., 1.])
+        A = np.array([1000., 10., 1.])
+        D = np.zeros((n_e, n_ip, n_s, n_s))
+        D[:, :, [0, 1, 2], [0, 1, 2]] = np.random.random((n_e, n_ip, n_s))
+        sig = np.random.random((n_e, n_ip, n_s))
+
+        def einsum_Ke():
+            Ke = np.einsum('i,s,einsd,eist,eimtf,ei->endmf',
+                           w_ip, A, B, D, B, J_det)
+            Fe_int = np.einsum('i,s,eis,einsd,ei->end',
+                               w_ip, A, sig, B, J_det)
+            return Ke.reshape(n_e, 4, 4), Fe_int.reshape(n_e, 4)
+
+        kernel = GeoKernel(w_ip=w_ip, A=A, B=B, J_det=J_det)
+
+        def kernel_Ke():
+            return kernel.get_Ke(D), kernel.get_Fe_int(sig)
+
+        kernel_Ke()  # construct the geometric factor
+
+        n = 200
+        t_einsum = timeit.timeit(einsum_Ke, number=n) / n
+        t_kernel = timeit.timeit(kernel_Ke, number=n) / n
+        print('n_e = %5d: einsum %8.3f ms, kernel %8.3f ms, speedup %5.1f' %
+              (n_e, t_einsum * 1e3, t_kernel * 1e3, t_einsum / t_kernel))
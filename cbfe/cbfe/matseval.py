@@ -4,7 +4,7 @@ Created on 12.01.2016
 @author: Yingxiong
 '''
 
-from traits.api import implements, Int, Array, HasTraits, Instance, \
+from traits.api import Int, Array, HasTraits, Instance, \
     Property, cached_property, Constant, Float, List
 import numpy as np
 from scipy.misc import derivative
@@ -0,0 +1,269 @@
+'''
+Step controllers for the Newton iterations of the pull-out models
+with softening bond laws.
+
+The line search and the arc-length loop work on top of a time stepper
+providing
+
+    R, K, eps, sig = ts.get_corr_pred(step_flag, d_U, eps, sig, t_n, t_n1)
+
+and registering its essential boundary conditions in ts.K,
+i.e. the TStepper of fe_nls_solver_incre, fe_nls_solver_cb
+and fem_inverse.
+
+@author: Yingxiong
+'''
+from traits.api import HasTraits, Any, Int, Float, Bool, Array
+import numpy as np
+
+from cbfe.recorder import Recorder
+
+
+class LineSearch(HasTraits):
+
+    '''Backtracking line search along the Newton correction.
+
+    The correction is scaled by s = 1, beta, beta^2, ... until the norm
+    of the constrained residuum is sufficiently reduced
+
+        |R(s)| <= (1 - c * s) |R(0)|.
+
+    If none of the trials satisfies the condition, the full step
+    is accepted. Taking the best of the reduced trials instead stalls
+    the iterations at the kinks of the piecewise linear bond laws.
+    '''
+
+    beta = Float(0.5)
+    '''Reduction factor of the step length.
+    '''
+
+    c = Float(1e-4)
+    '''Required relative decrease of the residuum.
+    '''
+
+    n_max = Int(6)
+    '''Maximum number of reductions.
+    '''
+
+    def search(self, ts, d_U_k, eps, sig, norm_R0, t_n, t_n1):
+        '''Apply the scaled correction d_U_k to the state eps, sig.
+
+        The passed state is not modified. Return the step length and
+        the response at the accepted state, i.e. the tuple
+        (s, F_ext, R, K, eps, sig, norm_R), with R already constrained.
+        '''
+        s = 1.
+        for _ in range(self.n_max + 1):
+            trial = self._eval(ts, s, d_U_k, eps, sig, t_n, t_n1)
+            if trial[-1] <= (1. - self.c * s) * norm_R0:
+                return trial
+            s *= self.beta
+        # re-evaluate the full step to restore its tangent
+        return self._eval(ts, 1., d_U_k, eps, sig, t_n, t_n1)
+
+    def _eval(self, ts, s, d_U_k, eps, sig, t_n, t_n1):
+        # response for the step length s starting from a copy of the state
+        eps_s, sig_s = np.copy(eps), np.copy(sig)
+        R, K, eps_s, sig_s = ts.get_corr_pred(
+            'corrector', s * d_U_k, eps_s, sig_s, t_n, t_n1)
+        F_ext = -R
+        K.apply_constraints(R)
+        return s, F_ext, R, K, eps_s, sig_s, np.linalg.norm(R)
+
+
+class StepControl(HasTraits):
+
+    '''Adaptive size of the load steps of a time loop with the traits
+    d_t and t_max.
+
+    Starting with d_t, the step grows after a fast convergence and
+    is cut back after a failure. The time loop then resets the state
+    variables to the last converged step.
+    '''
+
+    adaptive = Bool(False)
+    '''Adapt the time step to the convergence of the iterations.
+    '''
+
+    d_t_min = Float(1e-6)
+    '''Smallest admissible step. If it fails, the calculation is stopped
+    and the history up to the last converged step is returned.
+    '''
+
+    d_t_max = Float(0.)
+    '''Largest admissible step, 0 - t_max.
+    '''
+
+    k_fast = Int(4)
+    '''Grow the step if the iterations converged in less than k_fast steps.
+    '''
+
+    step_growth = Float(1.5)
+    step_cutback = Float(0.5)
+
+    def get_next_step(self, d_t, k):
+        '''Return the step size following a step converged in k iterations.
+        '''
+        if self.adaptive and k < self.k_fast:
+            return min(d_t * self.step_growth, self.d_t_max or self.t_max)
+        return d_t
+
+
+class TLoopArcLength(HasTraits):
+
+    '''Arc-length continuation (Crisfield) of the pull-out response.
+
+    The values of the essential boundary conditions are scaled by the
+    load factor lambda, which is treated as an additional unknown.
+    The increments of the displacement vector are constrained to the
+    cylindrical arc |Delta U| = d_l, so that the load factor can
+    decrease and snap-back segments of softening bond laws can be
+    traced. The length of the arc is adapted to the number of the
+    iterations needed in the previous step.
+    '''
+
+    ts = Any
+    '''Time stepper object, see the module docstring.
+    '''
+
+    d_t = Float(0.01)
+    '''Load factor increment of the first step defining the initial arc.
+    '''
+
+    t_max = Float(1.0)
+    '''Maximum load factor.
+    '''
+
+    n_max = Int(500)
+    '''Maximum number of steps.
+    '''
+
+    k_max = Int(30)
+    '''Maximum number of iterations within a step.
+    '''
+
+    k_opt = Int(5)
+    '''Desired number of iterations used to adapt the arc length.
+    '''
+
+    d_l_min = Float(1e-4)
+    '''Smallest arc length relative to the initial one.
+    '''
+
+    d_l_max = Float(1.0)
+    '''Largest arc length relative to the initial one.
+    '''
+
+    tolerance = Float(1e-4)
+
+    stop_at_zero = Bool(True)
+    '''Stop the calculation if the load factor returns to zero.
+    '''
+
+    d_l_record = Array
+    '''Arc lengths of the recorded steps of the last evaluation,
+    zero for the initial state.
+    '''
+
+    def _solve(self, K, rhs, lam, reuse_factor=False):
+        '''Solve the linearized system with the boundary
+        values scaled by lam.
+        '''
+        for c in K.constraints:
+            c.u_a = lam * self._u_ref.get(c.a, 0.)
+        K.apply_constraints(rhs)
+        return K.solve(reuse_factor=reuse_factor)
+
+    _u_ref = Any
+
+    def eval(self):
+        '''Run the continuation.
+
+        Return the histories of the displacements, of the forces and
+        of the load factor.
+        '''
+        ts = self.ts
+        ts.apply_essential_bc()
+        self._u_ref = {bc.dof: bc.value for bc in ts.bc_list
+                       if bc.is_essential()}
+
+        n_dofs = ts.domain.n_dofs
+        n_e = ts.domain.n_active_elems
+        n_ip = ts.fets_eval.n_gp
+        n_s = ts.mats_eval.n_s
+        U = np.zeros(n_dofs)
+        lam = 0.
+        eps = np.zeros((n_e, n_ip, n_s))
+        sig = np.zeros((n_e, n_ip, n_s))
+
+        recorder = Recorder(n_records=self.n_max + 1,
+                            selection=dict.fromkeys(['U', 'F', 'lam', 'd_l']))
+        recorder.setup(U=n_dofs, F=n_dofs, lam=1, d_l=1)
+        recorder.record(U=U, F=np.zeros(n_dofs), lam=lam, d_l=0.)
+
+        d_l = d_l_0 = None
+        D_U_prev = None
+        zeros = np.zeros(n_dofs)
+        for _ in range(self.n_max):
+            eps_n, sig_n = np.copy(eps), np.copy(sig)
+
+            # predictor along the tangent
+            R, K, eps, sig = ts.get_corr_pred(
+                'corrector', zeros, eps, sig, 0., 0.)
+            d_U_II = self._solve(K, np.zeros(n_dofs), 1.)
+            if d_l is None:
+                d_l = d_l_0 = self.d_t * np.linalg.norm(d_U_II)
+            d_lam = d_l / np.linalg.norm(d_U_II)
+            if D_U_prev is not None and np.dot(d_U_II, D_U_prev) < 0:
+                d_lam = -d_lam
+            D_U = d_lam * d_U_II
+            D_lam = d_lam
+            d_U = D_U
+
+            converged = False
+            for k in range(self.k_max):
+                R, K, eps, sig = ts.get_corr_pred(
+                    'corrector', d_U, eps, sig, 0., 0.)
+                F_ext = -R
+                d_U_I = self._solve(K, R, 0.)
+                if np.linalg.norm(R) < self.tolerance:
+                    converged = True
+                    break
+                d_U_II = self._solve(K, np.zeros(n_dofs), 1.,
+                                     reuse_factor=True)
+                # arc-length constraint |D_U + d_U_I + d_lam d_U_II| = d_l
+                b = D_U + d_U_I
+                a_1 = np.dot(d_U_II, d_U_II)
+                a_2 = 2. * np.dot(d_U_II, b)
+                a_3 = np.dot(b, b) - d_l ** 2
+                disc = a_2 ** 2 - 4. * a_1 * a_3
+                if disc < 0:
+                    break
+                roots = (-a_2 + np.array([1., -1.]) * np.sqrt(disc)) / \
+                    (2. * a_1)
+                # choose the root closest to the direction of the step
+                cos = [np.dot(b + r * d_U_II, D_U) for r in roots]
+                d_lam = roots[np.argmax(cos)]
+                d_U = d_U_I + d_lam * d_U_II
+                D_U = D_U + d_U
+                D_lam += d_lam
+
+            if converged:
+                U += D_U
+                lam += D_lam
+                recorder.record(U=U, F=F_ext, lam=lam, d_l=d_l)
+                D_U_prev = D_U
+                d_l *= np.clip(np.sqrt(self.k_opt / max(k, 1.)), 0.5, 2.)
+                d_l = min(d_l, self.d_l_max * d_l_0)
+                if lam >= self.t_max or (self.stop_at_zero and lam <= 0):
+                    break
+            else:
+                # cut back the arc and restart from the converged state
+                eps, sig = eps_n, sig_n
+                d_l *= 0.5
+                if d_l < self.d_l_min * d_l_0:
+                    print('nonconvergence at lambda = %g' % lam)
+                    break
+
+        self.d_l_record = recorder.get('d_l')[:, 0]
+        return recorder.get('U'), recorder.get('F'), recorder.get('lam')[:, 0]
@@ -0,0 +1,74 @@
+'''
+Preallocated record buffers for the history of the time loop.
+
+@author: Yingxiong
+'''
+from traits.api import HasTraits, Int, Dict
+import numpy as np
+
+
+class Recorder(HasTraits):
+
+    '''Record the history of selected fields at the converged steps.
+
+    The buffers are allocated in advance for the expected number
+    of records and their capacity is doubled if it is exceeded,
+    so that recording n steps costs O(n) instead of the O(n^2)
+    of the repeated vstack.
+
+    The fields are flattened, the selection maps the name of a field
+    to the recorded indices of the flattened field. None stands for
+    the whole field. Fields missing in the selection are not recorded.
+    '''
+
+    n_records = Int(16)
+    '''Initial number of records the buffers are allocated for.
+    '''
+
+    selection = Dict
+    '''Recorded fields mapped to the selected indices.
+    '''
+
+    buffers = Dict
+    '''Buffers of the recorded fields [capacity, n_vals].
+    '''
+
+    n_recorded = Int(0)
+    '''Number of the records made so far.
+    '''
+
+    def setup(self, **field_sizes):
+        '''Allocate the buffers for the given sizes of the flattened fields.
+        '''
+        self.buffers = {}
+        self.n_recorded = 0
+        for name, idx in self.selection.items():
+            if name not in field_sizes:
+                raise KeyError('unknown field %s, available fields: %s' %
+                               (name, ', '.join(sorted(field_sizes))))
+            if idx is None:
+                n_vals = field_sizes[name]
+            else:
+                n_vals = len(np.atleast_1d(idx))
+            self.buffers[name] = np.zeros((max(self.n_records, 1), n_vals))
+
+    def record(self, **fields):
+        '''Append the current values of the fields.
+        '''
+        i = self.n_recorded
+        for name, buffer_ in self.buffers.items():
+            if i == buffer_.shape[0]:
+                buffer_ = np.vstack((buffer_, np.zeros_like(buffer_)))
+                self.buffers[name] = buffer_
+            idx = self.selection[name]
+            vals = np.ravel(fields[name])
+            buffer_[i] = vals if idx is None else vals[idx]
+        self.n_recorded = i + 1
+
+    def get(self, name):
+        '''Return the recorded history of the field or None if it is
+        not recorded.
+        '''
+        if name not in self.buffers:
+            return None
+        return self.buffers[name][:self.n_recorded]
@@ -0,0 +1,276 @@
+'''
+Parametric studies of the pull-out response run in a pool of processes.
+
+Each run of the parameter grid is written to the result store as soon
+as it is finished. The runs found in the store are skipped, so that
+an interrupted sweep is resumed by starting it once more. The results
+are returned in the order of the grid, with None for the failed runs.
+
+@author: Yingxiong
+'''
+from concurrent.futures import ProcessPoolExecutor, as_completed
+import hashlib
+import itertools
+import os
+import time
+
+from traits.api import HasTraits, Str, Dict, Int, Any, Instance, Bool, \
+    Property, cached_property
+import numpy as np
+
+
+class ResultStore(HasTraits):
+
+    '''Directory with one npz file per run named by the hash of its
+    parameters. The files are written atomically, an interrupted run
+    leaves no file behind.
+    '''
+
+    path = Str
+    '''Directory of the store, created if it does not exist.
+    '''
+
+    compressed = Bool(False)
+    '''Write compressed npz files.
+    '''
+
+    def get_key(self, params):
+        '''Content hash of the parameters of a run. Integer values are
+        hashed as floats, e.g. 50 and 50.0 give the same key.
+        '''
+        items = []
+        for name, value in sorted(params.items()):
+            value = np.asarray(value)
+            if value.dtype.kind in 'iu':
+                value = value.astype(float)
+            items.append((name, value.tolist()))
+        return hashlib.sha1(repr(items).encode()).hexdigest()
+
+    def get_fname(self, key):
+        return os.path.join(self.path, key + '.npz')
+
+    def has(self, key):
+        return os.path.exists(self.get_fname(key))
+
+    def write(self, key, params, results):
+        '''Store the parameters and the results of the run,
+        results maps names to arrays.
+        '''
+        if not os.path.exists(self.path):
+            os.makedirs(self.path)
+        arrays = {'p_' + name: np.asarray(value)
+                  for name, value in params.items()}
+        arrays.update({'r_' + name: np.asarray(value)
+                       for name, value in results.items()})
+        fname = self.get_fname(key)
+        tmp_fname = fname[:-4] + '.tmp.npz'
+        savez = np.savez_compressed if self.compressed else np.savez
+        savez(tmp_fname, **arrays)
+        os.replace(tmp_fname, fname)
+
+    def read(self, key):
+        '''Return the parameters and the results of the stored run.
+        '''
+        with np.load(self.get_fname(key)) as data:
+            params = {name[2:]: data[name] for name in data.files
+                      if name.startswith('p_')}
+            results = {name[2:]: data[name] for name in data.files
+                       if name.startswith('r_')}
+        return params, results
+
+    def load(self):
+        '''Return the stored runs as columns, i.e. the tuple of
+        dictionaries (params, results) mapping the names to the values
+        of all runs ordered by their keys. Values with equal shapes are
+        stacked into one array with the runs along the first axis,
+        otherwise an object array is returned.
+        '''
+        if not os.path.exists(self.path):
+            return {}, {}
+        fnames = sorted(fname for fname in os.listdir(self.path)
+                        if fname.endswith('.npz') and
+                        not fname.endswith('.tmp.npz'))
+        columns = {}
+        for fname in fnames:
+            with np.load(os.path.join(self.path, fname)) as data:
+                for name in data.files:
+                    columns.setdefault(name, []).append(data[name])
+        for name, values in columns.items():
+            if len(set(value.shape for value in values)) == 1:
+                columns[name] = np.array(values)
+            else:
+                column = np.empty(len(values), dtype=object)
+                column[:] = values
+                columns[name] = column
+        params = {name[2:]: column for name, column in columns.items()
+                  if name.startswith('p_')}
+        results = {name[2:]: column for name, column in columns.items()
+                   if name.startswith('r_')}
+        return params, results
+
+
+# model of the worker process reused by the runs of a sweep
+_model = None
+
+_ts_params = ('L_x', 'n_e_x')
+_mats_params = ('E_m', 'E_f', 'slip', 'bond')
+_fets_params = ('A_m', 'A_f', 'L_b')
+_tl_params = ('d_t', 't_max', 'k_max', 'tolerance', 'solver')
+
+
+def pullout(u=1.0, **params):
+    '''Pull-out response of fe_nls_solver_incre for the loaded end
+    displacement u.
+
+    The parameters are traits of the time stepper (L_x, n_e_x), of the
+    material model (E_m, E_f, slip, bond), of the element (A_m, A_f,
+    L_b) and of the time loop (d_t, t_max, k_max, tolerance, solver).
+    The model is constructed once per process and reused by the
+    following runs, the cached discretization is only rebuilt if
+    L_x or n_e_x change. Return the histories of the displacement
+    and of the force at the loaded end and the number of the load
+    steps which did not converge (n_failed).
+    '''
+    from ibvpy.api import BCDof
+    from cbfe.fe_nls_solver_incre import TStepper, TLoop
+
+    global _model
+    names = frozenset(params)
+    if _model is None or _model[0] != names:
+        ts = TStepper()
+        _model = (names, ts, TLoop(ts=ts))
+    _, ts, tl = _model
+
+    for name, value in params.items():
+        if name in _ts_params:
+            setattr(ts, name, value)
+        elif name in _mats_params:
+            setattr(ts.mats_eval, name, list(value)
+                    if name in ('slip', 'bond') else value)
+        elif name in _fets_params:
+            setattr(ts.fets_eval, name, value)
+        elif name in _tl_params:
+            setattr(tl, name, value)
+        else:
+            raise KeyError('unknown parameter %s' % name)
+
+    n_dofs = ts.domain.n_dofs
+    ts.bc_list = [BCDof(var='u', dof=n_dofs - 2, value=0.0),
+                  BCDof(var='u', dof=n_dofs - 1, value=u)]
+    tl.record_fields = {'U': [n_dofs - 1], 'F': [n_dofs - 1]}
+    U_record, F_record = tl.eval()[:2]
+    return {'U': U_record[:, 0], 'F': F_record[:, 0],
+            'n_failed': tl.n_failed}
+
+
+def _run(run_fn, params):
+    # executed in the worker process
+    return run_fn(**params)
+
+
+class ParametricSweep(HasTraits):
+
+    '''Cartesian product of the parameter values evaluated by run_fn.
+
+    The keys of the grid are parameter names or tuples of names varied
+    together, e.g. {'L_x': [100., 200.], ('slip', 'bond'): [(s_1, b_1),
+    (s_2, b_2)]} gives four runs. The first key varies slowest, the
+    parameters changing the discretization should therefore come first.
+    '''
+
+    grid = Dict
+    '''Parameter names mapped to the lists of the values.
+    '''
+
+    fixed = Dict
+    '''Parameters shared by all runs.
+    '''
+
+    run_fn = Any(pullout)
+    '''Function evaluating one run, it is called with the parameters as
+    keyword arguments and returns a dictionary of arrays. Must be
+    defined at the module level to be sent to the worker processes.
+    '''
+
+    store = Instance(ResultStore)
+
+    n_workers = Int(0)
+    '''Number of the worker processes, 0 uses all processors and 1 runs
+    the sweep in the current process.
+    '''
+
+    runs = Property(depends_on='grid, fixed')
+    '''Parameters of all runs.
+    '''
+    @cached_property
+    def _get_runs(self):
+        keys = list(self.grid.keys())
+        runs = []
+        for values in itertools.product(*[self.grid[key] for key in keys]):
+            params = dict(self.fixed)
+            for key, value in zip(keys, values):
+                if isinstance(key, tuple):
+                    params.update(zip(key, value))
+                else:
+                    params[key] = value
+            runs.append(params)
+        return runs
+
+    def run(self):
+        '''Evaluate the runs missing in the store and return the list
+        of the results in the order of runs, the results of a failed
+        run are None. The progress is reported after each finished run.
+        '''
+        store = self.store
+        keys = [store.get_key(params) for params in self.runs]
+        todo = [(key, params) for key, params in zip(keys, self.runs)
+                if not store.has(key)]
+        n_runs = len(self.runs)
+        n_done = n_runs - len(todo)
+        print('%d of %d runs done, %d to go' % (n_done, n_runs, len(todo)))
+        t_start = time.time()
+
+        def finish(key, params, get_results):
+            nonlocal n_done
+            try:
+                store.write(key, params, get_results())
+            except Exception as e:
+                print('run %s failed: %s' % (params, e))
+            n_done += 1
+            print('%d of %d runs done (%.1f s)' %
+                  (n_done, n_runs, time.time() - t_start))
+
+        n_workers = self.n_workers or os.cpu_count()
+        if n_workers == 1:
+            for key, params in todo:
+                finish(key, params, lambda: self.run_fn(**params))
+        else:
+            with ProcessPoolExecutor(max_workers=n_workers) as executor:
+                futures = {executor.submit(_run, self.run_fn, params):
+                           (key, params) for key, params in todo}
+                for future in as_completed(futures):
+                    key, params = futures[future]
+                    finish(key, params, future.result)
+        return [store.read(key)[1] if store.has(key) else None
+                for key in keys]
+
+
+if __name__ == '__main__':
+
+    import matplotlib.pyplot as plt
+
+    sweep = ParametricSweep(
+        grid={'L_x': [100., 200., 400.],
+              ('slip', 'bond'): [([0., 0.1, 0.5], [0., 40., 40.]),
+                                 ([0., 0.1, 0.2, 0.5], [0., 40., 20., 10.])]},
+        fixed={'n_e_x': 50, 'u': 0.5},
+        store=ResultStore(path='sweep_pullout'))
+    for params, results in zip(sweep.runs, sweep.run()):
+        if results is None:
+            continue
+        plt.plot(results['U'], results['F'],
+                 label='L_x = %g' % params['L_x'])
+    plt.xlabel('displacement [mm]')
+    plt.ylabel('pull-out force [N]')
+    plt.legend(loc='best')
+    plt.show()
@@ -4,12 +4,13 @@ Created on 12.01.2016
 @author: Yingxiong
 '''
 import numpy as np
-from traits.api import implements, Int, Array, HasTraits, Instance, \
-    Property, cached_property, Constant, Float, List
+from traits.api import Int, Array, HasTraits, Instance, \
+    Property, cached_property, Constant, Float, List, Bool
+from .nls_control import StepControl
 from .tstepper import TStepper
 
 
-class TLoop(HasTraits):
+class TLoop(StepControl):
 
     ts = Instance(TStepper)
     d_t = Float(0.01)
@@ -22,7 +23,7 @@ class TLoop(HasTraits):
         self.ts.apply_essential_bc()
 
         t_n = 0.
-        t_n1 = t_n
+        d_t = self.d_t
         n_dofs = self.ts.domain.n_dofs
         n_e = self.ts.domain.n_active_elems
         n_ip = self.ts.fets_eval.n_gp
@@ -41,52 +42,55 @@ class TLoop(HasTraits):
         eps_record = [np.zeros_like(eps)]
         sig_record = [np.zeros_like(sig)]
 
-        while t_n1 <= self.t_max - self.d_t:
+        while self.t_max - t_n > 1e-8 * self.d_t:
             print('==================')
-            t_n1 = t_n + self.d_t
+            t_n1 = min(t_n + d_t, self.t_max)
             k = 0
-            scale = 1.0
             step_flag = 'predictor'
             d_U = np.zeros(n_dofs)
             d_U_k = np.zeros(n_dofs)
+            # state of the last converged step - the material
+            # model updates the state variables in place
+            state_n = [np.copy(v) for v in (eps, sig, alpha, q, kappa)]
+            converged = False
             while k <= self.k_max:
                 print(k)
-                # if k == self.k_max:  # handling non-convergence
-                #                     scale *= 0.5
-                # print scale
-                #                     t_n1 = t_n + scale * self.d_t
-                #                     k = 0
-                #                     d_U = np.zeros(n_dofs)
-                #                     d_U_k = np.zeros(n_dofs)
-                #                     step_flag = 'predictor'
-                #                     eps = eps_r
-                #                     sig = sig_r
-                #                     alpha = alpha_r
-                #                     q = q_r
-                #                     kappa = kappa_r
-
                 R, K, eps, sig, alpha, q, kappa = self.ts.get_corr_pred(
                     step_flag, U_k, d_U_k, eps, sig, t_n, t_n1, alpha, q, kappa)
 
                 F_ext = -R
                 K.apply_constraints(R)
-#                 print 'r', np.linalg.norm(R)
+                norm_R = np.linalg.norm(R)
+                if not np.isfinite(norm_R):
+                    break
                 d_U_k = K.solve()
                 d_U += d_U_k
-#                 print 'r', np.linalg.norm(R)
-                if np.linalg.norm(R) < self.tolerance:
-                    F_record = np.vstack((F_record, F_ext))
-                    U_k += d_U
-                    U_record = np.vstack((U_record, U_k))
-                    sf_record = np.vstack((sf_record, sig[:, :, 1].flatten()))
-                    eps_record.append(np.copy(eps))
-                    sig_record.append(np.copy(sig))
-                    t_record.append(t_n1)
+                if norm_R < self.tolerance:
+                    converged = True
                     break
                 k += 1
                 step_flag = 'corrector'
 
-            t_n = t_n1
+            if converged:
+                F_record = np.vstack((F_record, F_ext))
+                U_k += d_U
+                U_record = np.vstack((U_record, U_k))
+                sf_record = np.vstack((sf_record, sig[:, :, 1].flatten()))
+                eps_record.append(np.copy(eps))
+                sig_record.append(np.copy(sig))
+                t_record.append(t_n1)
+                t_n = t_n1
+                d_t = self.get_next_step(d_t, k)
+            elif self.adaptive:
+                # cut back the step and restart from the converged state
+                d_t *= self.step_cutback
+                eps, sig, alpha, q, kappa = state_n
+                if d_t < self.d_t_min:
+                    print('nonconvergence at t = %g' % t_n1)
+                    break
+            else:
+                print('nonconvergence')
+                t_n = t_n1
         return U_record, F_record, sf_record, np.array(t_record), eps_record, sig_record
 
 if __name__ == '__main__':
@@ -8,6 +8,7 @@ from traits.api import HasTraits, Instance, \
     Property, cached_property, Float, List
 from .matseval import MATSEval
 from .fets1d52ulrh import FETS1D52ULRH
+from .geo_kernel import GeoKernel
 from ibvpy.api import BCDof
 from mathkit.matrix_la.sys_mtx_assembly import SysMtxAssembly
 from ibvpy.mesh.fe_grid import FEGrid
@@ -129,10 +130,19 @@ class TStepper(HasTraits):
         B[:,:,:, B_dN_n_rows, B_dN_n_cols] = dNx[:,:,:, dN_idx]
         return B
 
+    geo_kernel = Property(depends_on='L_x, fets_eval.A_m, fets_eval.P_b, '
+                          'fets_eval.A_f')
+    '''Geometric factors of the element matrices and internal forces.
+    '''
+    @cached_property
+    def _get_geo_kernel(self):
+        return GeoKernel(w_ip=self.fets_eval.ip_weights, A=self.A,
+                         B=self.B, J_det=self.J_det)
+
     def apply_essential_bc(self):
         '''Insert initial boundary conditions at the start up of the calculation.. 
         '''
-        self.K = SysMtxAssembly()
+        self.K = SysMtxAssembly(matrix_type='csr')
         for bc in self.bc_list:
             bc.apply_essential(self.K)
 
@@ -154,14 +164,9 @@ class TStepper(HasTraits):
         n_dof_r, n_dim_dof = self.fets_eval.dof_r.shape
         n_nodal_dofs = self.fets_eval.n_nodal_dofs
         n_el_dofs = n_dof_r * n_nodal_dofs
-        # [ i ]
-        w_ip = fets_eval.ip_weights
-
         d_u_e = d_U[elem_dof_map]
-        #[n_e, n_dof_r, n_dim_dof]
-        d_u_n = d_u_e.reshape(n_e, n_dof_r, n_nodal_dofs)
         #[n_e, n_ip, n_s]
-        d_eps = np.einsum('einsd,end->eis', self.B, d_u_n)
+        d_eps = self.geo_kernel.get_d_eps(d_u_e)
 
         # update strain
         eps += d_eps
@@ -172,16 +177,14 @@ class TStepper(HasTraits):
 
         # system matrix
         self.K.reset_mtx()
-        Ke = np.einsum('i,s,einsd,eist,eimtf,ei->endmf',
-                       w_ip, self.A, self.B, D, self.B, self.J_det)
+        Ke = self.geo_kernel.get_Ke(D)
 
         self.K.add_mtx_array(
             Ke.reshape(-1, n_el_dofs, n_el_dofs), elem_dof_map)
 
         # internal forces
-        # [n_e, n_n, n_dim_dof]
-        Fe_int = np.einsum('i,s,eis,einsd,ei->end',
-                           w_ip, self.A, sig, self.B, self.J_det)
+        # [n_e, n_el_dofs]
+        Fe_int = self.geo_kernel.get_Fe_int(sig)
         F_int = -np.bincount(elem_dof_map.flatten(), weights=Fe_int.flatten())
         self.apply_bc(step_flag, self.K, F_int, t_n, t_n1)
         return F_int, self.K, eps, sig, alpha, q, kappa
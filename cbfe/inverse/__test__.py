@@ -0,0 +1,412 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+from cbfe import fe_nls_solver_incre
+from cbfe.nls_control import LineSearch
+from ibvpy.api import BCDof
+import numpy as np
+
+from . import calibrate_dpo, fem_inverse, fem_inverse_free_end
+from .analytical_inverse import get_bond
+from .surrogate import SurrogateCalibration
+
+
+def get_tloop(module, slip, bond, L_x=150., **tl_params):
+    '''Time loop of the pull-out test with the essential boundary
+    conditions applied and the initial state.
+    '''
+    ts = module.TStepper(L_x=L_x, n_e_x=20)
+    n_dofs = ts.domain.n_dofs
+    ts.bc_list = [BCDof(var='u', dof=n_dofs - 2, value=0.0),
+                  BCDof(var='u', dof=n_dofs - 1, value=1.0)]
+    ts.mats_eval.slip = slip
+    ts.mats_eval.bond = bond
+    ts.apply_essential_bc()
+    n_e = ts.domain.n_active_elems
+    n_ip = ts.fets_eval.n_gp
+    n_s = ts.mats_eval.n_s
+    eps, sig = np.zeros((n_e, n_ip, n_s)), np.zeros((n_e, n_ip, n_s))
+    return module.TLoop(ts=ts, **tl_params), eps, sig
+
+
+def get_curves(slip, bond, w_max=1., L_x=150.):
+    '''Loaded end slip, free end slip and pull-out force of the forward
+    run of the incremental model with the given bond law.
+    '''
+    tl = get_tloop(fe_nls_solver_incre, slip, bond, L_x=L_x,
+                   d_t=0.01, tolerance=1e-8)[0]
+    tl.ts.bc_list[-1].value = w_max
+    U, F = tl.eval()[:2]
+    return U[:, -1], U[:, 1], F[:, -1]
+
+
+class TestLineSearch(unittest.TestCase):
+    '''
+    Forward solves of the inverse time loops past the sharp peak
+    of a softening bond law, the full Newton iterations cycle.
+    '''
+
+    slip = [0., 0.005, 0.05, 5.]
+    bond = [0., 150., 20., 20.]
+
+    def test_solve_substeps(self):
+        tl, eps, sig = get_tloop(fem_inverse, self.slip, self.bond,
+                                 k_max=50)
+        self.assertRaises(Exception, tl.solve_substeps, 0.5, eps, sig,
+                          5, w_0=0.)
+        tl.line_search = LineSearch()
+        F = tl.solve_substeps(0.5, eps, sig, 5, w_0=0.)[0]
+        # the whole embedded length is on the plateau of the bond law
+        self.assertAlmostEqual(F, 20. * 150., places=3)
+
+    def test_solve_trial(self):
+        tl, eps, sig = get_tloop(fem_inverse_free_end, self.slip,
+                                 self.bond, L_x=100., k_max=50)
+        U_0 = np.zeros(tl.ts.domain.n_dofs)
+        self.assertRaises(Exception, tl.solve_trial, 20., 0.5, eps, sig,
+                          U_0, n=1)
+        tl.line_search = LineSearch()
+        F, U = tl.solve_trial(20., 0.5, eps, sig, U_0, n=1)[:2]
+        self.assertTrue(F > 0)
+        # increased from slip[-2]
+        self.assertAlmostEqual(U[-1], 0.5 - 0.05)
+
+
+class TestBondLawUpdate(unittest.TestCase):
+    '''
+    Bond law of the material model following the changes
+    of the slip and bond lists.
+    '''
+
+    def test_list_changes(self):
+        mats_eval = fem_inverse.MATSEval()
+        for mats_slip, mats_bond in [([0.], [0.]),
+                                     ([0., 1e-6], [0., 15.5])]:
+            mats_eval.slip, mats_eval.bond = mats_slip, mats_bond
+        for i in range(2, 20):
+            mats_eval.slip.append(0.1 * i)
+            mats_eval.bond.append(10. + i)
+            mats_eval.bond[-1] = 20. - i
+        mats_eval.bond[3] = 1.
+        law = mats_eval.bond_law
+        self.assertTrue(np.array_equal(law.slip, mats_eval.slip))
+        self.assertTrue(np.array_equal(law.bond, mats_eval.bond))
+        law_ref = fem_inverse.PiecewiseLinearLaw(
+            slip=mats_eval.slip, bond=mats_eval.bond, symmetric=False)
+        self.assertTrue(np.allclose(law.slopes, law_ref.slopes))
+        # removing points rebuilds the law
+        del mats_eval.slip[-5:]
+        del mats_eval.bond[-5:]
+        law_ref.trait_set(slip=mats_eval.slip, bond=mats_eval.bond)
+        self.assertTrue(np.array_equal(law.slip, mats_eval.slip))
+        self.assertTrue(np.allclose(law.slopes, law_ref.slopes))
+
+
+class TestSegmentInverse(unittest.TestCase):
+    '''
+    Identification of the bond law segment by segment from the pull-out
+    curve of a forward run.
+    '''
+
+    slip = [0., 0.1, 0.5, 1.]
+    bond = [0., 40., 50., 30.]
+    w_arr = np.linspace(0., 1., 11)
+
+    @classmethod
+    def setUpClass(cls):
+        w, _, pf = get_curves(cls.slip, cls.bond)
+        cls.pf_arr = np.interp(cls.w_arr, w, pf)
+
+    def eval(self, **tl_params):
+        tl = get_tloop(fem_inverse, [0.], [0.], w_arr=self.w_arr,
+                       pf_arr=self.pf_arr, **tl_params)[0]
+        tl.regularization = False
+        slip, bond = tl.eval()
+        self.assertEqual(tl.n_failed, 0)
+        return np.array(slip), np.array(bond)
+
+    def test_dF_dbond(self):
+        '''
+        The direct sensitivities of the pull-out force match
+        the central differences.
+        '''
+        def solve(bond):
+            tl, eps, sig = get_tloop(fem_inverse, list(self.slip), bond,
+                                     tolerance=1e-8)
+            return tl.solve_substeps(0.6, eps, sig, 10, w_0=0.), tl.ts
+        (_, eps, sig), ts = solve(list(self.bond))
+        dF = ts.get_dF_dbond(ts.K, eps, sig, np.arange(4))[:, -1]
+        h = 1e-3
+        for j in range(4):
+            bond_p, bond_m = list(self.bond), list(self.bond)
+            bond_p[j] += h
+            bond_m[j] -= h
+            dF_j = (solve(bond_p)[0][0] - solve(bond_m)[0][0]) / (2. * h)
+            self.assertAlmostEqual(dF[j], dF_j, delta=1e-5 * np.max(dF))
+
+    def test_newton_brentq(self):
+        '''
+        The Newton iterations find the roots of brentq.
+        '''
+        slip, bond = self.eval(root_finder='newton')
+        slip_b, bond_b = self.eval(root_finder='brentq')
+        self.assertTrue(np.array_equal(slip, slip_b))
+        self.assertTrue(np.allclose(bond, bond_b, rtol=1e-5))
+        self.assertTrue(np.allclose(bond, np.interp(slip, self.slip,
+                                                    self.bond), atol=1e-3))
+
+    def test_warm_start(self):
+        '''
+        The warm-started trials identify the law of the trials
+        sub-stepped from the checkpoint.
+        '''
+        for root_finder in ('newton', 'brentq'):
+            slip, bond = self.eval(root_finder=root_finder)
+            slip_c, bond_c = self.eval(root_finder=root_finder,
+                                       warm_start=False)
+            self.assertTrue(np.array_equal(slip, slip_c))
+            self.assertTrue(np.allclose(bond, bond_c, rtol=1e-5))
+
+    def test_global(self):
+        '''
+        The global fit recovers the bond values at the breakpoints.
+        '''
+        tl = get_tloop(fem_inverse, [0.], [0.], w_arr=self.w_arr,
+                       pf_arr=self.pf_arr, method='global',
+                       slip_global=self.slip)[0]
+        slip, bond = tl.eval()
+        self.assertTrue(np.array_equal(slip, self.slip))
+        self.assertTrue(np.allclose(bond, self.bond, atol=1e-3))
+        self.assertEqual(tl.bond_cov.shape, (4, 4))
+
+
+class TestCoupledInverse(unittest.TestCase):
+    '''
+    Identification of the bond law from the loaded end and the free end
+    curves of a forward run.
+    '''
+
+    slip = [0., 0.1, 0.5, 1.]
+    bond = [0., 40., 50., 30.]
+    w_arr = np.linspace(0., 1., 11)
+
+    @classmethod
+    def setUpClass(cls):
+        w, cls.w_free, cls.f_free = get_curves(cls.slip, cls.bond)
+        cls.pf_arr = np.interp(cls.w_arr, w, cls.f_free)
+
+    def get_tloop(self, module, w_arr=None, **tl_params):
+        if w_arr is None:
+            w_arr = self.w_arr
+        tl = get_tloop(module, [0.], [0.], w_arr=w_arr,
+                       pf_arr=self.pf_arr[:len(w_arr)], **tl_params)[0]
+        # material of the forward run
+        tl.ts.mats_eval.trait_set(E_m=28484., E_f=170000.)
+        tl.ts.fets_eval.trait_set(A_m=120. * 13. - 9. * 1.85, A_f=9. * 1.85)
+        return tl
+
+    def test_loaded_end(self):
+        '''
+        Without the free end curve the segments are identified
+        as by fem_inverse, up to its root tolerance tau_tol.
+        '''
+        tl = self.get_tloop(fem_inverse_free_end, w_free=self.w_free,
+                            f_free=self.f_free, beta=0., n=2)
+        slip, bond = tl.eval_coupled()
+        tl_ref = self.get_tloop(fem_inverse, root_finder='brentq',
+                                warm_start=False, tau_min=1e-5, n=2)
+        slip_ref, bond_ref = tl_ref.eval()
+        self.assertEqual(len(slip), 6)
+        self.assertEqual(slip, slip_ref)
+        self.assertTrue(np.allclose(bond, bond_ref, rtol=1e-6))
+        self.assertEqual(tl.n_failed, tl_ref.n_failed)
+
+    def test_coupled(self):
+        tl = self.get_tloop(fem_inverse_free_end, w_free=self.w_free,
+                            f_free=self.f_free, beta=0.5)
+        tl.regularization = False
+        slip, bond = tl.eval_coupled()
+        self.assertEqual(tl.n_failed, 0)
+        self.assertEqual(len(tl.step_times), len(self.w_arr) - 1)
+        self.assertTrue(np.allclose(bond, np.interp(slip, self.slip,
+                                                    self.bond), rtol=0.02))
+
+    def test_non_convergence(self):
+        '''
+        A trial that does not converge fails the segment only.
+        '''
+        tl = self.get_tloop(fem_inverse_free_end, w_arr=self.w_arr[:4],
+                            w_free=self.w_free, f_free=self.f_free)
+        solve_trial = tl.solve_trial
+
+        def solve_trial_failing(tau_i, *args, **kw):
+            if tau_i > 500.:
+                raise Exception('Non convergence')
+            return solve_trial(tau_i, *args, **kw)
+        tl.solve_trial = solve_trial_failing
+        slip, bond = tl.eval_coupled()
+        self.assertEqual(tl.n_failed, 3)
+        self.assertEqual(bond, [0., 0., 0., 0.])
+
+    def test_print_timing(self):
+        tl = self.get_tloop(fem_inverse_free_end, w_arr=self.w_arr[:1],
+                            w_free=self.w_free, f_free=self.f_free,
+                            print_times=True)
+        self.assertEqual(tl.eval_coupled(), ([0.], [0.]))
+        self.assertEqual(tl.step_times, [])
+
+
+class TestCalibrateDPO(unittest.TestCase):
+    '''
+    Batch calibration of the double pull-out tests.
+    '''
+
+    slip = [0., 0.1, 0.5, 1.]
+    bond = [0., 40., 50., 30.]
+
+    def setUp(self):
+        self.data_dir = tempfile.mkdtemp()
+        self.out_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.data_dir)
+        shutil.rmtree(self.out_dir)
+
+    def write_curve(self, fname, bond):
+        # displacement of both sides [mm] and force [kN]
+        w, _, pf = get_curves(self.slip, bond, L_x=100.)
+        curve = np.vstack((2. * w, pf / 1000.))
+        if fname.endswith('.asc'):
+            np.savetxt(os.path.join(self.data_dir, fname), curve,
+                       delimiter=';')
+        else:
+            np.savetxt(os.path.join(self.data_dir, fname), curve.T)
+
+    def test_load_curve(self):
+        d, f = np.linspace(0., 1., 5), np.linspace(0., 2., 5)
+        np.savetxt(os.path.join(self.data_dir, 'rows.asc'),
+                   np.vstack((d, f)), delimiter=';')
+        np.savetxt(os.path.join(self.data_dir, 'columns.txt'),
+                   np.vstack((d, f)).T)
+        for fname in ['rows.asc', 'columns.txt']:
+            d_l, f_l = calibrate_dpo.load_curve(
+                os.path.join(self.data_dir, fname))
+            self.assertTrue(np.allclose(d_l, d))
+            self.assertTrue(np.allclose(f_l, f))
+        fname = os.path.join(self.data_dir, 'three.txt')
+        np.savetxt(fname, np.vstack((d, f, f)).T)
+        self.assertRaises(ValueError, calibrate_dpo.load_curve, fname)
+
+    def get_store(self):
+        store_dir = os.path.join(self.out_dir, 'store')
+        return {fname: os.path.getmtime(os.path.join(store_dir, fname))
+                for fname in os.listdir(store_dir)}
+
+    def test_calibrate(self):
+        '''
+        Two specimens are calibrated and skipped when the command is
+        repeated, also with the curves moved to another directory.
+        A changed curve is calibrated again.
+        '''
+        bond_2 = [0., 30., 40., 40.]
+        self.write_curve('dpo_1.asc', self.bond)
+        self.write_curve('dpo_2.txt', bond_2)
+        argv = [self.data_dir, self.out_dir, '--L_x', '100',
+                '--n_w', '11', '--n_reg', '0', '--n_workers', '1']
+        calibrate_dpo.main(argv)
+        for name, bond in [('dpo_1', self.bond), ('dpo_2', bond_2)]:
+            slip_c, bond_c = np.loadtxt(
+                os.path.join(self.out_dir, 'bond', name + '.txt')).T
+            self.assertTrue(np.allclose(
+                bond_c, np.interp(slip_c, self.slip, bond), atol=1e-2))
+        with open(os.path.join(self.out_dir, 'summary.txt')) as f:
+            self.assertEqual(f.read().count(' ok\n'), 2)
+        store = self.get_store()
+        self.assertEqual(len(store), 2)
+
+        moved_dir = os.path.join(self.data_dir, 'moved')
+        os.makedirs(moved_dir)
+        for fname in ['dpo_1.asc', 'dpo_2.txt']:
+            shutil.copy(os.path.join(self.data_dir, fname), moved_dir)
+        calibrate_dpo.main([moved_dir] + argv[1:])
+        self.assertEqual(self.get_store(), store)
+
+        self.write_curve('dpo_2.txt', self.bond)
+        calibrate_dpo.main(argv)
+        store_new = self.get_store()
+        self.assertEqual(len(store_new), 3)
+        self.assertTrue(set(store) < set(store_new))
+
+
+class TestSurrogateCalibration(unittest.TestCase):
+    '''
+    Store of the finite element runs of the surrogate calibration.
+    '''
+
+    slip = [0., 0.005, 0.05, 5.]
+
+    def setUp(self):
+        self.cache_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.cache_dir)
+
+    def get_calibration(self, geometry):
+        return SurrogateCalibration(geometry=geometry, slip=self.slip,
+                                    w_arr=np.linspace(0., 0.5, 6),
+                                    pf_arr=np.zeros(6), n_e_x=10,
+                                    cache_dir=self.cache_dir)
+
+    def test_store(self):
+        '''
+        The missing parameters of the geometry are keyed
+        by their defaults.
+        '''
+        sc = self.get_calibration({'L_x': 100.})
+        geometry = sc.geometry_all
+        self.assertEqual(len(geometry), 6)
+        self.assertEqual(sc.store.path,
+                         self.get_calibration(dict(geometry)).store.path)
+        self.assertNotEqual(sc.store.path, self.get_calibration(
+            dict(geometry, L_x=50.)).store.path)
+
+    def test_non_converged(self):
+        '''
+        The runs with load steps which did not converge are not used.
+        '''
+        sc = self.get_calibration({'L_x': 100.})
+        sc.run([[0., 150., 20., 20.], [0., 15., 20., 20.]])
+        params, results = sc.store.load()
+        self.assertEqual(sorted(results['n_failed'] > 0), [False, True])
+        bond, pf = sc.get_runs()
+        self.assertTrue(np.array_equal(bond, [[0., 15., 20., 20.]]))
+        self.assertEqual(pf.shape, (1, 6))
+
+
+class TestAnalyticalInverse(unittest.TestCase):
+    '''
+    Identification of a linear bond law tau = k s from the closed form
+    pull-out curve pf = w sqrt(g k) tanh(sqrt(g k) L) / g.
+    '''
+
+    L = 150.
+    gamma = 1. / (9 * 1.85 * 170000.) + 1. / ((800. - 9 * 1.85) * 28484.)
+
+    def check_linear(self, k, n):
+        w_arr = np.linspace(0., 10., n)
+        a = np.sqrt(self.gamma * k)
+        pf_arr = w_arr * a * np.tanh(a * self.L) / self.gamma
+        bond = get_bond(w_arr, pf_arr, self.L, self.gamma)
+        self.assertTrue(np.allclose(bond, k * w_arr, rtol=1e-8, atol=1e-8))
+
+    def test_linear(self):
+        # the free end slips almost as much as the loaded end for small k
+        for k in (10., 100., 1000.):
+            for n in (50, 1000):
+                self.check_linear(k, n)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -1,128 +1,191 @@
+'''
+Analytical identification of the bond-slip law from the pull-out curve.
+
+The slip s along the embedded length L satisfies s'' = T(s) with the
+bond T = gamma * tau. The slip gradient q = s' at the loaded end
+equals gamma * P, it vanishes at the free end. The bond law is
+piecewise linear in the slips of the measured points w_arr. The bond
+values are determined point by point so that the length needed to
+reduce q from gamma * P to zero equals L.
+
+Integrating s'' = T(s) gives q^2 = 2 (E(s) - E(s_0)), with the
+cumulative integral E of the bond law and the free end slip s_0. The
+length of a linear segment with the slope m follows in closed form,
+see _get_length. The cumulative integrals, slopes and bond values of
+the identified segments are stored in arrays, a trial value of the
+current bond only shifts q^2 of all segments by the same amount.
+The free end segment is then found by bisection of E and the lengths
+of the remaining segments are summed in one vectorized expression.
+
+The pull-out force at the slip w depends only on the bond law between
+the free end slip s_0 and w, weighted by the length ds / q, i.e. the
+most at the free end. If the free end slips almost as much as the
+loaded end, the newest bond value has the smallest weight and the
+point-by-point identification amplifies the errors of the previous
+values, with finely spaced points up to a collapse of the law. The
+breakpoints of the identified law are therefore thinned out to the
+steps
+
+    s_new - s >= c_step (s - s_0) s_0 / s
+
+of the last breakpoint s with the free end slip s_0, the bond values
+at the skipped points are interpolated. The steps are not limited while
+the free end is at rest. The identified law is exact for a linear
+bond law, the kinks of other laws are smoothed over the steps.
+
+@author: Yingxiong
+'''
+from scipy.optimize import brentq
 import numpy as np
-from scipy.optimize import newton, brentq
-from scipy.interpolate import interp1d
-from matplotlib import pyplot as plt
 
 
-# reinforcement
-E_f = 170000.  # N/mm2
-# d_f = 16.  # mm
-# A_f = np.pi * d_f ** 2 / 4.0
-A_f = 9 * 1.85  # mm2
-
-# matrix
-E_m = 28484.  # N/mm2
-A_m = 100 * 8 - 9 * 1.85  # mm2
-
-# embedded length
-L = 150.  # mm
-gamma = 1. / (A_f * E_f) + 1. / (A_m * E_m)
-
-
-# p_arr = np.array([0.0,  1.42888176e+01,   1.90808270e+01,   2.16062547e+01,
-#                   2.45121859e+01,   2.53688656e+01,   1.01638353e+01,
-#                   1.66934090e-02])
-#
-# w_arr = np.array([0, 0.25, 0.50, 0.75, 1.00, 3.00, 4.00, 12.0])
-
-# w_arr, p_arr = np.loadtxt('D:\\Default_Dataset.csv', delimiter=',').T
-fpath = 'D:\\data\\pull_out\\all\\DPO-30cm-0-3300SBR-V3_R3_f.asc'
-
-x, y = np.loadtxt(fpath,  delimiter=';')
-
-x[0] = 0.
-
-interp = interp1d(x / 2., y)
-
-w_arr = np.linspace(0, 10., 200)
-
-p_arr = interp(w_arr)
-
-x = np.linspace(0, 10., 200)
-
-interp = interp1d(w_arr, p_arr)
-
-y = interp(x) * 1000.
-
-q_arr = y * gamma
-
-
-def d_x_g0(q, q_1, m, T, T_1):
-    # for m>0
-    return 1. / np.sqrt(m) * np.log((np.sqrt(m) * q + T) / (np.sqrt(m) * q_1 + T_1))
+def _get_length(q, q_1, T, T_1, m, a):
+    '''Length of the linear segments with the slopes m, the bond T and
+    the slip gradient q at the upper end and T_1, q_1 at the lower end,
+    a = sqrt(|m|) bounded away from zero.
+    '''
+    aq, aq_1 = a * q, a * q_1
+    l_pos = np.log1p((aq - aq_1 + T - T_1) / (aq_1 + T_1))
+    l_neg = np.arctan2(aq, T) - np.arctan2(aq_1, T_1)
+    return np.where(m > 0, l_pos, l_neg) / a
+
+
+def _get_end_length(q, T, m, a):
+    '''Length of the free end segment, i.e. from q = 0 at the free end
+    to the upper end of the segment with q, T.
+    '''
+    if m > 0:
+        return np.log((a * q + T) / np.sqrt(T ** 2 - m * q ** 2)) / a
+    return np.arctan2(a * q, T) / a
+
+
+def get_bond(w_arr, pf_arr, L, gamma, rtol=1e-10, c_step=4.):
+    '''Identify the bond-slip law from the loaded end slips w_arr and
+    the pull-out forces pf_arr, w_arr[0] must be zero. L is the
+    embedded length and gamma = 1 / (A_f E_f) + 1 / (A_m E_m).
+    The bond values are determined with the relative tolerance rtol
+    of the embedded length. c_step scales the smallest step between
+    the breakpoints, see the module docstring, 0 identifies the bond
+    at all points of w_arr.
+
+    Return the bond values at the slips w_arr.
+    '''
+    w_arr = np.asarray(w_arr, dtype=float)
+    qq_arr = (np.asarray(pf_arr, dtype=float) * gamma) ** 2
+    n = len(w_arr)
+    # slips, identified bond, cumulative integrals, slopes and
+    # sqrt(|slopes|) of the breakpoints
+    s = np.zeros(n)
+    T = np.zeros(n)
+    E = np.zeros(n)
+    m = np.zeros(n)
+    a = np.zeros(n)
+    qq = 0.
+
+    def get_length(t, i):
+        # embedded length needed for the trial bond t at the slip s[i]
+        d_s = s[i] - s[i - 1]
+        T[i] = t
+        m[i] = (t - T[i - 1]) / d_s
+        a[i] = max(np.sqrt(abs(m[i])), 1e-100)
+        E[i] = E[i - 1] + 0.5 * d_s * (t + T[i - 1])
+        # q^2 at the slips s[:i + 1] is qq_0 + 2 E
+        qq_0 = qq - 2. * E[i]
+        if qq_0 >= 0:
+            # q does not vanish within the bond law, i.e. L is too short
+            return np.inf
+        # free end segment j
+        j = np.searchsorted(E[:i + 1], -0.5 * qq_0, side='right')
+        q = np.sqrt(qq_0 + 2. * E[j:i + 1])
+        l = _get_end_length(q[0], T[j], m[j], a[j])
+        if j < i:
+            l += np.sum(_get_length(q[1:], q[:-1], T[j + 1:i + 1], T[j:i],
+                                    m[j + 1:i + 1], a[j + 1:i + 1]))
+        return l if np.isfinite(l) else np.inf
+
+    def solve(i, t_0):
+        # root of the length starting from the estimate t_0
+        f = lambda t: get_length(t, i) - L
+        # secant iterations
+        t_1, t_2 = t_0, t_0 * (1. + 1e-4)
+        f_1, f_2 = f(t_1), f(t_2)
+        for _ in range(10):
+            if not np.isfinite(f_1 - f_2) or f_1 == f_2:
+                break
+            t_1, t_2 = t_2, t_2 - f_2 * (t_2 - t_1) / (f_2 - f_1)
+            if t_2 <= 0:
+                break
+            f_1, f_2 = f_2, f(t_2)
+            if abs(f_2) < rtol * L:
+                return t_2
+        # bracket the root and use Brent's method
+        t_1 = t_2 = t_0
+        f_1 = f_2 = f(t_0)
+        while f_1 * f_2 > 0:
+            t_1 = t_2
+            t_2 = t_2 * 2. if f_2 > 0 else t_2 * 0.5
+            f_1, f_2 = f_2, f(t_2)
+            if t_2 < 1e-12 * t_0:
+                # no bond needed, the bond law is cut at zero
+                return 0.
+        if f_2 == 0:
+            return t_2
+        return brentq(f, min(t_1, t_2), max(t_1, t_2),
+                      xtol=1e-12 * t_0, rtol=1e-12)
+
+    i = 0
+    s_0 = 0.
+    with np.errstate(divide='ignore', invalid='ignore', over='ignore'):
+        for k in range(1, n):
+            qq = qq_arr[k]
+            if c_step and 0 < i and k < n - 1 and qq > 0 and \
+                    w_arr[k] - s[i] < c_step * (s[i] - s_0) * s_0 / s[i]:
+                # below the resolution of the pull-out force
+                continue
+            i += 1
+            s[i] = w_arr[k]
+            if qq == 0:
+                t = 0.
+            elif T[i - 1] > 0:
+                # linear extrapolation of the identified bond
+                t = T[i - 1]
+                if i > 1:
+                    t += (T[i - 1] - T[i - 2]) / (s[i - 1] - s[i - 2]) * \
+                        (s[i] - s[i - 1])
+                t = solve(i, t if t > 0 else T[i - 1])
+            else:
+                t = solve(i, qq / (s[i] * L))
+            get_length(t, i)
+            # free end slip
+            s_0 = np.interp(E[i] - 0.5 * qq, E[:i + 1], s[:i + 1])
 
+    return np.interp(w_arr, s[:i + 1], T[:i + 1]) / gamma
 
-def d_x_l0(q, q_1, m, T, T_1):
-    # for m<0
-    return 1. / np.sqrt(-m) * np.arcsin(np.sqrt(-m) * (T * q_1 - T_1 * q) / (T_1 ** 2 - m * q_1 ** 2))
 
+if __name__ == '__main__':
 
-def d_x_bar_g0(q, m, T):
-    # for m>0
-    return 1. / np.sqrt(m) * np.log((np.sqrt(m) * q + T) / np.sqrt(T ** 2 - m * q ** 2))
+    from matplotlib import pyplot as plt
 
+    # reinforcement
+    E_f = 170000.  # N/mm2
+    A_f = 9 * 1.85  # mm2
 
-def d_x_bar_l0(q, m, T):
-    # for m<0
-    return 1. / np.sqrt(-m) * np.arcsin(np.sqrt(-m) * np.sqrt(T ** 2 - m * q ** 2) * q / (T ** 2 - m * q ** 2))
+    # matrix
+    E_m = 28484.  # N/mm2
+    A_m = 100 * 8 - 9 * 1.85  # mm2
 
+    # embedded length
+    L = 150.  # mm
+    gamma = 1. / (A_f * E_f) + 1. / (A_m * E_m)
 
-def q_1(q, m, s, s_1, T_1):
-    return q ** 2 - m * (s - s_1) ** 2 - 2 * T_1 * (s - s_1)
+    fpath = 'D:\\data\\pull_out\\all\\DPO-30cm-0-3300SBR-V3_R3_f.asc'
+    x, y = np.loadtxt(fpath, delimiter=';')
+    x[0] = 0.
 
-T = np.zeros_like(x)
+    w_arr = np.linspace(0, 10., 200)
+    pf_arr = np.interp(w_arr, x / 2., y) * 1000.
 
-for i, psi in enumerate(x):
-    if i == 0:
-        T[i] = 0
-    elif i == 1:
-        def d_x_bar(Ti):
-            m = (Ti - T[i - 1]) / (x[i] - x[i - 1])
-            if m > 0:
-                return d_x_bar_g0(q_arr[i], m, Ti)
-            else:
-                return d_x_bar_l0(q_arr[i], m, Ti)
-        a = lambda t: d_x_bar(t) - L
-        T[i] = brentq(a, 0., 10.)
-    else:
-        m_arr = (T[1:i + 1] - T[0:i]) / (x[1:i + 1] - x[0:i])
-
-        def d_x(Ti):
-            T[i] = Ti
-            m_arr[-1] = (Ti - T[i - 1]) / (x[i] - x[i - 1])
-            j = i
-            l = 0.
-            q_i = q_arr[i]
-            while True:
-                q_i_1 = q_1(
-                    q_i, m_arr[j - 1], x[j], x[j - 1], T[j - 1])
-                if q_i_1 > 0:
-                    if m_arr[j - 1] > 0:
-                        d_x = d_x_g0(
-                            q_i, q_i_1, m_arr[j - 1], T[j], T[j - 1])
-                    else:
-                        d_x = d_x_l0(
-                            q_i, q_i_1, m_arr[j - 1], T[j], T[j - 1])
-                    l += d_x
-                    q_i = q_i_1
-                    j = j - 1
-                else:
-                    break
-
-            if m_arr[j - 1] > 0:
-                d_x_bar = d_x_bar_g0(q_i, m_arr[j - 1], T[j])
-            else:
-                d_x_bar = d_x_bar_l0(q_i, m_arr[j - 1], T[j])
-            l += d_x_bar
-            return l
-
-        solve = lambda Ti: d_x(Ti) - L
-        T[i] = brentq(solve,  1e-9, 10.)
-#         print T
-
-plt.plot(x, T / gamma)
-# T_arr = np.array(
-#     [0, 8.72e-6, 1.15e-5, 1.35e-5, 1.52e-5, 1.52e-5, 6.07e-6, 1e-8])
-# s_arr = np.array([0, 0.25, 0.50, 0.75, 1.00, 3.00, 4.00, 12.0])
-# plt.plot(s_arr, T_arr)
-plt.show()
+    plt.plot(w_arr, get_bond(w_arr, pf_arr, L, gamma))
+    plt.xlabel('slip [mm]')
+    plt.ylabel('bond [N/mm]')
+    plt.show()
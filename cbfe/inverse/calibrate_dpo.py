@@ -0,0 +1,179 @@
+'''
+Batch calibration of the bond-slip law from double pull-out tests.
+
+    python -m inverse.calibrate_dpo data_dir out_dir [options]
+
+Each .asc (';' delimited) or .txt file in data_dir contains one measured
+curve, i.e. two rows or two columns with the displacement and the force.
+The specimens are calibrated with inverse.fem_inverse.TLoop in parallel
+processes. The calibrated bond-slip tables are written to out_dir/bond,
+the log of each specimen to out_dir/log and the timing and convergence
+statistics of all specimens to out_dir/summary.txt. Calibrated specimens
+are kept in out_dir/store under the file name and the content hash of
+the curve and skipped when the command is repeated.
+
+@author: Yingxiong
+'''
+import argparse
+import contextlib
+import functools
+import hashlib
+import os
+import time
+
+from cbfe.sweep import ParametricSweep, ResultStore
+import numpy as np
+
+
+def load_curve(fname):
+    '''Return the displacement and the force of the measured curve.
+    '''
+    delimiter = ';' if fname.endswith('.asc') else None
+    data = np.loadtxt(fname, delimiter=delimiter)
+    if data.shape[0] != 2:
+        data = data.T
+    if data.ndim != 2 or data.shape[0] != 2:
+        raise ValueError('%s: expected two rows or columns' % fname)
+    return data[0], data[1]
+
+
+def get_file_hash(fname):
+    '''Return the content hash of the file.
+    '''
+    with open(fname, 'rb') as f:
+        return hashlib.sha1(f.read()).hexdigest()
+
+
+def calibrate_specimen(fname, log_dir, data_dir='', file_hash=None,
+                       L_x=100., n_e_x=20, w_scale=0.5, f_scale=1000.,
+                       w_skip=0., w_max=0., n_w=30, n_reg=None, **params):
+    '''Calibrate the bond-slip law of one specimen with the curve
+    fname in data_dir. The content hash of the file only enters
+    the key of the stored result.
+
+    The displacement and the force are scaled by w_scale and f_scale,
+    i.e. the displacement of the double pull-out test is split into the
+    slips of the two sides and the force is converted from kN to N by
+    default. The measured points with the slip below w_skip, e.g. before
+    the concrete at the notch is cracked, are replaced by the origin.
+    The curve is sampled at n_w slips up to w_max (0 - the largest
+    measured slip). The regularization of TLoop averages n_reg segments
+    (None - the default of TLoop, 0 - off). The remaining parameters
+    are the traits of the material model (E_m, E_f) and of the element
+    (A_m, A_f, L_b).
+    '''
+    from ibvpy.api import BCDof
+    from inverse.fem_inverse import TStepper, TLoop
+
+    d, f = load_curve(os.path.join(data_dir, fname))
+    w, pf = d * w_scale, f * f_scale
+    order = np.argsort(w, kind='stable')
+    w, pf = w[order], pf[order]
+    if w_skip > 0:
+        cracked = w >= w_skip
+        w = np.hstack((0., w[cracked]))
+        pf = np.hstack((0., pf[cracked]))
+    w_max = min(w_max, w[-1]) if w_max > 0 else w[-1]
+    w_arr = np.linspace(0., w_max, int(n_w))
+    pf_arr = np.interp(w_arr, w, pf)
+
+    ts = TStepper(L_x=float(L_x), n_e_x=int(n_e_x))
+    for name, value in params.items():
+        target = ts.mats_eval if name in ('E_m', 'E_f') else ts.fets_eval
+        setattr(target, name, float(value))
+    n_dofs = ts.domain.n_dofs
+    ts.bc_list = [BCDof(var='u', dof=n_dofs - 2, value=0.0),
+                  BCDof(var='u', dof=n_dofs - 1, value=1.0)]
+    tl = TLoop(ts=ts, w_arr=w_arr, pf_arr=pf_arr)
+    if n_reg == 0:
+        tl.regularization = False
+    elif n_reg is not None:
+        tl.n = int(n_reg)
+
+    name = os.path.splitext(os.path.basename(fname))[0]
+    t = time.time()
+    with open(os.path.join(log_dir, name + '.log'), 'w') as log, \
+            contextlib.redirect_stdout(log):
+        slip, bond = tl.eval()
+    return {'slip': np.array(slip), 'bond': np.array(bond),
+            'time': time.time() - t, 'n_segments': len(w_arr) - 1,
+            'n_trials': tl.n_trials, 'n_failed': tl.n_failed}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description='Calibrate the bond-slip laws of a series of '
+        'double pull-out tests.')
+    parser.add_argument('data_dir', help='directory of the measured curves')
+    parser.add_argument('out_dir', help='directory of the results')
+    parser.add_argument('--L_x', type=float, default=100.,
+                        help='half of the specimen length [mm]')
+    parser.add_argument('--n_e_x', type=int, default=20,
+                        help='number of elements')
+    for name in ['E_m', 'E_f', 'A_m', 'A_f', 'L_b']:
+        parser.add_argument('--' + name, type=float,
+                            help='default of the model if not given')
+    parser.add_argument('--w_scale', type=float, default=0.5,
+                        help='factor from the displacement to the slip')
+    parser.add_argument('--f_scale', type=float, default=1000.,
+                        help='factor from the measured force to [N]')
+    parser.add_argument('--w_skip', type=float, default=0.,
+                        help='ignore the measured points below this slip')
+    parser.add_argument('--w_max', type=float, default=0.,
+                        help='largest calibrated slip, 0 - all data')
+    parser.add_argument('--n_w', type=int, default=30,
+                        help='number of the calibrated slips')
+    parser.add_argument('--n_reg', type=int,
+                        help='number of the averaged segments, 0 - off, '
+                        'default of the model if not given')
+    parser.add_argument('--n_workers', type=int, default=0,
+                        help='number of the processes, 0 - all processors')
+    args = parser.parse_args(argv)
+
+    fnames = sorted(fname for fname in os.listdir(args.data_dir)
+                    if fname.endswith(('.asc', '.txt')))
+    bond_dir = os.path.join(args.out_dir, 'bond')
+    log_dir = os.path.join(args.out_dir, 'log')
+    for dir_ in [bond_dir, log_dir]:
+        if not os.path.exists(dir_):
+            os.makedirs(dir_)
+
+    fixed = {name: value for name, value in vars(args).items()
+             if value is not None and
+             name not in ('data_dir', 'out_dir', 'n_workers')}
+    fixed['log_dir'] = log_dir
+    # keyed on the file name and content, not on the data directory
+    grid = {('fname', 'file_hash'): [
+        (fname, get_file_hash(os.path.join(args.data_dir, fname)))
+        for fname in fnames]}
+    sweep = ParametricSweep(grid=grid, fixed=fixed,
+                            run_fn=functools.partial(
+                                calibrate_specimen, data_dir=args.data_dir),
+                            store=ResultStore(
+                                path=os.path.join(args.out_dir, 'store')),
+                            n_workers=args.n_workers)
+    rows = []
+    for params, results in zip(sweep.runs, sweep.run()):
+        name = os.path.splitext(params['fname'])[0]
+        if results is None:
+            rows.append('%-30s %8s %8s %8s %10s  failed' %
+                        (name, '-', '-', '-', '-'))
+            continue
+        np.savetxt(os.path.join(bond_dir, name + '.txt'),
+                   np.vstack((results['slip'], results['bond'])).T,
+                   header='slip [mm]  bond [N/mm]')
+        status = 'ok' if results['n_failed'] == 0 else \
+            'root finding failed for %d segments' % results['n_failed']
+        rows.append('%-30s %8d %8d %8d %10.2f  %s' %
+                    (name, results['n_segments'], results['n_trials'],
+                     results['n_failed'], results['time'], status))
+    summary = '\n'.join(['%-30s %8s %8s %8s %10s  %s' %
+                         ('specimen', 'segments', 'trials', 'failed',
+                          'time [s]', 'status')] + rows)
+    with open(os.path.join(args.out_dir, 'summary.txt'), 'w') as f:
+        f.write(summary + '\n')
+    print(summary)
+
+
+if __name__ == '__main__':
+    main()
@@ -6,6 +6,9 @@ Created on 19.01.2016
 import sys
 
 from envisage.ui.workbench.api import WorkbenchApplication
+from cbfe.bond_law import PiecewiseLinearLaw
+from cbfe.geo_kernel import GeoKernel
+from cbfe.nls_control import LineSearch
 from ibvpy.api import BCDof
 from ibvpy.fets.fets_eval import FETSEval, IFETSEval
 from ibvpy.mats.mats1D import MATS1DElastic
@@ -14,9 +17,11 @@ from ibvpy.mesh.fe_grid import FEGrid
 from mathkit.matrix_la.sys_mtx_assembly import SysMtxAssembly
 from mayavi.sources.api import VTKDataSource, VTKFileReader
 from scipy.interpolate import interp1d
-from scipy.optimize import newton, brentq, bisect, minimize_scalar
+from scipy.optimize import newton, brentq, bisect, minimize_scalar, \
+    least_squares
 from traits.api import provides, Int, Array, HasTraits, Instance, \
-    Property, cached_property, Constant, Float, List
+    Property, cached_property, Constant, Float, List, Bool, Any, Dict, Enum, \
+    on_trait_change
 
 import matplotlib.pyplot as plt
 import numpy as np
@@ -34,16 +39,39 @@ class MATSEval(HasTraits):
 
     bond = List([0.])
 
+    bond_law = Instance(PiecewiseLinearLaw)
+    '''Tabulated bond-slip law following slip and bond. Appending a point
+    and changing a single bond value update the law in O(1), the other
+    changes rebuild it.
+    '''
+
+    def _bond_law_default(self):
+        return PiecewiseLinearLaw(slip=self.slip, bond=self.bond,
+                                  symmetric=False)
+
+    @on_trait_change('slip, bond, slip_items, bond_items')
+    def _update_bond_law(self, name, new):
+        slip, bond = self.slip, self.bond
+        if len(slip) != len(bond):
+            # wait for the change of the other list
+            return
+        law = self.bond_law
+        n = len(law.slip)
+        if name.endswith('_items') and not new.removed and \
+                len(new.added) == 1 and new.index == n == len(slip) - 1:
+            law.append(slip[-1], bond[-1])
+        elif name == 'bond_items' and n == len(bond) and \
+                len(new.added) == len(new.removed) == 1:
+            law.set_bond(new.index, bond[new.index])
+        else:
+            law.trait_set(slip=slip, bond=bond)
+
     def b_s_law(self, x):
-        return np.interp(x, self.slip, self.bond)
+        return self.bond_law.get_tau_G(x)[0]
 
     # the tangential stiffness of the bond interface
     def G(self, x):
-        d = np.diff(self.bond) / np.diff(self.slip)
-        d = np.append(d, d[-1])
-        G = interp1d(
-            np.array(self.slip), d, kind='zero', fill_value=(0, 0), bounds_error=False)
-        return G(np.abs(x))
+        return self.bond_law.get_tau_G(x)[1]
 
     def get_corr_pred(self, eps, d_eps, sig, t_n, t_n1):
         n_e, n_ip, n_s = eps.shape
@@ -51,7 +79,7 @@ class MATSEval(HasTraits):
         D[:, :, 0, 0] = self.E_m
         D[:, :, 2, 2] = self.E_f
         try:
-            D[:, :, 1, 1] = self.G(eps[:, :, 1])
+            tau, D[:, :, 1, 1] = self.bond_law.get_tau_G(eps[:, :, 1])
         except:
             print(np.array(self.slip))
             print(eps[:, :, 1])
@@ -59,7 +87,7 @@ class MATSEval(HasTraits):
         d_sig = np.einsum('...st,...t->...s', D, d_eps)
         sig += d_sig
 
-        sig[:, :, 1] = self.b_s_law(eps[:, :, 1])
+        sig[:, :, 1] = tau
         return sig, D
 
     n_s = Constant(3)
@@ -269,10 +297,19 @@ class TStepper(HasTraits):
 
         return B
 
+    geo_kernel = Property(depends_on='L_x, n_e_x, fets_eval.A_f, '
+                          'fets_eval.A_m, fets_eval.L_b')
+    '''Geometric factors of the element matrices and internal forces.
+    '''
+    @cached_property
+    def _get_geo_kernel(self):
+        return GeoKernel(w_ip=self.fets_eval.ip_weights, A=self.A,
+                         B=self.B, J_det=self.J_det)
+
     def apply_essential_bc(self):
         '''Insert initial boundary conditions at the start up of the calculation.. 
         '''
-        self.K = SysMtxAssembly()
+        self.K = SysMtxAssembly(matrix_type='banded')
         for bc in self.bc_list:
             bc.apply_essential(self.K)
 
@@ -293,14 +330,9 @@ class TStepper(HasTraits):
         n_dof_r, n_dim_dof = self.fets_eval.dof_r.shape
         n_nodal_dofs = self.fets_eval.n_nodal_dofs
         n_el_dofs = n_dof_r * n_nodal_dofs
-        # [ i ]
-        w_ip = fets_eval.ip_weights
-
         d_u_e = d_U[elem_dof_map]
-        #[n_e, n_dof_r, n_dim_dof]
-        d_u_n = d_u_e.reshape(n_e, n_dof_r, n_nodal_dofs)
         #[n_e, n_ip, n_s]
-        d_eps = np.einsum('einsd,end->eis', self.B, d_u_n)
+        d_eps = self.geo_kernel.get_d_eps(d_u_e)
 
         # update strain
         eps += d_eps
@@ -312,20 +344,59 @@ class TStepper(HasTraits):
 
         # system matrix
         self.K.reset_mtx()
-        Ke = np.einsum('i,s,einsd,eist,eimtf,ei->endmf',
-                       w_ip, self.A, self.B, D, self.B, self.J_det)
+        Ke = self.geo_kernel.get_Ke(D)
 
         self.K.add_mtx_array(
             Ke.reshape(-1, n_el_dofs, n_el_dofs), elem_dof_map)
 
         # internal forces
-        # [n_e, n_n, n_dim_dof]
-        Fe_int = np.einsum('i,s,eis,einsd,ei->end',
-                           w_ip, self.A, sig, self.B, self.J_det)
+        # [n_e, n_el_dofs]
+        Fe_int = self.geo_kernel.get_Fe_int(sig)
         F_int = -np.bincount(elem_dof_map.flatten(), weights=Fe_int.flatten())
         self.apply_bc(step_flag, self.K, F_int, t_n, t_n1)
         return F_int, self.K, eps, sig
 
+    def get_dF_dbond(self, K, eps, sig, j=-1):
+        '''Derivative of the nodal forces with respect to the bond value
+        of the breakpoint j of the bond law at a converged state.
+
+        K is the tangent operator returned by get_corr_pred for the state
+        eps, sig. The displacement sensitivity follows from the
+        linearized equilibrium with the essential dofs kept fixed
+        (direct differentiation), the returned derivative includes
+        the reaction forces at the essential dofs. For a sequence of
+        breakpoints j the derivatives are stacked [len(j), n_dofs].
+        '''
+        mats_eval = self.mats_eval
+        elem_dof_map = self.domain.elem_dof_map
+        n_dofs = self.domain.n_dofs
+        _, D = mats_eval.get_corr_pred(np.copy(eps), np.zeros_like(eps),
+                                       np.copy(sig), 0., 0.)
+        for c in K.constraints:
+            c.u_a = 0.
+        dF = []
+        for j_ in np.atleast_1d(j):
+            # stress derivative at fixed displacements
+            dsig = np.zeros_like(sig)
+            dsig[:, :, 1] = mats_eval.bond_law.get_dtau_dbond(
+                eps[:, :, 1], j_)
+            dF_b = np.bincount(
+                elem_dof_map.flatten(),
+                weights=self.geo_kernel.get_Fe_int(dsig).flatten(),
+                minlength=n_dofs)
+            # displacement sensitivity
+            rhs = -dF_b
+            K.apply_constraints(rhs)
+            dU = K.solve()
+            # total derivative of the stresses and nodal forces
+            d_eps = self.geo_kernel.get_d_eps(dU[elem_dof_map])
+            dsig += np.einsum('...st,...t->...s', D, d_eps)
+            dF.append(np.bincount(
+                elem_dof_map.flatten(),
+                weights=self.geo_kernel.get_Fe_int(dsig).flatten(),
+                minlength=n_dofs))
+        return dF[0] if np.ndim(j) == 0 else np.array(dF)
+
 
 class TLoop(HasTraits):
 
@@ -339,69 +410,292 @@ class TLoop(HasTraits):
 
     regularization = True
 
+    method = Enum('segments', 'global')
+    '''Identification of the bond law:
+    segments - the bond values are found one by one for the slips w_arr,
+    global - the bond values at slip_global are fitted to the whole
+    curve at once, see eval_global.
+    '''
+
+    slip_global = Array
+    '''Breakpoints of the bond law of the global fit, w_arr if empty.
+    '''
+
+    bond_0 = Array
+    '''Initial bond values of the global fit, the pull-out force
+    distributed uniformly over the embedded length if empty.
+    '''
+
+    alpha = Float(0.)
+    '''Weight of the smoothing of the global fit, the second differences
+    of the bond values are added to the residuals.
+    '''
+
+    n_sub = Int(5)
+    '''Number of the load steps between two points of w_arr in the
+    forward runs of the global fit.
+    '''
+
+    bond_cov = Array
+    '''Covariance of the fitted bond values estimated from the residuals
+    and the Jacobian at the solution of the global fit.
+    '''
+
+    warm_start = Bool(True)
+    '''Start each root-finding trial from the converged state of the
+    previous trial at the same slip instead of sub-stepping from the
+    checkpoint at slip[-2].
+    '''
+
+    k_warm = Int(10)
+    '''Maximum number of iterations of a warm-started trial, the trial
+    is repeated with sub-steps from the checkpoint if it is exceeded.
+    '''
+
+    root_finder = Enum('newton', 'brentq')
+    '''Root finding of the bond value of the newest segment:
+    newton - safeguarded Newton iterations with the sensitivity dF/dtau_i
+    obtained by direct differentiation,
+    brentq - bracketing on the whole range [tau_min, tau_max].
+    '''
+
+    tau_min = Float(1e-6)
+    tau_max = Float(1000.)
+
+    n_newton = Int(20)
+    '''Maximum number of the Newton iterations, brentq is used on the
+    narrowed bracket if it is exceeded.
+    '''
+
+    tau_tol = Float(1e-8)
+    '''Relative tolerance of tau_i of the Newton updates and of brentq.
+    The resolution of the pull-out force is limited by the tolerance
+    of the equilibrium iterations, smaller updates would be driven by
+    the round-off.
+    '''
+
+    _trial = Any
+    '''Converged state (eps, sig) of the last trial.
+    '''
+
+    _trial_states = Dict
+    '''Converged states of the trials of the current slip by tau_i.
+    '''
+
+    n_trials = Int(0)
+    '''Number of the forward solves of the last evaluation.
+    '''
+
+    n_failed = Int(0)
+    '''Number of the segments of the last evaluation for which the
+    root finding failed and the bond value was set to zero.
+    '''
+
+    line_search = Instance(LineSearch)
+    '''Optional backtracking line search along the corrector iterations
+    of the forward solves.
+    '''
+
     # the pull out force corresponding to crack opening w_i and bond stress
     # tau_i
     def pf(self, tau_i, w_i, eps, sig):
+        self.n_trials += 1
+        self.ts.mats_eval.bond[-1] = tau_i
+        F = None
+        if self.warm_start and self._trial is not None:
+            F, eps_temp, sig_temp = self.solve_warm(*self._trial)
+        if F is None:
+            F, eps_temp, sig_temp = self.solve_substeps(w_i, eps, sig, 10)
+        self._trial = (eps_temp, sig_temp)
+        self._trial_states[tau_i] = self._trial
+        return F
+
+    def pf_dpf(self, tau_i, w_i, eps, sig):
+        '''Return the pull-out force and its derivative with respect to
+        the bond value of the newest segment.
+        '''
+        F = self.pf(tau_i, w_i, eps, sig)
+        dF = self.ts.get_dF_dbond(self.ts.K, *self._trial)
+        return F, dF[-1]
+
+    def newton_tau(self, w_i, pf_i, eps, sig):
+        '''Find the bond value of the newest segment reproducing the
+        pull-out force pf_i at the slip w_i.
+
+        The Newton iterations start from the bond value of the previous
+        breakpoint. The pull-out force increases with tau_i, the bracket
+        [tau_min, tau_max] is narrowed with every trial and a bisection
+        step replaces the Newton step leaving the bracket.
+        '''
+        lo, hi = self.tau_min, self.tau_max
+        tau_i = np.clip(self.ts.mats_eval.bond[-2], lo, hi)
+        for _ in range(self.n_newton):
+            F, dF = self.pf_dpf(tau_i, w_i, eps, sig)
+            r = F - pf_i
+            if r < 0:
+                lo = tau_i
+            else:
+                hi = tau_i
+            tau_new = tau_i - r / dF if dF > 0 else hi
+            if not lo < tau_new < hi:
+                tau_new = 0.5 * (lo + hi)
+            if abs(r) < self.tolerance or \
+                    abs(tau_new - tau_i) <= self.tau_tol * abs(tau_i):
+                return tau_i
+            tau_i = tau_new
+        return brentq(lambda tau: self.pf(tau, w_i, eps, sig) - pf_i,
+                      lo, hi, xtol=self.tau_tol * self.tau_min,
+                      rtol=self.tau_tol)
+
+    def corr_pred(self, step_flag, d_U_k, eps, sig, d_t, norm_R_prev,
+                  search=False):
+        '''Apply the increment d_U_k to the state eps, sig, scaled by
+        the line search if search is True and a line search is set.
+
+        Return the tuple (s, F_ext, R, K, eps, sig, norm_R) with
+        the step length s and the constrained residuum R.
+        '''
+        if search and self.line_search is not None:
+            return self.line_search.search(self.ts, d_U_k, eps, sig,
+                                           norm_R_prev, 0., d_t)
+        R, K, eps, sig = self.ts.get_corr_pred(
+            step_flag, d_U_k, eps, sig, 0., d_t)
+        F_ext = -R
+        K.apply_constraints(R)
+        return 1., F_ext, R, K, eps, sig, np.linalg.norm(R)
+
+    def solve_warm(self, eps, sig):
+        '''Equilibrate the state of the previous trial for the current
+        bond law, the slip at the loaded end is kept.
+
+        Return the pull-out force and the state or None if the
+        iterations do not converge within k_warm.
+        '''
         eps_temp = np.copy(eps)
         sig_temp = np.copy(sig)
-        dw = w_i - self.ts.mats_eval.slip[-2]
-        n = 10.
-        d_t = dw / n
-        self.ts.mats_eval.bond[-1] = tau_i
-#         print d_t, 'dt'
-        for _ in range(int(n)):
-            step_flag = 'predictor'
-            d_U_k = np.zeros(self.ts.domain.n_dofs)
-            k = 0
-            while k < self.k_max:
-                R, K, eps_temp, sig_temp = self.ts.get_corr_pred(
-                    step_flag, d_U_k, eps_temp, sig_temp, 0., d_t)
-                F_ext = -R
-                K.apply_constraints(R)
-                d_U_k = K.solve()
-                k += 1
-                if k == self.k_max:
-                    print(tau_i)
-                    print(np.linalg.norm(R))
-                    raise Exception('Non convergence')
-                step_flag = 'corrector'
-                if np.linalg.norm(R) < self.tolerance:
-                    #                     print F_ext[-1]
-                    break
-        return F_ext[-1]
-
-    def update_eps_sig(self, w_i, eps, sig):
-
+        d_U_k = np.zeros(self.ts.domain.n_dofs)
+        norm_R = 0.
+        for k in range(self.k_warm):
+            # all increments are correctors
+            F_ext, R, K, eps_temp, sig_temp, norm_R = self.corr_pred(
+                'corrector', d_U_k, eps_temp, sig_temp, 0., norm_R,
+                search=k > 0)[1:]
+            if norm_R < self.tolerance:
+                return F_ext[-1], eps_temp, sig_temp
+            if not np.isfinite(norm_R):
+                break
+            d_U_k = K.solve()
+        return None, None, None
+
+    def solve_substeps(self, w_i, eps, sig, n, w_0=None):
+        '''Increase the slip at the loaded end from w_0 (default slip[-2])
+        to w_i in n steps starting from the state eps, sig.
+
+        Return the pull-out force and the state at w_i.
+        '''
         eps_temp = np.copy(eps)
         sig_temp = np.copy(sig)
-        dw = w_i - self.ts.mats_eval.slip[-2]
-        n = 20.
+        if w_0 is None:
+            w_0 = self.ts.mats_eval.slip[-2]
+        dw = w_i - w_0
         d_t = dw / n
-
         for _ in range(int(n)):
             step_flag = 'predictor'
             d_U_k = np.zeros(self.ts.domain.n_dofs)
+            norm_R = 0.
             k = 0
             while k < self.k_max:
-                R, K, eps_temp, sig_temp = self.ts.get_corr_pred(
-                    step_flag, d_U_k, eps_temp, sig_temp, 0., d_t)
-                F_ext = -R
-                K.apply_constraints(R)
+                # the first increment carries the prescribed slip
+                F_ext, R, K, eps_temp, sig_temp, norm_R = self.corr_pred(
+                    step_flag, d_U_k, eps_temp, sig_temp, d_t, norm_R,
+                    search=k > 1)[1:]
                 d_U_k = K.solve()
                 k += 1
                 if k == self.k_max:
-                    print(np.linalg.norm(R))
+                    print(self.ts.mats_eval.bond[-1])
+                    print(norm_R)
                     raise Exception('Non convergence')
                 step_flag = 'corrector'
-                if np.linalg.norm(R) < self.tolerance:
+                if norm_R < self.tolerance:
                     break
+        return F_ext[-1], eps_temp, sig_temp
+
+    def update_eps_sig(self, w_i, eps, sig):
+        F, eps_temp, sig_temp = self.solve_substeps(w_i, eps, sig, 20)
         return eps_temp, sig_temp
 
     def pf_w(self, w):
         return np.interp(w, self.w_arr, self.pf_arr)
 
+    def forward(self, bond):
+        '''Pull-out forces at w_arr[1:] for the bond values at the
+        breakpoints slip_global and their derivatives with respect to
+        the bond values [n_w - 1, n_bond].
+
+        The derivatives follow from the direct differentiation of the
+        converged states along the loading path (get_dF_dbond), i.e. one
+        linear solve per bond value instead of a forward run.
+        '''
+        self.n_trials += 1
+        ts = self.ts
+        ts.mats_eval.slip = list(self.slip_global)
+        ts.mats_eval.bond = list(bond)
+        n_e = ts.domain.n_active_elems
+        eps = np.zeros((n_e, ts.fets_eval.n_gp, ts.mats_eval.n_s))
+        sig = np.zeros_like(eps)
+        j = np.arange(len(bond))
+        F, dF = [], []
+        for w_0, w_i in zip(self.w_arr[:-1], self.w_arr[1:]):
+            F_i, eps, sig = self.solve_substeps(w_i, eps, sig, self.n_sub,
+                                                w_0=w_0)
+            F.append(F_i)
+            dF.append(ts.get_dF_dbond(ts.K, eps, sig, j)[:, -1])
+        return np.array(F), np.array(dF)
+
+    def eval_global(self):
+        '''Fit all bond values to the whole pull-out curve with
+        scipy.optimize.least_squares.
+
+        The Jacobian is obtained from the forward run evaluating the
+        residuum, see forward. Return the breakpoints and the bond values.
+        '''
+        self.ts.apply_essential_bc()
+        self.n_trials = 0
+        if len(self.slip_global) == 0:
+            self.slip_global = self.w_arr
+        n_b = len(self.slip_global)
+        bond_0 = self.bond_0
+        if len(bond_0) == 0:
+            bond_0 = np.interp(self.slip_global, self.w_arr,
+                               self.pf_arr) / self.ts.L_x
+        # second differences of the bond values
+        D2 = np.sqrt(self.alpha) * np.diff(np.eye(n_b), 2, axis=0)
+        cache = {}
+
+        def fun_jac(bond):
+            key = bond.tobytes()
+            if key not in cache:
+                cache.clear()
+                F, dF = self.forward(bond)
+                cache[key] = (np.hstack((F - self.pf_arr[1:], D2.dot(bond))),
+                              np.vstack((dF, D2)))
+            return cache[key]
+
+        res = least_squares(lambda b: fun_jac(b)[0], bond_0,
+                            jac=lambda b: fun_jac(b)[1],
+                            bounds=(0., self.tau_max), x_scale='jac')
+        # covariance of the bond values from the linearized problem
+        m = len(self.w_arr) - 1
+        s2 = np.sum(res.fun[:m] ** 2) / max(m - n_b, 1)
+        self.bond_cov = s2 * np.linalg.pinv(res.jac.T.dot(res.jac))
+        self.ts.mats_eval.bond = list(res.x)
+        return self.ts.mats_eval.slip, self.ts.mats_eval.bond
+
     def eval(self):
 
+        if self.method == 'global':
+            return self.eval_global()
+
         self.ts.apply_essential_bc()
         n_dofs = self.ts.domain.n_dofs
         n_e = self.ts.domain.n_active_elems
@@ -412,6 +706,8 @@ class TLoop(HasTraits):
         sig = np.zeros((n_e, n_ip, n_s))
 
         i = 0
+        self.n_trials = 0
+        self.n_failed = 0
 
         eps1 = np.copy(eps)
         sig1 = np.copy(sig)
@@ -422,13 +718,21 @@ class TLoop(HasTraits):
             self.ts.mats_eval.slip.append(self.w_arr[i])
             self.ts.mats_eval.bond.append(0.)
             print(self.w_arr[i])
+            self._trial = None
+            self._trial_states = {}
 
             def tau(tau_i):
                 return self.pf(
                     tau_i, self.w_arr[i], eps1, sig1
                 ) - self.pf_arr[i]
             try:
-                tau_i = brentq(tau, 1e-6, 1000., xtol=1e-16)
+                if self.root_finder == 'newton':
+                    tau_i = self.newton_tau(
+                        self.w_arr[i], self.pf_arr[i], eps1, sig1)
+                else:
+                    tau_i = brentq(
+                        tau, self.tau_min, self.tau_max,
+                        xtol=self.tau_tol * self.tau_min, rtol=self.tau_tol)
             except:
                 #                 print "range not correct f(a)*f(b)>0"
                 print(tau(0.1))
@@ -438,12 +742,19 @@ class TLoop(HasTraits):
 #                 plt.ylabel('bond [N/mm]')
 #                 plt.show()
                 tau_i = 0.
+                self.n_failed += 1
 
             print(tau_i)
             print('=============')
             self.ts.mats_eval.bond[-1] = tau_i
 #
-            eps1, sig1 = self.update_eps_sig(self.w_arr[i], eps1, sig1)
+            # the root finders return one of the evaluated trials, its
+            # converged state is taken over instead of solving the step
+            # once more
+            if tau_i in self._trial_states:
+                eps1, sig1 = self._trial_states[tau_i]
+            else:
+                eps1, sig1 = self.update_eps_sig(self.w_arr[i], eps1, sig1)
 
             # regularization
             if self.regularization:
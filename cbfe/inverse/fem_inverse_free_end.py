@@ -14,17 +14,21 @@ Created on 19.01.2016
 '''
 from envisage.ui.workbench.api import WorkbenchApplication
 from mayavi.sources.api import VTKDataSource, VTKFileReader
-from traits.api import implements, Int, Array, HasTraits, Instance, \
-    Property, cached_property, Constant, Float, List
+from traits.api import provides, Int, Array, HasTraits, Instance, \
+    Property, cached_property, Constant, Float, List, on_trait_change, Bool
 from ibvpy.api import BCDof
 from ibvpy.fets.fets_eval import FETSEval, IFETSEval
 from ibvpy.mats.mats1D import MATS1DElastic
 from ibvpy.mats.mats1D5.mats1D5_bond import MATS1D5Bond
 from ibvpy.mesh.fe_grid import FEGrid
 from mathkit.matrix_la.sys_mtx_assembly import SysMtxAssembly
+from cbfe.bond_law import PiecewiseLinearLaw
+from cbfe.geo_kernel import GeoKernel
+from cbfe.nls_control import LineSearch
 import matplotlib.pyplot as plt
 import numpy as np
 import sys
+import time
 from scipy.interpolate import interp1d
 from scipy.optimize import newton, brentq, bisect, minimize_scalar
 
@@ -41,16 +45,39 @@ class MATSEval(HasTraits):
 
     bond = List([0., 15.5])
 
+    bond_law = Instance(PiecewiseLinearLaw)
+    '''Tabulated bond-slip law following slip and bond. Appending a point
+    and changing a single bond value update the law in O(1), the other
+    changes rebuild it.
+    '''
+
+    def _bond_law_default(self):
+        return PiecewiseLinearLaw(slip=self.slip, bond=self.bond,
+                                  symmetric=False)
+
+    @on_trait_change('slip, bond, slip_items, bond_items')
+    def _update_bond_law(self, name, new):
+        slip, bond = self.slip, self.bond
+        if len(slip) != len(bond):
+            # wait for the change of the other list
+            return
+        law = self.bond_law
+        n = len(law.slip)
+        if name.endswith('_items') and not new.removed and \
+                len(new.added) == 1 and new.index == n == len(slip) - 1:
+            law.append(slip[-1], bond[-1])
+        elif name == 'bond_items' and n == len(bond) and \
+                len(new.added) == len(new.removed) == 1:
+            law.set_bond(new.index, bond[new.index])
+        else:
+            law.trait_set(slip=slip, bond=bond)
+
     def b_s_law(self, x):
-        return np.interp(x, self.slip, self.bond)
+        return self.bond_law.get_tau_G(x)[0]
 
     # the tangential stiffness of the bond interface
     def G(self, x):
-        d = np.diff(self.bond) / np.diff(self.slip)
-        d = np.append(d, d[-1])
-        G = interp1d(
-            np.array(self.slip), d, kind='zero', fill_value=(0, 0), bounds_error=False)
-        return G(np.abs(x))
+        return self.bond_law.get_tau_G(x)[1]
 
     def get_corr_pred(self, eps, d_eps, sig, t_n, t_n1):
         n_e, n_ip, n_s = eps.shape
@@ -58,7 +85,7 @@ class MATSEval(HasTraits):
         D[:,:, 0, 0] = self.E_m
         D[:,:, 2, 2] = self.E_f
         try:
-            D[:,:, 1, 1] = self.G(eps[:,:, 1])
+            tau, D[:,:, 1, 1] = self.bond_law.get_tau_G(eps[:,:, 1])
         except:
             print(np.array(self.slip))
             print(eps[:,:, 1])
@@ -66,20 +93,19 @@ class MATSEval(HasTraits):
         d_sig = np.einsum('...st,...t->...s', D, d_eps)
         sig += d_sig
 
-        sig[:,:, 1] = self.b_s_law(eps[:,:, 1])
+        sig[:,:, 1] = tau
         return sig, D
 
     n_s = Constant(3)
 
 
+@provides(IFETSEval)
 class FETS1D52ULRH(FETSEval):
 
     '''
     Fe Bar 2 nodes, deformation
     '''
 
-    implements(IFETSEval)
-
     debug_on = True
 
     A_m = Float(100. * 100. - 2.2, desc='matrix area [mm2]')
@@ -273,10 +299,19 @@ class TStepper(HasTraits):
 
         return B
 
+    geo_kernel = Property(depends_on='L_x, n_e_x, fets_eval.A_f, '
+                          'fets_eval.A_m, fets_eval.L_b')
+    '''Geometric factors of the element matrices and internal forces.
+    '''
+    @cached_property
+    def _get_geo_kernel(self):
+        return GeoKernel(w_ip=self.fets_eval.ip_weights, A=self.A,
+                         B=self.B, J_det=self.J_det)
+
     def apply_essential_bc(self):
         '''Insert initial boundary conditions at the start up of the calculation.. 
         '''
-        self.K = SysMtxAssembly()
+        self.K = SysMtxAssembly(matrix_type='banded')
         for bc in self.bc_list:
             bc.apply_essential(self.K)
 
@@ -297,14 +332,9 @@ class TStepper(HasTraits):
         n_dof_r, n_dim_dof = self.fets_eval.dof_r.shape
         n_nodal_dofs = self.fets_eval.n_nodal_dofs
         n_el_dofs = n_dof_r * n_nodal_dofs
-        # [ i ]
-        w_ip = fets_eval.ip_weights
-
         d_u_e = d_U[elem_dof_map]
-        #[n_e, n_dof_r, n_dim_dof]
-        d_u_n = d_u_e.reshape(n_e, n_dof_r, n_nodal_dofs)
         #[n_e, n_ip, n_s]
-        d_eps = np.einsum('einsd,end->eis', self.B, d_u_n)
+        d_eps = self.geo_kernel.get_d_eps(d_u_e)
 
         # update strain
         eps += d_eps
@@ -316,16 +346,14 @@ class TStepper(HasTraits):
 
         # system matrix
         self.K.reset_mtx()
-        Ke = np.einsum('i,s,einsd,eist,eimtf,ei->endmf',
-                       w_ip, self.A, self.B, D, self.B, self.J_det)
+        Ke = self.geo_kernel.get_Ke(D)
 
         self.K.add_mtx_array(
             Ke.reshape(-1, n_el_dofs, n_el_dofs), elem_dof_map)
 
         # internal forces
-        # [n_e, n_n, n_dim_dof]
-        Fe_int = np.einsum('i,s,eis,einsd,ei->end',
-                           w_ip, self.A, sig, self.B, self.J_det)
+        # [n_e, n_el_dofs]
+        Fe_int = self.geo_kernel.get_Fe_int(sig)
         F_int = -np.bincount(elem_dof_map.flatten(), weights=Fe_int.flatten())
         self.apply_bc(step_flag, self.K, F_int, t_n, t_n1)
         return F_int, self.K, eps, sig
@@ -345,45 +373,103 @@ class TLoop(HasTraits):
     U_record = [np.zeros(42)]
     F_record = [np.zeros(42)]
 
+    n = Int(4, auto_set=False, enter_set=True)
+    '''Number of the identified segments averaged by the regularization.
+    '''
+
     regularization = True
 
+    beta = Float(0.5)
+    '''Weight of the free end residual in eval_coupled, 0 - only the
+    loaded end curve (w_arr, pf_arr), 1 - only the free end curve
+    (w_free, f_free).
+    '''
+
+    step_times = List
+    '''Timing of the steps of the last eval_coupled run, tuples
+    (w_i, number of trials, time of the root finding, time of the
+    checkpoint update).
+    '''
+
+    print_times = Bool(False)
+    '''Print the timing of the steps at the end of eval_coupled.
+    '''
+
+    n_failed = Int(0)
+    '''Number of the segments of the last eval_coupled run for which the
+    root finding failed and the bond value was set to zero.
+    '''
+
+    line_search = Instance(LineSearch)
+    '''Optional backtracking line search along the corrector iterations
+    of the forward solves.
+    '''
+
     # the pull out force corresponding to crack opening w_i and bond stress
     # tau_i
     def pf(self, tau_i, w_i, eps, sig):
+        F, U, eps_temp, sig_temp = self.solve_trial(
+            tau_i, w_i, eps, sig, self.U_k)
+        print(U[1])
+        print('##############')
+        return F - np.interp(U[1], self.w_free, self.f_free)
+#         return F_ext[-1] - np.interp(U[-1], self.w_arr, self.pf_arr)
+
+    def corr_pred(self, step_flag, d_U_k, eps, sig, d_t, norm_R_prev,
+                  search=False):
+        '''Apply the increment d_U_k to the state eps, sig, scaled by
+        the line search if search is True and a line search is set.
+
+        Return the tuple (s, F_ext, R, K, eps, sig, norm_R) with
+        the step length s and the constrained residuum R.
+        '''
+        if search and self.line_search is not None:
+            return self.line_search.search(self.ts, d_U_k, eps, sig,
+                                           norm_R_prev, 0., d_t)
+        R, K, eps, sig = self.ts.get_corr_pred(
+            step_flag, d_U_k, eps, sig, 0., d_t)
+        F_ext = -R
+        K.apply_constraints(R)
+        return 1., F_ext, R, K, eps, sig, np.linalg.norm(R)
+
+    def solve_trial(self, tau_i, w_i, eps, sig, U_k, n=10):
+        '''Increase the slip at the loaded end from slip[-2] to w_i
+        in n steps for the bond value tau_i of the newest segment
+        starting from the state eps, sig with the displacements U_k.
+
+        Return the pull-out force, the displacements and the state at w_i.
+        '''
         eps_temp = np.copy(eps)
         sig_temp = np.copy(sig)
         dw = w_i - self.ts.mats_eval.slip[-2]
-        n = 10.
         d_t = dw / n
         self.ts.mats_eval.bond[-1] = tau_i
-        U = np.copy(self.U_k)
-#         print d_t, 'dt'
+        U = np.copy(U_k)
         for _ in range(int(n)):
             step_flag = 'predictor'
             d_U = np.zeros(self.ts.domain.n_dofs)
             d_U_k = np.zeros(self.ts.domain.n_dofs)
             k = 0
+            norm_R = 0.
             while k < self.k_max:
-                R, K, eps_temp, sig_temp = self.ts.get_corr_pred(
-                    step_flag, d_U_k, eps_temp, sig_temp, 0., d_t)
-                F_ext = -R
-                K.apply_constraints(R)
+                # the first increment carries the prescribed slip
+                s, F_ext, R, K, eps_temp, sig_temp, norm_R = self.corr_pred(
+                    step_flag, d_U_k, eps_temp, sig_temp, d_t, norm_R,
+                    search=k > 1)
+                d_U += (s - 1.) * d_U_k
                 d_U_k = K.solve()
                 d_U += d_U_k
                 k += 1
                 if k == self.k_max:
                     print(tau_i)
-                    print(np.linalg.norm(R))
+                    print(norm_R)
                     raise Exception('Non convergence')
                 step_flag = 'corrector'
-                if np.linalg.norm(R) < self.tolerance:
+                if norm_R < self.tolerance:
                     #                     print F_ext[-1]
                     U += d_U
                     break
-        print(U[1])
-        print('##############')
-        return F_ext[-1] - np.interp(U[1], self.w_free, self.f_free)
-#         return F_ext[-1] - np.interp(U[-1], self.w_arr, self.pf_arr)
+        return F_ext[-1], U, eps_temp, sig_temp
 
     def update_eps_sig(self, w_i, eps, sig):
 
@@ -398,19 +484,21 @@ class TLoop(HasTraits):
             d_U = np.zeros(self.ts.domain.n_dofs)
             d_U_k = np.zeros(self.ts.domain.n_dofs)
             k = 0
+            norm_R = 0.
             while k < self.k_max:
-                R, K, eps_temp, sig_temp = self.ts.get_corr_pred(
-                    step_flag, d_U_k, eps_temp, sig_temp, 0., d_t)
-                F_ext = -R
-                K.apply_constraints(R)
+                # the first increment carries the prescribed slip
+                s, F_ext, R, K, eps_temp, sig_temp, norm_R = self.corr_pred(
+                    step_flag, d_U_k, eps_temp, sig_temp, d_t, norm_R,
+                    search=k > 1)
+                d_U += (s - 1.) * d_U_k
                 d_U_k = K.solve()
                 d_U += d_U_k
                 k += 1
                 if k == self.k_max:
-                    print(np.linalg.norm(R))
+                    print(norm_R)
                     raise Exception('Non convergence')
                 step_flag = 'corrector'
-                if np.linalg.norm(R) < self.tolerance:
+                if norm_R < self.tolerance:
                     #                     print self.F_record.shape
                     #                     print F_ext.shape
                     self.U_k += d_U
@@ -465,7 +553,7 @@ class TLoop(HasTraits):
 
             # regularization
             if self.regularization:
-                n = 4
+                n = self.n
                 if i % float(n) == 0.:
                     b_avg = np.mean(self.ts.mats_eval.bond[-n:])
                     s_avg = np.mean(self.ts.mats_eval.slip[-n:])
@@ -494,6 +582,100 @@ class TLoop(HasTraits):
 
         return self.ts.mats_eval.slip, self.ts.mats_eval.bond
 
+    def eval_coupled(self):
+        '''Identify the bond law from the loaded end and the free end
+        curves in one incremental pass.
+
+        The bond value of the newest segment is the root of the weighted
+        residual (1 - beta) r_loaded + beta r_free. Both residuals are
+        evaluated from the same trial solution, the free end curve at
+        the free end slip of the trial. The converged state of the root
+        is taken over as the checkpoint of the next step. If no root is
+        bracketed or a trial does not converge, the bond value of the
+        segment is set to zero and counted in n_failed.
+        '''
+        ts = self.ts
+        ts.apply_essential_bc()
+        n_dofs = ts.domain.n_dofs
+        n_e = ts.domain.n_active_elems
+        eps = np.zeros((n_e, ts.fets_eval.n_gp, ts.mats_eval.n_s))
+        sig = np.zeros_like(eps)
+        # checkpoint at slip[-2] and the one before the averaged segments
+        state = state_0 = (eps, sig, np.zeros(n_dofs))
+        self.step_times = []
+        self.n_failed = 0
+
+        for i in range(1, len(self.w_arr)):
+            w_i = self.w_arr[i]
+            ts.mats_eval.slip.append(w_i)
+            ts.mats_eval.bond.append(0.)
+            trials = {}
+
+            def residual(tau_i):
+                F, U, eps_t, sig_t = self.solve_trial(
+                    tau_i, w_i, state[0], state[1], state[2])
+                trials[tau_i] = (eps_t, sig_t, U)
+                r_loaded = F - self.pf_w(w_i)
+                r_free = F - np.interp(U[1], self.w_free, self.f_free)
+                return (1. - self.beta) * r_loaded + self.beta * r_free
+
+            t_0 = time.time()
+            try:
+                tau_i = brentq(residual, 0.00001, 1000., xtol=1e-16)
+            except ValueError:
+                print('no root at w = %g, bond set to zero' % w_i)
+                tau_i = 0.
+                self.n_failed += 1
+            except Exception:
+                # the trial at one of the bracket ends did not converge
+                print('non convergence at w = %g, bond set to zero' % w_i)
+                tau_i = 0.
+                self.n_failed += 1
+            t_1 = time.time()
+            n_trials = len(trials)
+            ts.mats_eval.bond[-1] = tau_i
+            if tau_i in trials:
+                state = trials[tau_i]
+            else:
+                _, U, eps, sig = self.solve_trial(tau_i, w_i, *state, n=20)
+                state = (eps, sig, U)
+
+            # regularization
+            if self.regularization:
+                n = self.n
+                if i % float(n) == 0.:
+                    b_avg = np.mean(ts.mats_eval.bond[-n:])
+                    s_avg = np.mean(ts.mats_eval.slip[-n:])
+                    del ts.mats_eval.bond[-n:]
+                    del ts.mats_eval.slip[-n:]
+                    ts.mats_eval.bond.append(b_avg)
+                    ts.mats_eval.slip.append(s_avg)
+                    U, eps, sig = self.solve_trial(
+                        b_avg, s_avg, *state_0, n=20)[1:]
+                    state = state_0 = (eps, sig, U)
+            self.step_times.append((w_i, n_trials, t_1 - t_0,
+                                    time.time() - t_1))
+
+        if self.print_times:
+            self.print_timing()
+        return ts.mats_eval.slip, ts.mats_eval.bond
+
+    def print_timing(self):
+        '''Print the timing of the steps of the last eval_coupled run.
+        '''
+        print('%10s %8s %10s %10s %10s' %
+              ('w', 'trials', 'root [s]', 'trial [s]', 'update [s]'))
+        if not self.step_times:
+            return
+        for w_i, n_trials, t_root, t_update in self.step_times:
+            print('%10.4f %8d %10.3f %10.4f %10.3f' %
+                  (w_i, n_trials, t_root, t_root / max(n_trials, 1),
+                   t_update))
+        w, n_trials, t_root, t_update = np.array(self.step_times).T
+        print('%10s %8d %10.3f %10.4f %10.3f' %
+              ('total', np.sum(n_trials), np.sum(t_root),
+               np.sum(t_root) / max(np.sum(n_trials), 1), np.sum(t_update)))
+
 if __name__ == '__main__':
 
     #=========================================================================
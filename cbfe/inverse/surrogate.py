@@ -0,0 +1,272 @@
+'''
+Surrogate-assisted calibration of the bond-slip law.
+
+The bond values at fixed slips are the parameters of the calibration.
+A radial basis function interpolation of the pull-out curves computed
+so far approximates the map from the parameters to the pull-out curve.
+The candidates minimizing the misfit of the surrogate curve are
+confirmed with the finite element model (cbfe.sweep.pullout) and added
+to the interpolation, until the best confirmed curve does not improve.
+
+The confirmed runs are kept in a cbfe.sweep.ResultStore with one
+directory per geometry (L_x, A_m, A_f, L_b, E_m, E_f) and n_e_x, so
+that the calibration of the next specimen of a series starts from
+the runs of the previous ones. The runs with load steps which did not
+converge are kept in the store as well, but they are not used.
+
+@author: Yingxiong
+'''
+import os
+
+from scipy.interpolate import RBFInterpolator
+from scipy.optimize import minimize
+from scipy.stats import qmc
+from traits.api import HasTraits, Array, Dict, Str, Int, Float, \
+    Property, cached_property
+
+from cbfe.sweep import ParametricSweep, ResultStore
+import numpy as np
+
+
+class SurrogateCalibration(HasTraits):
+
+    geometry = Dict
+    '''Parameters of the specimen series, i.e. L_x, A_m, A_f, L_b, E_m
+    and E_f. The missing parameters take the defaults of the model.
+    '''
+
+    n_e_x = Int(20)
+    '''Number of elements of the finite element model.
+    '''
+
+    slip = Array(float)
+    '''Slips of the points of the bond-slip law.
+    '''
+
+    bond_min = Array(float)
+    '''Lower bounds of the bond values at the slips.
+    '''
+
+    bond_max = Array(float)
+    '''Upper bounds of the bond values, a bond value with equal
+    bounds is fixed.
+    '''
+
+    w_arr = Array(float)
+    '''Measured loaded end displacements.
+    '''
+
+    pf_arr = Array(float)
+    '''Measured pull-out forces.
+    '''
+
+    cache_dir = Str('surrogate_cache')
+    '''Directory of the stores of all geometries.
+    '''
+
+    n_init = Int(0)
+    '''Number of the runs of the initial design, 0 - twice the number
+    of the free bond values plus one.
+    '''
+
+    n_candidates = Int(5000)
+    '''Number of the random candidates evaluated with the surrogate
+    in each iteration.
+    '''
+
+    n_confirm = Int(3)
+    '''Number of the candidates confirmed by the finite element model
+    in each iteration.
+    '''
+
+    n_iter = Int(10)
+    '''Maximum number of iterations.
+    '''
+
+    kernel = Str('thin_plate_spline')
+    '''Kernel of scipy.interpolate.RBFInterpolator.
+    '''
+
+    tolerance = Float(1e-3)
+    '''Required relative decrease of the best confirmed misfit.
+    '''
+
+    n_workers = Int(1)
+    '''Number of the processes of the finite element runs, see
+    ParametricSweep.
+    '''
+
+    seed = Int(0)
+
+    geometry_all = Property(depends_on='geometry')
+    '''Parameters of the specimen series with the missing ones set to
+    the defaults of the model.
+    '''
+    @cached_property
+    def _get_geometry_all(self):
+        from cbfe.fe_nls_solver_incre import TStepper
+        ts = TStepper()
+        geometry = {'L_x': ts.L_x, 'A_m': ts.fets_eval.A_m,
+                    'A_f': ts.fets_eval.A_f, 'L_b': ts.fets_eval.L_b,
+                    'E_m': ts.mats_eval.E_m, 'E_f': ts.mats_eval.E_f}
+        geometry.update(self.geometry)
+        return geometry
+
+    store = Property(depends_on='cache_dir, geometry, n_e_x')
+    '''Store of the runs of the current geometry.
+    '''
+    @cached_property
+    def _get_store(self):
+        key = ResultStore().get_key(dict(self.geometry_all,
+                                         n_e_x=self.n_e_x))
+        return ResultStore(path=os.path.join(self.cache_dir, key))
+
+    free = Property(depends_on='bond_min, bond_max')
+    '''Mask of the calibrated bond values.
+    '''
+    @cached_property
+    def _get_free(self):
+        return self.bond_max > self.bond_min
+
+    def get_bond(self, x):
+        '''Return the bond values for the scaled parameters x in [0, 1],
+        x is shaped [..., n_free].
+        '''
+        x = np.asarray(x)
+        bond = np.broadcast_to(
+            self.bond_min, x.shape[:-1] + self.bond_min.shape).copy()
+        lo, hi = self.bond_min[self.free], self.bond_max[self.free]
+        bond[..., self.free] = lo + (hi - lo) * x
+        return bond
+
+    def get_x(self, bond):
+        '''Return the scaled parameters of the bond values.
+        '''
+        lo, hi = self.bond_min[self.free], self.bond_max[self.free]
+        return (bond[..., self.free] - lo) / (hi - lo)
+
+    def get_misfit(self, pf):
+        '''Root mean square deviation of the curves pf [..., n_w] from
+        the measured one.
+        '''
+        return np.sqrt(np.mean((pf - self.pf_arr) ** 2, axis=-1))
+
+    def get_runs(self):
+        '''Return the bond values [n_runs, n_pts] and the pull-out
+        curves at w_arr [n_runs, n_w] of the stored runs of the
+        current slips reaching the largest measured displacement.
+        The runs with load steps which did not converge are skipped.
+        '''
+        params, results = self.store.load()
+        bond, pf = [], []
+        for i in range(len(params.get('bond', []))):
+            if not np.array_equal(params['slip'][i], self.slip) or \
+                    params['u'][i] < self.w_arr[-1] or \
+                    results['n_failed'][i] > 0:
+                continue
+            bond.append(params['bond'][i])
+            pf.append(np.interp(self.w_arr, results['U'][i],
+                                results['F'][i]))
+        n_pts, n_w = len(self.slip), len(self.w_arr)
+        return np.reshape(bond, (-1, n_pts)), np.reshape(pf, (-1, n_w))
+
+    def run(self, bond):
+        '''Evaluate the bond laws [n_runs, n_pts] with the finite
+        element model and add the results to the store.
+        '''
+        fixed = dict(self.geometry_all, n_e_x=self.n_e_x,
+                     u=self.w_arr[-1], slip=list(self.slip))
+        ParametricSweep(grid={'bond': [list(b) for b in bond]},
+                        fixed=fixed, store=self.store,
+                        n_workers=self.n_workers).run()
+
+    def propose(self, surrogate, x_known, rng):
+        '''Return the scaled parameters of the candidates with the
+        smallest surrogate misfit which are not evaluated yet.
+        '''
+        n_free = x_known.shape[1]
+        x = rng.rand(self.n_candidates, n_free)
+        misfit = self.get_misfit(surrogate(x))
+        order = np.argsort(misfit)
+
+        def f(x_):
+            return self.get_misfit(surrogate(x_[None, :]))[0]
+
+        proposed = []
+        for i, x_c in enumerate(x[order]):
+            if i == 0:
+                # polish the best candidate on the surrogate
+                x_c = minimize(f, x_c, method='L-BFGS-B',
+                               bounds=[(0., 1.)] * n_free).x
+            x_all = np.vstack([x_known] + proposed)
+            if np.min(np.linalg.norm(x_all - x_c, axis=1)) > 1e-3:
+                proposed.append(x_c[None, :])
+            if len(proposed) == self.n_confirm:
+                break
+        return np.vstack(proposed) if proposed else np.zeros((0, n_free))
+
+    def eval(self):
+        '''Run the calibration.
+
+        Return the bond values of the best confirmed run
+        and its pull-out curve at w_arr.
+        '''
+        rng = np.random.RandomState(self.seed)
+        n_free = np.sum(self.free)
+        n_init = self.n_init or 2 * n_free + 1
+
+        bond, pf = self.get_runs()
+        if len(bond) < n_init:
+            x = qmc.LatinHypercube(d=n_free, seed=self.seed).random(
+                n_init - len(bond))
+            self.run(self.get_bond(x))
+            bond, pf = self.get_runs()
+        print('%d runs in the store' % len(bond))
+
+        misfit_best = np.min(self.get_misfit(pf))
+        for k in range(self.n_iter):
+            x_known = self.get_x(bond)
+            surrogate = RBFInterpolator(x_known, pf, kernel=self.kernel)
+            x = self.propose(surrogate, x_known, rng)
+            if len(x) == 0:
+                break
+            self.run(self.get_bond(x))
+            bond, pf = self.get_runs()
+            misfit = np.min(self.get_misfit(pf))
+            print('iteration %d: %d runs, misfit %g' % (k, len(bond), misfit))
+            if misfit > (1. - self.tolerance) * misfit_best:
+                break
+            misfit_best = misfit
+
+        i_best = np.argmin(self.get_misfit(pf))
+        return bond[i_best], pf[i_best]
+
+
+if __name__ == '__main__':
+
+    import matplotlib.pyplot as plt
+    from cbfe.sweep import pullout
+
+    geometry = {'L_x': 100., 'A_m': 100. * 8. - 9. * 1.85,
+                'A_f': 9. * 1.85, 'L_b': 1., 'E_m': 28484., 'E_f': 170000.}
+    slip = [0., 0.1, 0.5, 1.0]
+
+    # measured curve generated by the model
+    w_arr = np.linspace(0., 1., 30)
+    ref = pullout(u=1.0, n_e_x=20, slip=slip, bond=[0., 40., 50., 30.],
+                  **geometry)
+    pf_arr = np.interp(w_arr, ref['U'], ref['F'])
+
+    sc = SurrogateCalibration(geometry=geometry, slip=slip,
+                              bond_min=[0., 0., 0., 0.],
+                              bond_max=[0., 100., 100., 100.],
+                              w_arr=w_arr, pf_arr=pf_arr)
+    bond, pf = sc.eval()
+    print('bond', bond)
+
+    plt.plot(w_arr, pf_arr, 'k--', label='measured')
+    plt.plot(w_arr, pf, label='calibrated')
+    plt.xlabel('displacement [mm]')
+    plt.ylabel('pull-out force [N]')
+    plt.legend(loc='best')
+    plt.show()
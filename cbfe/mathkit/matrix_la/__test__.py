@@ -3,7 +3,7 @@
 import unittest
 
 from numpy import array, zeros, arange, array_equal, hstack, dot
-from numpy import array, zeros, arange, array_equal, sqrt
+from numpy import array, zeros, arange, array_equal, sqrt, allclose
 from scipy.linalg import solve, norm
 
 from .coo_mtx import COOSparseMtx
@@ -85,18 +85,70 @@ class TestSysMtxSolver(unittest.TestCase):
         u = self.sys_K.solve(self.rhs, matrix_type='dense')
         self.assertTrue(array_equal(u, self.la_u))
 
+    def test_csr_sparse_mtx(self):
+        '''Construct the compressed row matrix and solve it.
+        '''
+        u = self.sys_K.solve(self.rhs, matrix_type='csr')
+        self.assertTrue(allclose(u, self.la_u))
+
+    def test_csr_pattern_reuse(self):
+        '''Refill the values of the compressed row matrix
+        while keeping the sparsity pattern.
+        '''
+        K = SysMtxAssembly(matrix_type='csr')
+        dof_map, mtx_arr = get_bar_mtx_array(shape=10)
+        K.register_constraint(a=0, u_a=0.)
+        R = zeros(11)
+        R[-1] = 1.
+        K.add_mtx_array(dof_map_arr=dof_map, mtx_arr=mtx_arr)
+        u1 = K.solve(R.copy())
+        csr_pattern = K.csr_pattern
+        K.reset_mtx()
+        K.add_mtx_array(dof_map_arr=dof_map, mtx_arr=2 * mtx_arr)
+        u2 = K.solve(R.copy())
+        self.assertTrue(K.csr_pattern is csr_pattern)
+        self.assertTrue(allclose(u1, 2 * u2))
+        self.assertTrue(allclose(u1, arange(11) / 10.))
+
+    def test_banded_mtx(self):
+        '''Construct the band storage and solve it.
+        '''
+        u = self.sys_K.solve(self.rhs, matrix_type='banded')
+        self.assertEqual(self.sys_K.bandwidth, 1)
+        self.assertTrue(allclose(u, self.la_u))
+
+    def test_csr_factor_reuse(self):
+        '''Reuse the factorization of the previous solution.
+        '''
+        K = SysMtxAssembly(matrix_type='csr')
+        dof_map, mtx_arr = get_bar_mtx_array(shape=10)
+        K.register_constraint(a=0, u_a=0.)
+        R = zeros(11)
+        R[-1] = 1.
+        K.add_mtx_array(dof_map_arr=dof_map, mtx_arr=mtx_arr)
+        u1 = K.solve(R.copy())
+        K.reset_mtx()
+        K.add_mtx_array(dof_map_arr=dof_map, mtx_arr=2 * mtx_arr)
+        u2 = K.solve(R.copy(), reuse_factor=True)
+        self.assertEqual(K.n_factorizations, 1)
+        self.assertTrue(allclose(u1, u2))
+        u3 = K.solve(R.copy())
+        self.assertEqual(K.n_factorizations, 2)
+        self.assertTrue(allclose(u1, 2 * u3))
+
 
 class TestSysMtxConstraints(unittest.TestCase):
     '''
     Test functionality connected with the application of
     constraints.
     '''
+    matrix_type = 'coord'
 
     def test_bar1(self):
         '''Clamped bar loaded at the right end with unit displacement
         [00]-[01]-[02]-[03]-[04]-[05]-[06]-[07]-[08]-[09]-[10]
         'u[0] = 0, u[10] = 1'''
-        K = SysMtxAssembly()
+        K = SysMtxAssembly(matrix_type=self.matrix_type)
         dof_map, mtx_arr = get_bar_mtx_array(shape=10)
         K.add_mtx_array(dof_map_arr=dof_map, mtx_arr=mtx_arr)
         K.register_constraint(a=0,  u_a=0.)  # clamped end
@@ -118,7 +170,7 @@ class TestSysMtxConstraints(unittest.TestCase):
         [11]-[12]-[13]-[14]-[15]-[16]-[17]-[18]-[19]-[20]-[21]
         u[0] = 0, u[5] = u[16], R[-1] = R[21] = 10
         '''
-        K = SysMtxAssembly()
+        K = SysMtxAssembly(matrix_type=self.matrix_type)
         dof_map1, mtx_arr1 = get_bar_mtx_array(shape=10)
         K.add_mtx_array(dof_map_arr=dof_map1, mtx_arr=mtx_arr1)
         dof_map2, mtx_arr2 = get_bar_mtx_array(shape=10)
@@ -166,7 +218,7 @@ class TestSysMtxConstraints(unittest.TestCase):
         [0]-[1]-[2]-[3]
         u[1] = 0.2 * u[2], u[2] = 0.2 * u[3], R[3] = 10
         '''
-        K = SysMtxAssembly()
+        K = SysMtxAssembly(matrix_type=self.matrix_type)
         dof_map, mtx_arr = get_bar_mtx_array(shape=3)
         K.add_mtx_array(dof_map_arr=dof_map, mtx_arr=mtx_arr)
         K.register_constraint(a=0, u_a=0.)  # clamped end
@@ -200,7 +252,7 @@ class TestSysMtxConstraints(unittest.TestCase):
         '''Clamped bar 3 domains, each with 2 elems (displ at right end)
         [0]-[1]-[2] [3]-[4]-[5] [6]-[7]-[8]
         u[0] = 0, u[2] = u[3], u[5] = u[6], u[8] = 1'''
-        K = SysMtxAssembly()
+        K = SysMtxAssembly(matrix_type=self.matrix_type)
         dof_map1, mtx_arr1 = get_bar_mtx_array(shape=2)
         K.add_mtx_array(dof_map_arr=dof_map1, mtx_arr=mtx_arr1)
         dof_map2, mtx_arr2 = get_bar_mtx_array(shape=2)
@@ -228,7 +280,7 @@ class TestSysMtxConstraints(unittest.TestCase):
         [0]-[1]-[2]-[3]-[4]
             [5]-[6]-[7]'''
         # 'u[0] = 0, u[1] = u[5], u[3] = u[7], u[4] = 1'
-        K = SysMtxAssembly()
+        K = SysMtxAssembly(matrix_type=self.matrix_type)
         dof_map1, mtx_arr1 = get_bar_mtx_array(shape=4)
         K.add_mtx_array(dof_map_arr=dof_map1, mtx_arr=mtx_arr1)
         dof_map2, mtx_arr2 = get_bar_mtx_array(shape=2)
@@ -257,7 +309,7 @@ class TestSysMtxConstraints(unittest.TestCase):
         [0]-[1]-[2]-[3]-[4]
               [5]-[6]
         u[0] = 0, u[1] = u[5], u[3] = u[7], u[4] = 1'''
-        K = SysMtxAssembly()
+        K = SysMtxAssembly(matrix_type=self.matrix_type)
         dof_map1, mtx_arr1 = get_bar_mtx_array(shape=4)
         K.add_mtx_array(dof_map_arr=dof_map1, mtx_arr=mtx_arr1)
         dof_map2, mtx_arr2 = get_bar_mtx_array(shape=1)
@@ -282,7 +334,7 @@ class TestSysMtxConstraints(unittest.TestCase):
         [5]-[6]-[7]-[8]-[9]
         [0]-[1]-[2]-[3]-[4]
         u[5] = u[0], u[0] = 0, u[4] = u[9], R[4] = 1'''
-        K = SysMtxAssembly()
+        K = SysMtxAssembly(matrix_type=self.matrix_type)
         dof_map1, mtx_arr1 = get_bar_mtx_array(shape=4)
         K.add_mtx_array(dof_map_arr=dof_map1, mtx_arr=mtx_arr1)
         dof_map2, mtx_arr2 = get_bar_mtx_array(shape=4)
@@ -315,7 +367,7 @@ class TestSysMtxConstraints(unittest.TestCase):
         applied for corner and edge constrains.
         [0]-[1]
         u[0] = 0, u[1] = 0, u[1] = 4'''
-        K = SysMtxAssembly()
+        K = SysMtxAssembly(matrix_type=self.matrix_type)
         dof_map1, mtx_arr1 = get_bar_mtx_array(shape=1)
         K.add_mtx_array(dof_map_arr=dof_map1, mtx_arr=mtx_arr1)
         # add constraints
@@ -336,7 +388,7 @@ class TestSysMtxConstraints(unittest.TestCase):
         (simulating the deactivation of elements)
         [0]-[1]
         u[0] = 0, u[1] = 0'''
-        K = SysMtxAssembly()
+        K = SysMtxAssembly(matrix_type=self.matrix_type)
 
         dof_map1, mtx_arr1 = get_bar_mtx_array(shape=1, k=0.)
         K.add_mtx_array(dof_map_arr=dof_map1, mtx_arr=mtx_arr1)
@@ -358,7 +410,7 @@ class TestSysMtxConstraints(unittest.TestCase):
         (simulating the deactivation of elements)
         [0]-[1]-[2]-[3]-[4]  [5]-[6]
         u[0] = 0, u[4] = u[5]  u[6] = 0, K[5,6] = 0, R[3] = 1'''
-        K = SysMtxAssembly()
+        K = SysMtxAssembly(matrix_type=self.matrix_type)
         dof_map1, mtx_arr1 = get_bar_mtx_array(shape=4)
         K.add_mtx_array(dof_map_arr=dof_map1, mtx_arr=mtx_arr1)
         dof_map2, mtx_arr2 = get_bar_mtx_array(shape=1, k=0.)
@@ -384,7 +436,7 @@ class TestSysMtxConstraints(unittest.TestCase):
         (simulating the deactivation of elements)
         [0]-[1]-[2]-[3]-[4]  [5]-[6]
         u[0] = 0, u[4] = u[5]  u[6] = 0, K[5,6] = 0, R[3] = 1'''
-        K = SysMtxAssembly()
+        K = SysMtxAssembly(matrix_type=self.matrix_type)
         dof_map2, mtx_arr2 = get_bar_mtx_array(shape=1, k=0)
         K.add_mtx_array(dof_map_arr=dof_map2, mtx_arr=mtx_arr2)
         dof_map1, mtx_arr1 = get_bar_mtx_array(shape=4)
@@ -404,3 +456,40 @@ class TestSysMtxConstraints(unittest.TestCase):
                      dtype=float)
         for uu, ue in zip(u, u_ex):
             self.assertAlmostEqual(uu, ue)
+
+
+class TestSysMtxBandedConstraints(TestSysMtxConstraints):
+    '''
+    Test the constraints included in the band storage.
+    '''
+    matrix_type = 'banded'
+
+
+class TestSysMtxBulkConstraints(TestSysMtxConstraints):
+    '''
+    Test the elimination of constraints on the assembled
+    sparse matrix in a single pass.
+    '''
+    matrix_type = 'csr'
+
+    def test_rhs_modification(self):
+        '''The right hand side is modified in the same way
+        as by the constraints included in the matrix arrays.
+        [0]-[1]-[2]-[3]-[4]  [5]-[6]
+        u[0] = 0.5, u[4] = u[5]  u[6] = 0, R[3] = 1'''
+        R_list = []
+        for matrix_type in ['coord', 'csr']:
+            K = SysMtxAssembly(matrix_type=matrix_type)
+            dof_map1, mtx_arr1 = get_bar_mtx_array(shape=4)
+            K.add_mtx_array(dof_map_arr=dof_map1, mtx_arr=mtx_arr1)
+            dof_map2, mtx_arr2 = get_bar_mtx_array(shape=1)
+            K.add_mtx_array(dof_map_arr=dof_map2 + 5, mtx_arr=mtx_arr2)
+            K.register_constraint(a=6, u_a=0.)
+            K.register_constraint(a=0, u_a=0.5)
+            K.register_constraint(a=4, alpha=[1], ix_a=[5])
+            R = zeros(K.n_dofs)
+            R[3] = 1
+            R[4] = 2
+            K.apply_constraints(R)
+            R_list.append(R)
+        self.assertTrue(allclose(R_list[0], R_list[1]))
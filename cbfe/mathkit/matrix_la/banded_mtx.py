@@ -0,0 +1,78 @@
+'''
+Band storage of the system matrix for discretizations with
+a narrow band of non-zero values, e.g. one-dimensional chains
+of elements.
+'''
+from numpy import bincount, hstack
+from scipy.linalg import solve_banded
+from traits.api import HasTraits, Any, Property, cached_property
+
+from .csr_mtx import CSRSparsityPattern
+
+
+class BandedSparsityPattern(CSRSparsityPattern):
+
+    '''Sparsity pattern of the system matrix in the band storage
+    used by LAPACK, i.e. a[i, j] is stored at ab[bw + i - j, j].
+
+    The bandwidth bw is detected from the dof maps of the included
+    matrix arrays. The values of the flattened element matrices are
+    scattered directly into the band storage.
+    '''
+
+    bandwidth = Property(depends_on='dof_map_arrs, n_dofs')
+    '''Maximum distance of a non-zero entry from the diagonal.
+    '''
+    @cached_property
+    def _get_bandwidth(self):
+        i_l, j_l = self.ij_l
+        if i_l.shape[0] == 0:
+            return 0
+        return int(abs(i_l - j_l).max())
+
+    band_map = Property(depends_on='dof_map_arrs, n_dofs')
+    '''Scatter map from the flattened element values
+    into the flattened band storage.
+    '''
+    @cached_property
+    def _get_band_map(self):
+        i_l, j_l = self.ij_l
+        return (self.bandwidth + i_l - j_l) * self.n_dofs + j_l
+
+    def get_band(self, mtx_arrs):
+        '''Sum up the element values into the band storage.
+        '''
+        n_dofs = self.n_dofs
+        n_rows = 2 * self.bandwidth + 1
+        data_l = hstack([mtx_arr.ravel() for mtx_arr in mtx_arrs])
+        ab = bincount(self.band_map, weights=data_l,
+                      minlength=n_rows * n_dofs)
+        return ab.reshape(n_rows, n_dofs)
+
+
+class BandedMtx(HasTraits):
+
+    '''Matrix in band storage solved by the banded LU solver of LAPACK.
+
+    The constraints are included in the matrix arrays before
+    the band storage is filled. Since their diagonal values are
+    negative, the matrix is not positive definite and the general
+    banded solver is used instead of the Cholesky one.
+    '''
+
+    assemb = Any
+
+    mtx = Property
+
+    def _get_mtx(self):
+        sys_mtx_arrays = self.assemb.get_sys_mtx_arrays()
+        return self.assemb.banded_pattern.get_band(
+            [sys_mtx_arr.mtx_arr for sys_mtx_arr in sys_mtx_arrays])
+
+    def solve(self, rhs):
+        '''Construct the band storage and use the solver to get
+        the solution for the supplied rhs.
+        '''
+        bw = self.assemb.banded_pattern.bandwidth
+        return solve_banded((bw, bw), self.mtx, rhs,
+                            overwrite_ab=True, check_finite=False)
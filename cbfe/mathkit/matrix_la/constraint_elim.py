@@ -0,0 +1,138 @@
+'''
+Elimination of the essential constraints on the assembled sparse matrix.
+'''
+from numpy import array, fabs, hstack, ones, repeat, zeros
+from scipy import sparse
+from traits.api import HasTraits, Any, Int, List, Property, \
+    cached_property
+
+
+class ConstraintElimination(HasTraits):
+
+    '''Bulk elimination of the essential and linked constraints.
+
+    The constraints of the form
+
+        u[a] = u_a + sum( alpha * u[ix_a] )
+
+    are gathered in the sparse link matrix C and in the vector g
+    with the prescribed values, so that u = C u + P v + g,
+    where P is the projection on the unconstrained dofs and v
+    is the vector of independent unknowns. The chains of constraints
+    are resolved by the Neumann series of the nilpotent matrix C
+
+        L = (I - C)^-1 = I + C + C^2 + ...
+
+    The system K u = R is transformed to
+
+        T^T K T v = T^T (R - K L g),  with T = L P
+
+    in a single pass of sparse matrix products. The equations
+    of the constrained dofs are decoupled by keeping their negative
+    diagonal values. Then, v[a] = u_a and the remaining part of
+    the solution is recovered as u = T v + L g.
+    '''
+
+    constraints = List
+    '''Registered constraints.
+    '''
+
+    n_dofs = Int
+    '''Size of the equation system.
+    '''
+
+    a_arr = Property(depends_on='constraints, n_dofs')
+    '''Array of constrained dofs.
+    '''
+    @cached_property
+    def _get_a_arr(self):
+        return array([c.a for c in self.constraints], dtype='int_')
+
+    C_mtx = Property(depends_on='constraints, n_dofs')
+    '''Sparse matrix of link coefficients.
+    '''
+    @cached_property
+    def _get_C_mtx(self):
+        n_dofs = self.n_dofs
+        ix_a_list = [c.ix_a for c in self.constraints]
+        n_links = [ix_a.shape[0] for ix_a in ix_a_list]
+        rows = repeat(self.a_arr, n_links)
+        cols = hstack([zeros((0,), dtype='int_')] + ix_a_list)
+        vals = hstack([zeros((0,), dtype=float)] +
+                      [c.alpha for c in self.constraints])
+        return sparse.csr_matrix((vals, (rows, cols.astype('int_'))),
+                                 shape=(n_dofs, n_dofs))
+
+    L_mtx = Property(depends_on='constraints, n_dofs')
+    '''Inverse of (I - C) resolving chained constraints.
+    '''
+    @cached_property
+    def _get_L_mtx(self):
+        L_mtx = sparse.identity(self.n_dofs, format='csr')
+        C_k = self.C_mtx
+        for k in range(len(self.constraints) + 1):
+            C_k.eliminate_zeros()
+            if C_k.nnz == 0:
+                return L_mtx
+            L_mtx = L_mtx + C_k
+            C_k = C_k * self.C_mtx
+        raise ValueError('constraint chain longer than the number of '
+                         'constraints\nthis is probably due to cyclic '
+                         'constraints specification')
+
+    T_mtx = Property(depends_on='constraints, n_dofs')
+    '''Transformation from the independent to the full set of unknowns.
+    '''
+    @cached_property
+    def _get_T_mtx(self):
+        p_diag = ones(self.n_dofs, dtype=float)
+        p_diag[self.a_arr] = 0.
+        return sparse.csr_matrix(self.L_mtx *
+                                 sparse.diags(p_diag, format='csr'))
+
+    G_mtx = Property(depends_on='constraints, n_dofs')
+    '''Map from the prescribed values to the offsets of all dofs.
+    '''
+    @cached_property
+    def _get_G_mtx(self):
+        return sparse.csr_matrix(self.L_mtx[:, self.a_arr])
+
+    def get_u_a(self):
+        '''Return the current prescribed values of the constrained dofs.
+        '''
+        return array([c.u_a for c in self.constraints], dtype=float)
+
+    # offsets of the dofs due to the prescribed values
+    # from the last application
+    #
+    _g_vct = Any
+
+    def apply(self, K_mtx, rhs):
+        '''Eliminate the constraints from the sparse matrix K_mtx.
+
+        The right hand side is modified in place.
+        Return the transformed matrix.
+        '''
+        a_arr = self.a_arr
+        n_dofs = self.n_dofs
+        T_mtx = self.T_mtx
+        u_a = self.get_u_a()
+        self._g_vct = self.G_mtx * u_a
+
+        K_aa = K_mtx.diagonal()[a_arr]
+        singular = fabs(K_aa) < 1.0e-5
+        K_aa[singular] = 1.
+
+        rhs[:] = T_mtx.T * (rhs - K_mtx * self._g_vct)
+        rhs[a_arr] = -K_aa * u_a
+
+        K_a_mtx = sparse.csr_matrix((-K_aa, (a_arr, a_arr)),
+                                    shape=(n_dofs, n_dofs))
+        return sparse.csr_matrix(T_mtx.T * K_mtx * T_mtx) + K_a_mtx
+
+    def get_u(self, v_vct):
+        '''Recover the full solution from the independent unknowns.
+        '''
+        if self._g_vct is None:
+            return v_vct
+        return self.T_mtx * v_vct + self._g_vct
@@ -0,0 +1,135 @@
+'''
+Compressed row storage of the system matrix with a persistent
+sparsity pattern.
+'''
+from numpy import array_equal, bincount, cumsum, hstack, repeat, tile, \
+    unique, zeros
+from scipy import sparse
+from scipy.sparse.linalg import splu
+from traits.api import HasTraits, Any, Int, List, Property, \
+    cached_property
+
+
+class CSRSparsityPattern(HasTraits):
+
+    '''Sparsity pattern of the system matrix in the compressed row format.
+
+    The pattern is derived from the dof maps of the matrix arrays
+    included in the assembly. Besides the index arrays of the CSR format
+    it provides the scatter map assigning every value of the flattened
+    element matrices to its position in the data array of the CSR matrix.
+
+    As long as the dof maps do not change, the matrix is refilled by a
+    single bincount over the element values without rebuilding
+    the index structure.
+    '''
+
+    dof_map_arrs = List
+    '''List of dof maps of the included matrix arrays.
+    '''
+
+    n_dofs = Int
+    '''Size of the system matrix.
+    '''
+
+    def matches(self, dof_map_arrs, n_dofs):
+        '''Check if the pattern has been constructed for the given dof maps.
+        '''
+        if n_dofs != self.n_dofs or \
+                len(dof_map_arrs) != len(self.dof_map_arrs):
+            return False
+        for dof_map_arr, own_dof_map_arr in zip(dof_map_arrs,
+                                                self.dof_map_arrs):
+            if not array_equal(dof_map_arr, own_dof_map_arr):
+                return False
+        return True
+
+    ij_l = Property(depends_on='dof_map_arrs, n_dofs')
+    '''Row and column indices of the values in the flattened
+    element matrices.
+    '''
+    @cached_property
+    def _get_ij_l(self):
+        n_el_dofs_list = [dof_map_arr.shape[1]
+                          for dof_map_arr in self.dof_map_arrs]
+        i_l = hstack([repeat(dof_map_arr, n_el_dofs, axis=1).flatten()
+                      for dof_map_arr, n_el_dofs
+                      in zip(self.dof_map_arrs, n_el_dofs_list)])
+        j_l = hstack([tile(dof_map_arr, (1, n_el_dofs)).flatten()
+                      for dof_map_arr, n_el_dofs
+                      in zip(self.dof_map_arrs, n_el_dofs_list)])
+        return i_l.astype('int_'), j_l.astype('int_')
+
+    csr_map = Property(depends_on='dof_map_arrs, n_dofs')
+    '''Tuple of the CSR index arrays (indptr, indices) and of the scatter map
+    from the flattened element values into the CSR data array.
+    '''
+    @cached_property
+    def _get_csr_map(self):
+        i_l, j_l = self.ij_l
+        n_dofs = self.n_dofs
+        ij_keys, scatter_map = unique(i_l * n_dofs + j_l,
+                                      return_inverse=True)
+        indices = ij_keys % n_dofs
+        indptr = zeros(n_dofs + 1, dtype='int_')
+        indptr[1:] = cumsum(bincount(ij_keys // n_dofs, minlength=n_dofs))
+        return indptr, indices, scatter_map.flatten()
+
+    nnz = Property(depends_on='dof_map_arrs, n_dofs')
+    '''Number of stored entries of the system matrix.
+    '''
+    @cached_property
+    def _get_nnz(self):
+        return self.csr_map[1].shape[0]
+
+    def get_data(self, mtx_arrs):
+        '''Sum up the element values into the CSR data array.
+        '''
+        scatter_map = self.csr_map[2]
+        data_l = hstack([mtx_arr.ravel() for mtx_arr in mtx_arrs])
+        return bincount(scatter_map, weights=data_l, minlength=self.nnz)
+
+    def get_mtx(self, mtx_arrs):
+        '''Construct the CSR matrix for the given element values.
+        '''
+        indptr, indices, _ = self.csr_map
+        return sparse.csr_matrix((self.get_data(mtx_arrs), indices, indptr),
+                                 shape=(self.n_dofs, self.n_dofs))
+
+
+class CSRSparseMtx(HasTraits):
+
+    '''Sparse matrix in compressed row format.
+
+    The sparsity pattern is not constructed by the matrix itself.
+    It is obtained from the assembly which keeps it alive across
+    the iterations so that only the data array is refilled.
+
+    The constraints are eliminated by the assembly on the assembled
+    matrix (see ConstraintElimination). The solution of the reduced
+    system is mapped back to the full vector of unknowns.
+    '''
+
+    assemb = Any
+
+    mtx = Property
+
+    def _get_mtx(self):
+        sys_mtx_arrays = self.assemb.get_sys_mtx_arrays()
+        return self.assemb.csr_pattern.get_mtx(
+            [sys_mtx_arr.mtx_arr for sys_mtx_arr in sys_mtx_arrays])
+
+    def solve(self, rhs, reuse_factor=False):
+        '''Construct the matrix and use the solver to get
+        the solution for the supplied rhs.
+
+        The LU factorization is stored in the assembly. If reuse_factor
+        is set, the factorization from a previous solution is used
+        instead of factorizing the current matrix.
+        '''
+        assemb = self.assemb
+        if not reuse_factor or assemb.factor is None:
+            assemb.factor = splu(assemb.constrained_mtx.tocsc())
+            assemb.n_factorizations += 1
+        u_vct = assemb.factor.solve(rhs)
+        return assemb.constraint_elim.get_u(u_vct)
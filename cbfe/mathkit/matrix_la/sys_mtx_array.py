@@ -2,7 +2,7 @@
 from traits.api import \
     HasTraits, Int, Array, Property, cached_property, List, Trait, Dict, \
     Any
-from numpy import array, where, append
+from numpy import array, where, add
 
 class SysMtxArray( HasTraits ):
     '''Class managing an array of equally sized matrices with 
@@ -34,28 +34,22 @@ class SysMtxArray( HasTraits ):
         to zero.  
         '''
         el_arr, row_arr = dof_ix_array
-        for el, i_dof in zip( el_arr, row_arr ):
-            k_diag = self.mtx_arr[el, i_dof, i_dof]
-            self.mtx_arr[el, i_dof, :] = 0.0
-            self.mtx_arr[el, :, i_dof] = 0.0
+        self.mtx_arr[el_arr, row_arr, :] = 0.0
+        self.mtx_arr[el_arr, :, row_arr] = 0.0
 
     def _add_col_to_vector( self, dof_ix_array, F, factor ):
         '''Get the slice of the a-th column.
         (used for the implementation of the essential boundary conditions)
         '''
         el_arr, row_arr = dof_ix_array
-        for el, i_dof in zip( el_arr, row_arr ):
-            rows = self.dof_map_arr[el]
-            F[ rows ] += factor * self.mtx_arr[ el, :, i_dof ]
+        add.at( F, self.dof_map_arr[el_arr],
+                factor * self.mtx_arr[el_arr, :, row_arr] )
 
     def _get_diag_elem( self, dof_ix_array ):
         '''Get the value of diagonal element at a-ths dof. 
         '''
-        K_aa = 0.
         el_arr, row_arr = dof_ix_array
-        for el, i_dof in zip( el_arr, row_arr ):
-            K_aa += self.mtx_arr[el, i_dof, i_dof ]
-        return K_aa
+        return self.mtx_arr[el_arr, row_arr, row_arr].sum()
 
     def _add_diag_elem( self, dof_ix_array, K_aa ):
         '''Get the value of diagonal element at a-ths dof. 
@@ -66,12 +60,7 @@ class SysMtxArray( HasTraits ):
         self.mtx_arr[el, i_dof, i_dof ] = K_aa
 
     def _get_col_subvector( self, dof_ix_array ):
-        idx_arr = array( [], dtype = int )
-        val_arr = array( [], dtype = float )
         el_arr, row_arr = dof_ix_array
-        for el, i_dof in zip( el_arr, row_arr ):
-            r_dofs = self.dof_map_arr[el]
-            idx_arr = append( idx_arr, r_dofs )
-            val_arr = append( val_arr, self.mtx_arr[ el, :, i_dof ] )
-
+        idx_arr = self.dof_map_arr[el_arr].flatten()
+        val_arr = self.mtx_arr[el_arr, :, row_arr].flatten()
         return idx_arr, val_arr
@@ -3,15 +3,15 @@ from math import fabs
 
 from numpy import allclose, arange, eye, linalg, ones, ix_, array, zeros, \
     hstack, meshgrid, vstack, dot, newaxis, c_, r_, copy, where, \
-    ones, append, unique, compress, array_equal, allclose
-from numpy import allclose, arange, eye, linalg, ones, ix_, array, zeros, \
-    hstack, meshgrid, vstack, dot, newaxis, c_, r_, copy, where, \
-    ones, append, unique, compress, array_equal, allclose
+    ones, append, unique, compress, array_equal, allclose, add
 from traits.api import \
     HasTraits, Int, Array, Property, cached_property, List, Trait, Dict, \
     Any, Bool, Float
 
+from .banded_mtx import BandedMtx, BandedSparsityPattern
+from .constraint_elim import ConstraintElimination
 from .coo_mtx import COOSparseMtx
+from .csr_mtx import CSRSparseMtx, CSRSparsityPattern
 from .dense_mtx import DenseMtx
 from .sys_mtx_array import SysMtxArray
 
@@ -87,6 +87,14 @@ class SysMtxAssembly(HasTraits):
     of the format
 
         [el, row]
+
+    For the 'csr' matrix type, the constraints are not included
+    in the matrix arrays. Instead, they are eliminated in a single
+    vectorized pass on the assembled sparse matrix using the
+
+        constraint_elim = Property()
+
+    (see ConstraintElimination).
     '''
     # list of matrix arrays
     #
@@ -108,7 +116,52 @@ class SysMtxAssembly(HasTraits):
     #
     matrix_type = Trait('coord',
                         {'dense': DenseMtx,
-                         'coord': COOSparseMtx})
+                         'coord': COOSparseMtx,
+                         'csr': CSRSparseMtx,
+                         'banded': BandedMtx})
+
+    # sparsity patterns kept alive across the iterations
+    # (used by the 'csr' and 'banded' matrix types)
+    #
+    _csr_pattern = Any
+    _banded_pattern = Any
+
+    def _update_pattern(self, pattern, pattern_class):
+        '''Return the sparsity pattern for the current dof maps.
+
+        The pattern is reconstructed only if the dof maps of the included
+        matrix arrays have changed, otherwise the cached one is reused.
+        '''
+        dof_map_arrs = [sys_mtx_arr.dof_map_arr
+                        for sys_mtx_arr in self.get_sys_mtx_arrays()]
+        n_dofs = self.n_dofs
+        if pattern is None or not pattern.matches(dof_map_arrs, n_dofs):
+            pattern = pattern_class(
+                dof_map_arrs=[dof_map_arr.copy()
+                              for dof_map_arr in dof_map_arrs],
+                n_dofs=n_dofs)
+        return pattern
+
+    csr_pattern = Property
+
+    def _get_csr_pattern(self):
+        self._csr_pattern = self._update_pattern(self._csr_pattern,
+                                                 CSRSparsityPattern)
+        return self._csr_pattern
+
+    banded_pattern = Property
+
+    def _get_banded_pattern(self):
+        self._banded_pattern = self._update_pattern(self._banded_pattern,
+                                                    BandedSparsityPattern)
+        return self._banded_pattern
+
+    bandwidth = Property
+
+    def _get_bandwidth(self):
+        '''Bandwidth of the system matrix detected from the dof maps.
+        '''
+        return self.banded_pattern.bandwidth
 
     # number of degrees of freedom
     #
@@ -133,7 +186,7 @@ class SysMtxAssembly(HasTraits):
     def add_mtx(self, mtx, dof_map=None):
         '''Add a single matrix with the dof map
         '''
-        if dof_map == None:
+        if dof_map is None:
             dof_map = arange(mtx.shape[0])
 
         sys_mtx_array = SysMtxArray(dof_map_arr=dof_map[None, ...],
@@ -145,7 +198,7 @@ class SysMtxAssembly(HasTraits):
     def add_link_mtx(self, mtx, dof_map=None):
         '''Add a single matrix with the dof map
         '''
-        if dof_map == None:
+        if dof_map is None:
             dof_map = arange(mtx.shape[0])
 
         link_mtx = SysMtxArray(dof_map_arr=dof_map[None, ...],
@@ -252,9 +305,22 @@ class SysMtxAssembly(HasTraits):
             cached_addresses.append(ix_maps)
         return cached_addresses
 
-    def solve(self, rhs=None, matrix_type=None):
+    # LU factorization of the constrained matrix
+    # (used by the 'csr' matrix type)
+    #
+    factor = Any
+
+    # number of performed factorizations
+    #
+    n_factorizations = Int(0)
+
+    def solve(self, rhs=None, matrix_type=None, reuse_factor=False):
         '''Solve the system of equations using a specified
         type of matrix format
+
+        For the 'csr' matrix type, the factorization of the
+        previous solution can be reused by setting reuse_factor.
+        The flag is ignored by the other matrix types.
         '''
 
         if self.debug:
@@ -263,13 +329,15 @@ class SysMtxAssembly(HasTraits):
         if rhs is None and self._rhs is None:
             raise ValueError('No right hand side available')
 
-        if not rhs is None:
-            self.apply_constraints(rhs)
-
         if matrix_type:
             self.matrix_type = matrix_type
 
+        if not rhs is None:
+            self.apply_constraints(rhs)
+
         mtx = self.matrix_type_(assemb=self)
+        if self.matrix_type == 'csr':
+            return mtx.solve(self._rhs, reuse_factor=reuse_factor)
         return mtx.solve(self._rhs)
 
     def reset(self):
@@ -277,6 +345,9 @@ class SysMtxAssembly(HasTraits):
         self.constraints = []
         self.link_matrices = []
         self._c = {}
+        self._csr_pattern = None
+        self._banded_pattern = None
+        self.factor = None
         self.rhs = None
 
     def reset_mtx(self):
@@ -290,7 +361,30 @@ class SysMtxAssembly(HasTraits):
         for constraint in self.constraints:
             print(constraint)
 
+    constraint_elim = Property(depends_on='constraints[], '
+                               'constraints.alpha, constraints.ix_a')
+    '''Engine eliminating all constraints on the assembled sparse matrix.
+    '''
+    @cached_property
+    def _get_constraint_elim(self):
+        return ConstraintElimination(constraints=self.sorted_constraints)
+
+    # sparse matrix with eliminated constraints
+    # (used by the 'csr' matrix type)
+    #
+    constrained_mtx = Any
+
     def apply_constraints(self, rhs):
+        if self.matrix_type == 'csr':
+            # assemble the sparse matrix and eliminate
+            # all constraints at once
+            constraint_elim = self.constraint_elim
+            constraint_elim.n_dofs = self.n_dofs
+            K_mtx = CSRSparseMtx(assemb=self).mtx
+            self.constrained_mtx = constraint_elim.apply(K_mtx, rhs)
+            self._rhs = rhs
+            return
+
         # apply the constraints
         for constraint, ix_maps in zip(self.sorted_constraints,
                                        self.cached_addresses):
@@ -351,23 +445,19 @@ class SysMtxAssembly(HasTraits):
 
         ix_mask = ix_orig_layout != a  # deactivate the constrained dof
 
-        prev_same_i_list = []
-        alpha_same_i_list = []
-        for i, ix in enumerate(ix_K):
-            prev_same_i = where(ix_K == ix)[0][0]
-            prev_same_i_list.append(prev_same_i)
-            if prev_same_i < i:
-                #                    K_n_a2[prev_same_i] += K_n_a2[i]
-                ix_mask[i] = False  # deactivate the added value
-
-            if ix in ix_a:
-                alpha_same_i = where(ix_a == ix)[0][0]
-                alpha_same_i_list.append(alpha_same_i)
-                alpha_same_i += ix_K.shape[0]
-#                    alpha2[i] = alpha2[ alpha_same_i ]
-                ix_mask[alpha_same_i] = False
-            else:
-                alpha_same_i_list.append(0)
+        # position of the first occurrence of each index in ix_K
+        n_K = ix_K.shape[0]
+        _, first_i, inv_i = unique(ix_K, return_index=True,
+                                   return_inverse=True)
+        prev_same_i_arr = first_i[inv_i.flatten()]
+        # deactivate the added values
+        ix_mask[:n_K] &= prev_same_i_arr == arange(n_K)
+
+        # position of the first occurrence of each index of ix_K in ix_a
+        same_ix_a = ix_K[:, None] == ix_a[None, :]
+        in_ix_a = same_ix_a.any(axis=1)
+        alpha_same_i_arr = same_ix_a.argmax(axis=1) * in_ix_a
+        ix_mask[n_K + alpha_same_i_arr[in_ix_a]] = False
 
 #            K_n_a     = compress( ix_mask, K_n_a2 )
         ix_layout = compress(ix_mask, ix_orig_layout)
@@ -419,7 +509,7 @@ class SysMtxAssembly(HasTraits):
 
         return (alpha, ix_a, dof_ix_array, link_dof_map,
                 ix_orig_layout, ix_layout, ix_mask, link_mtx,
-                array(prev_same_i_list, dtype='int_'), array(alpha_same_i_list, dtype='int_'))
+                prev_same_i_arr.astype('int_'), alpha_same_i_arr.astype('int_'))
 
     def _apply_constraint(self, rhs, constraint, ix_map):
         '''
@@ -473,17 +563,14 @@ class SysMtxAssembly(HasTraits):
 
             # ix_mask = ix_layout != a # deactivate the constrained dof
 
-            for i, ix in enumerate(ix_K):
-                #prev_same_i = where( ix_K == ix )[0][0]
-                prev_same_i = prev_same_i_array[i]
-                if prev_same_i < i:
-                    K_n_a2[prev_same_i] += K_n_a2[i]
+            # sum up the values of repeated indices
+            # at their first occurrence
+            n_K = ix_K.shape[0]
+            repeated = prev_same_i_array < arange(n_K)
+            add.at(K_n_a2, prev_same_i_array[repeated], K_n_a[repeated])
 
-                if ix in ix_a:
-                    #alpha_same_i = where( ix_a == ix )[0][0]
-                    alpha_same_i = alpha_same_i_array[i]
-                    alpha_same_i += ix_K.shape[0]
-                    alpha2[i] = alpha2[alpha_same_i]
+            in_ix_a = (ix_K[:, None] == ix_a[None, :]).any(axis=1)
+            alpha2[:n_K][in_ix_a] = alpha2[n_K + alpha_same_i_array[in_ix_a]]
 
             K_n_a = compress(ix_mask, K_n_a2)
             alpha = compress(ix_mask, alpha2)
@@ -554,13 +641,13 @@ class SysMtxAssembly(HasTraits):
             mtx_array._add_col_to_vector(dof_ix_array, F, factor)
 
     def _get_col_subvector(self, dof_ix_arrays):
-        idx_arr = array([], dtype=int)
-        val_arr = array([], dtype=float)
+        idx_segs = [array([], dtype=int)]
+        val_segs = [array([], dtype=float)]
         for mtx_array, dof_ix_array in zip(self.get_sys_mtx_arrays(), dof_ix_arrays):
             idx_seg, val_seg = mtx_array._get_col_subvector(dof_ix_array)
-            idx_arr = append(idx_arr, idx_seg)
-            val_arr = append(val_arr, val_seg)
-        return idx_arr, val_arr
+            idx_segs.append(idx_seg)
+            val_segs.append(val_seg)
+        return hstack(idx_segs), hstack(val_segs)
 
     def _get_diag_elem(self, dof_ix_arrays):
         K_dof_dof = 0
@@ -0,0 +1,269 @@
+import shutil
+import tempfile
+import unittest
+from unittest import mock
+
+from ibvpy.api import BCDof
+import numpy as np
+
+from cbfe.nls_control import LineSearch
+
+from . import cb as cb_module
+from .cb import NonLinearCB, resample
+from .fe_nls_solver_cb import TStepper, TLoop
+from .tensile_test import CompositeTensileTest
+
+
+class TestCrackBridgeTable(unittest.TestCase):
+    '''
+    Trilinear lookup of the tabulated crack bridge responses.
+    '''
+
+    @classmethod
+    def get_cb(cls, bond=[0., 100., 200., 300., 400., 500.]):
+        return NonLinearCB(slip=[0., 0.1, 0.2, 0.3, 0.4, 0.5], bond=bond,
+                           n_BC=4, n_sig_c=30, n_workers=1,
+                           cache_dir=cls.cache_dir)
+
+    @classmethod
+    def setUpClass(cls):
+        cls.cache_dir = tempfile.mkdtemp()
+        cls.cb = cls.get_cb()
+        cls.cb.table
+
+    @classmethod
+    def tearDownClass(cls):
+        shutil.rmtree(cls.cache_dir)
+
+    def test_library(self):
+        '''
+        A crack bridge with the same bond law reads the library.
+        '''
+        cb = self.get_cb()
+        with mock.patch.object(cb_module, 'run_cb',
+                               wraps=cb_module.run_cb) as run_cb:
+            table = cb.table
+        self.assertFalse(run_cb.called)
+        for field, field_ref in zip(table, self.cb.table):
+            self.assertTrue(np.array_equal(field, field_ref))
+
+    def test_library_key(self):
+        '''
+        The library is keyed by the bond law and the line search.
+        '''
+        path = self.cb.get_library()[1].path
+        self.assertEqual(self.get_cb().get_library()[1].path, path)
+        cb = self.get_cb(bond=[0., 100., 200., 300., 400., 600.])
+        self.assertNotEqual(cb.get_library()[1].path, path)
+        cb = self.get_cb()
+        cb.tloop.line_search = LineSearch()
+        path_ls = cb.get_library()[1].path
+        self.assertNotEqual(path_ls, path)
+        for name, value in [('beta', 0.7), ('c', 1e-3), ('n_max', 8)]:
+            cb = self.get_cb()
+            cb.tloop.line_search = LineSearch(**{name: value})
+            self.assertNotEqual(cb.get_library()[1].path, path_ls)
+
+    def test_resample(self):
+        '''
+        Rows linear in sig_c are resampled exactly, the levels outside
+        the records take the boundary rows.
+        '''
+        sig_c = np.array([0., 0.5, 0.5, 2., 3.])
+        field = np.outer(sig_c, [1., 2., 3.])
+        sig_c_arr = np.linspace(0., 4., 9)
+        expected = np.outer(np.minimum(sig_c_arr, 3.), [1., 2., 3.])
+        self.assertTrue(np.allclose(resample(sig_c, field, sig_c_arr),
+                                    expected))
+
+    def test_lookup_nodes(self):
+        '''
+        The lookup at the nodes of the table returns the tabulated values.
+        '''
+        cb = self.cb
+        n_z = cb.sig_m_table.shape[2]
+        for k in [0, 2, 3]:
+            BC = cb.BC_list[k]
+            z = np.linspace(0., BC, n_z)
+            for j in [0, 7, 29]:
+                self.assertTrue(np.allclose(
+                    cb.get_sig_m_z(z, BC, cb.sig_c_arr[j]),
+                    cb.sig_m_table[k, j]))
+                self.assertTrue(np.allclose(
+                    cb.get_eps_f_z(z, BC, cb.sig_c_arr[j]),
+                    cb.eps_f_table[k, j]))
+
+    def test_lookup_linear(self):
+        '''
+        The lookup is linear between the nodes along each axis
+        and broadcasts its arguments.
+        '''
+        cb = self.cb
+        BC_0, BC_1 = cb.BC_list[1:3]
+        BC = np.sqrt(BC_0 * BC_1)
+        sig_c = 0.5 * (cb.sig_c_arr[10] + cb.sig_c_arr[11])
+        z_rel = np.linspace(0., 1., 11)
+        value = cb.get_sig_m_z(z_rel[:, None] * BC, BC, [sig_c, sig_c])
+        self.assertEqual(value.shape, (11, 2))
+        expected = np.mean([cb.get_sig_m_z(z_rel * BC_k, BC_k, sig_c_j)
+                            for BC_k in (BC_0, BC_1)
+                            for sig_c_j in cb.sig_c_arr[10:12]], axis=0)
+        self.assertTrue(np.allclose(value[:, 0], expected))
+
+
+class TestTLoopCutback(unittest.TestCase):
+    '''
+    Cut-back of the load steps of the crack bridge time loop
+    at the softening of the bond law.
+    '''
+
+    slip = [0., 0.1, 0.2, 0.5]
+    bond = [0., 40., 60., 20.]
+
+    def get_tloop(self, **tl_params):
+        ts = TStepper(L_x=100., n_e_x=20)
+        ts.mats_eval.slip = self.slip
+        ts.mats_eval.bond = self.bond
+        n_dofs = ts.domain.n_dofs
+        ts.bc_list = [BCDof(var='u', dof=0, value=0.0),
+                      BCDof(var='u', dof=1, value=0.0),
+                      BCDof(var='u', dof=n_dofs - 1, value=0.5)]
+        return TLoop(ts=ts, **tl_params)
+
+    def test_rollback(self):
+        '''
+        The failed steps are repeated from the last converged state,
+        the recorded history follows the response of the fine steps.
+        '''
+        U_ref, F_ref = self.get_tloop(d_t=0.001).eval()[:2]
+
+        def matches_ref(U, F):
+            return np.allclose(F[:, -1], np.interp(
+                U[:, -1], U_ref[:, -1], F_ref[:, -1]), rtol=1e-6)
+        tl = self.get_tloop(d_t=0.25, k_max=3)
+        # continued from the failed state
+        self.assertFalse(matches_ref(*tl.eval()[:2]))
+        tl.adaptive = True
+        U, F = tl.eval()[:2]
+        # cut back and grown again
+        self.assertTrue(len(U) > 5)
+        self.assertAlmostEqual(U[-1, -1], 0.5)
+        self.assertTrue(np.all(np.diff(U[:, -1]) > 0))
+        self.assertTrue(matches_ref(U, F))
+
+
+class TestCompositeTensileTest(unittest.TestCase):
+    '''
+    Crack sequence of a tensile specimen with a small crack bridge
+    table, the table is computed once in a temporary cache directory.
+    '''
+
+    @classmethod
+    def setUpClass(cls):
+        cls.cache_dir = tempfile.mkdtemp()
+        cls.cb = NonLinearCB(slip=[0., 0.1, 0.2, 0.3, 0.4, 0.5],
+                             bond=[0., 100., 200., 300., 400., 500.],
+                             n_BC=6, n_workers=1, cache_dir=cls.cache_dir)
+        cls.cb.table
+
+    @classmethod
+    def tearDownClass(cls):
+        shutil.rmtree(cls.cache_dir)
+
+    def get_ctt(self, n_x=400, L=500., **kw):
+        sig_mu_x = 3. + np.random.RandomState(3).rand(n_x)
+        return CompositeTensileTest(n_x=n_x, L=L, cb=self.cb,
+                                    sig_mu_x=sig_mu_x, **kw)
+
+    def test_cracking_history_non_integer_x(self):
+        '''
+        The cracks of a fresh specimen are placed at the material points,
+        the grid coordinates are not integer.
+        '''
+        ctt = self.get_ctt(solver='batch')
+        sig_c_i, z_x_i, BC_x_i, sig_c_u, n_cracks = \
+            ctt.get_cracking_history()
+        self.assertTrue(n_cracks > 2)
+        for i in range(1, len(sig_c_i)):
+            # one new crack at a material point per cracking state
+            self.assertEqual(np.sum(z_x_i[i] == 0), i)
+        load_arr = np.linspace(0., sig_c_i[-1], 10)[1:]
+        w_dist = ctt.get_w_dist(sig_c_i, z_x_i, BC_x_i, load_arr)
+        self.assertEqual(len(w_dist), len(load_arr))
+        self.assertEqual(len(ctt.get_crack_opening(
+            z_x_i[-1], BC_x_i[-1], sig_c_i[-1])), n_cracks)
+
+    def test_cracking_history_full_recompute(self):
+        '''
+        The history with the cracking loads updated between the
+        neighbouring cracks equals the history recomputing the cracking
+        loads of all material points after each crack.
+        '''
+        ctt = self.get_ctt(solver='batch')
+        sig_c_i, z_x_i = ctt.get_cracking_history()[:2]
+
+        idx_0 = np.argmin(ctt.sig_mu_x)
+        ctt.y.append(ctt.x[idx_0])
+        sig_c_lst = [0., ctt.sig_mu_x[idx_0] * ctt.cb.E_c / ctt.cb.E_m]
+        while True:
+            sig_c, y_i = ctt.get_sig_c_i(sig_c_lst[-1])
+            if sig_c >= ctt.strength or sig_c == 1e6:
+                break
+            ctt.y.append(y_i)
+            sig_c_lst.append(sig_c)
+        self.assertTrue(np.array_equal(sig_c_i, sig_c_lst))
+        self.assertTrue(np.array_equal(ctt.x[z_x_i[-1] == 0], ctt.y_arr))
+
+    def test_sig_c_x_batch(self):
+        '''
+        The batched root solve equals brentq for each material point,
+        including the shielded points.
+        '''
+        ctt = self.get_ctt(n_x=200)
+        ctt.y = [40., 180., 330., 400.]
+        args = (ctt.sig_mu_x, ctt.z_x, ctt.BC_x, 0.)
+        sig_c_brentq = ctt.get_sig_c_x_i(ctt, *args)
+        sig_c_batch = ctt.get_sig_c_x_batch(*args)
+        self.assertTrue(np.any(sig_c_brentq == 1e6))
+        self.assertTrue(np.any(sig_c_brentq < 1e6))
+        self.assertTrue(np.array_equal(sig_c_brentq == 1e6,
+                                       sig_c_batch == 1e6))
+        self.assertTrue(np.allclose(sig_c_batch, sig_c_brentq,
+                                    rtol=1e-9, atol=1e-9))
+
+    def test_nearest_crack(self):
+        '''
+        z_x and the nearest cracks equal the dense distance matrix.
+        '''
+        ctt = self.get_ctt(n_x=301)
+        rng = np.random.RandomState(0)
+        for y_i in rng.choice(ctt.x, 12, replace=False):
+            ctt.y.append(y_i)
+            self.assertEqual(ctt.y_arr.dtype, float)
+            y = np.sort(ctt.y)
+            distance = np.abs(ctt.x[:, None] - y[None, :])
+            self.assertTrue(np.array_equal(ctt.y_arr, y))
+            self.assertTrue(np.array_equal(ctt.z_x, np.amin(distance, axis=1)))
+            self.assertTrue(np.array_equal(ctt.get_nearest_crack(y),
+                                           np.argmin(distance, axis=1)))
+
+    def test_w_arr(self):
+        '''
+        The crack openings from the cumulative integral equal
+        the trapezoidal integrals over the masked material points.
+        '''
+        ctt = self.get_ctt(n_x=301)
+        rng = np.random.RandomState(1)
+        y = np.sort(rng.choice(ctt.x, 7, replace=False))
+        eps_f_x, eps_m_x = rng.rand(ctt.n_x), rng.rand(ctt.n_x)
+        distance = np.abs(ctt.x[:, None] - y[None, :])
+        nearest_crack = y[np.argmin(distance, axis=1)]
+        w_arr = [np.trapz(eps_f_x[nearest_crack == y_i] -
+                          eps_m_x[nearest_crack == y_i],
+                          ctt.x[nearest_crack == y_i]) for y_i in y]
+        self.assertTrue(np.allclose(ctt.get_w_arr(eps_f_x, eps_m_x, y),
+                                    w_arr, rtol=1e-12, atol=1e-12))
+
+
+if __name__ == "__main__":
+    unittest.main()
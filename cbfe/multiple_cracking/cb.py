@@ -3,10 +3,14 @@ Created on 14.03.2017
 
 @author: Yingxiong
 '''
+import os
+
+from cbfe.eval_cache import get_cache_dir
+from cbfe.nls_control import LineSearch
+from cbfe.sweep import ParametricSweep, ResultStore
 from ibvpy.api import BCDof
-from scipy.interpolate import interp2d
 from traits.api import Int, HasTraits, Instance, \
-    Property, cached_property, Float, List
+    Property, cached_property, Float, List, Str
 
 import numpy as np
 
@@ -65,61 +69,114 @@ class NonLinearCB(HasTraits):
     # force [N] to control the maximum pull-out force
     max_w_p = Float(20 * 120 * 13)
 
-    interps = Property(depends_on='tstepper')
+    n_sig_c = Int(100)  # number of composite stress levels of the table
+
+    n_workers = Int(0)
+    '''number of the processes computing the crack bridges, 0 uses all
+    processors and 1 the current process
+    '''
+
+    cache_dir = Str
+    '''directory of the crack bridge libraries
+    '''
+
+    def _cache_dir_default(self):
+        return os.path.join(get_cache_dir(), 'crack_bridge')
+
+    table = Property(depends_on='tstepper, n_BC, L_max, L_min, n_sig_c')
+    '''the crack bridge responses tabulated on the regular grid
+    [BC, sig_c, z], i.e. the composite stress levels and the tables of
+    the matrix stress and of the reinforcement strain. The distance z
+    from the crack is related to the crack bridge length, the columns
+    correspond to the nodes from the crack (z = 0) to the end of the
+    crack bridge (z = BC).
+
+    The crack bridges are computed by run_cb in a pool of processes and
+    kept in a library on disk, i.e. in a subdirectory of cache_dir named
+    by the hash of the bond law, the material, the geometry and the
+    parameters of the time loop. Crack bridge lengths found in the
+    library are not computed again.
+
+    The worker processes construct the default model and apply only the
+    parameters listed in run_cb, other settings of tstepper and tloop,
+    e.g. a subclass of the material model, are not used.
+    '''
+    def get_library(self):
+        '''Return the parameters shared by the crack bridges and the
+        store of their library in cache_dir, keyed by the parameters.
+        '''
+        ts = self.tstepper
+        fixed = {'n_e_x': ts.n_e_x, 'slip': list(self.slip),
+                 'bond': list(self.bond),
+                 'E_m': ts.mats_eval.E_m, 'E_f': ts.mats_eval.E_f}
+        fixed.update((name, getattr(ts.fets_eval, name))
+                     for name in _fets_params)
+        fixed.update((name, getattr(self.tloop, name))
+                     for name in _tl_params)
+        if self.tloop.line_search is not None:
+            fixed['line_search'] = [getattr(self.tloop.line_search, name)
+                                    for name in _ls_params]
+        store = ResultStore(path=os.path.join(
+            self.cache_dir, ResultStore().get_key(fixed)))
+        return fixed, store
 
     @cached_property
-    def _get_interps(self):
-
-        interps_m = []
-        interps_f = []
-
-        print('preparing interploaters...')
-
-        for L in self.BC_list:
-
-            w = self.max_w_p / \
-                (self.tstepper.mats_eval.E_f * self.tstepper.fets_eval.A_f) * L \
-                + self.tstepper.mats_eval.slack * L
-
-            # Number of degrees of freedom
-            n_dofs = self.tstepper.domain.n_dofs
-            self.tstepper.bc_list = [BCDof(var='u', dof=0, value=0.0),
-                                     BCDof(var='u', dof=1, value=0.0),
-                                     BCDof(var='u', dof=n_dofs - 1, value=w)]
-            self.tstepper.L_x = L
-            U_record, F_record, tau_record, sig_m, eps_f = self.tloop.eval()
-            sig_m = self.avg_sig(sig_m)
-            eps_f = self.avg_eps(eps_f)
-
-            X = np.linspace(0, L, self.tstepper.n_e_x + 1)
-
-            sig_c = F_record[:, -1] / self.A_c
-
-            interp_m = interp2d(
-                X[::-1], sig_c, sig_m)
-
-            interps_m.append(interp_m)
+    def _get_table(self):
+        ts = self.tstepper
+        fixed, store = self.get_library()
+        w_list = [(self.max_w_p / (ts.mats_eval.E_f * ts.fets_eval.A_f) +
+                   ts.mats_eval.slack) * L for L in self.BC_list]
+
+        print('preparing crack bridge table...')
+
+        all_results = ParametricSweep(
+            grid={('L', 'w'): list(zip(self.BC_list, w_list))},
+            fixed=fixed, run_fn=run_cb, store=store,
+            n_workers=self.n_workers).run()
+
+        runs = []
+        for L, results in zip(self.BC_list, all_results):
+            if results is None:
+                raise ValueError('crack bridge of the length %g failed' % L)
+            F_record, sig_m, eps_f = \
+                results['F'], results['sig_m'], results['eps_f']
+            # the loaded end is the last node, reverse to start at z = 0
+            sig_m = self.avg_sig(sig_m)[:, ::-1]
+            eps_f = self.avg_eps(eps_f)[:, ::-1]
+
+            # sig_c must not decrease for the interpolation
+            sig_c = np.maximum.accumulate(F_record / self.A_c)
+
+            runs.append((sig_c, sig_m, eps_f))
+
+        sig_c_arr = np.linspace(
+            0, max(run[0][-1] for run in runs), self.n_sig_c)
+        sig_m_table = np.array([resample(sig_c, sig_m, sig_c_arr)
+                                for sig_c, sig_m, _ in runs])
+        eps_f_table = np.array([resample(sig_c, eps_f, sig_c_arr)
+                                for sig_c, _, eps_f in runs])
 
-            interp_f = interp2d(
-                X[::-1], sig_c, eps_f)
+        print('complete')
 
-            interps_f.append(interp_f)
+        return [sig_c_arr, sig_m_table, eps_f_table]
 
-        print('complete')
+    sig_c_arr = Property(depends_on='tstepper, n_BC, L_max, L_min, n_sig_c')
 
-        return [interps_m, interps_f]
+    @cached_property
+    def _get_sig_c_arr(self):
+        return self.table[0]
 
-    interps_m = Property(depends_on='tstepper')
+    sig_m_table = Property(depends_on='tstepper, n_BC, L_max, L_min, n_sig_c')
 
     @cached_property
-    def _get_interps_m(self):
-        return self.interps[0]
+    def _get_sig_m_table(self):
+        return self.table[1]
 
-    interps_f = Property(depends_on='tstepper')
+    eps_f_table = Property(depends_on='tstepper, n_BC, L_max, L_min, n_sig_c')
 
     @cached_property
-    def _get_interps_f(self):
-        return self.interps[1]
+    def _get_eps_f_table(self):
+        return self.table[2]
 
     def avg_sig(self, sig):
         '''average the stress on the integration points to the nodes'''
@@ -134,30 +191,111 @@ class NonLinearCB(HasTraits):
         eps = (eps[:, 0::2] + eps[:, 1::2]) / 2.
         return eps
 
-    def get_interp_idx(self, l):
-        i = min(np.sum(self.BC_list - l < 0), self.n_BC - 1)
-        return i
+    def lookup(self, table, z_arr, BC, load):
+        '''trilinear interpolation of the table [BC, sig_c, z] at the
+        distances z_arr, the crack bridge lengths BC and the composite
+        stresses load, the arguments are broadcast against each other.
+        BC is interpolated in the logarithmic scale of BC_list, values
+        outside the table are taken from its boundary.
+        '''
+        z_arr, BC, load = np.broadcast_arrays(
+            np.asarray(z_arr, dtype=float), np.asarray(BC, dtype=float),
+            np.asarray(load, dtype=float))
+        # undefined boundary condition, e.g. at the end of the specimen
+        BC = np.where(np.isnan(BC), self.L_min, BC)
+        n_BC, n_sig_c, n_z = table.shape
+        # fractional indices along the axes of the table
+        f_arr = [np.interp(np.log(BC), np.log(self.BC_list), np.arange(n_BC)),
+                 np.interp(load, self.sig_c_arr, np.arange(n_sig_c)),
+                 np.clip(z_arr / BC, 0., 1.) * (n_z - 1)]
+        i_arr = [np.minimum(f.astype(int), n - 1)
+                 for f, n in zip(f_arr, table.shape)]
+        b_0, s_0, z_0 = i_arr
+        b_1, s_1, z_1 = [np.minimum(i + 1, n - 1)
+                         for i, n in zip(i_arr, table.shape)]
+        w_b, w_s, w_z = [f - i for f, i in zip(f_arr, i_arr)]
+
+        def lerp_z(b, s):
+            return (1. - w_z) * table[b, s, z_0] + w_z * table[b, s, z_1]
+
+        def lerp_s(b):
+            return (1. - w_s) * lerp_z(b, s_0) + w_s * lerp_z(b, s_1)
+
+        return (1. - w_b) * lerp_s(b_0) + w_b * lerp_s(b_1)
 
     def get_sig_m_z(self, z_arr, BC, load):
-        def get_sig_m_i(self, z, BC, load):
-            idx = self.get_interp_idx(BC)
-            interp = self.interps_m[idx]
-            return interp(z, load)
-        v = np.vectorize(get_sig_m_i)
-        return v(self, z_arr, BC, load)
+        return self.lookup(self.sig_m_table, z_arr, BC, load)
 
     def get_eps_f_z(self, z_arr, BC, load):
-        def get_eps_f_i(self, z, BC, load):
-            idx = self.get_interp_idx(BC)
-            interp = self.interps_f[idx]
-            return interp(z, load)
-        v = np.vectorize(get_eps_f_i)
-        return v(self, z_arr, BC, load)
+        return self.lookup(self.eps_f_table, z_arr, BC, load)
+
+
+# crack bridge model of the worker process reused by the runs
+_model = None
+
+_mats_params = ('E_m', 'E_f', 'slip', 'bond')
+_fets_params = ('A_m', 'A_f', 'L_b')
+_tl_params = ('d_t', 't_max', 'k_max', 'tolerance', 'solver', 'stall_ratio')
+_ls_params = ('beta', 'c', 'n_max')
+
+
+def run_cb(L, w, n_e_x, **params):
+    '''Response of the crack bridge of the length L to the displacement
+    w of the loaded end, evaluated in the worker processes of
+    NonLinearCB.table. The parameters are the traits of the material
+    model (E_m, E_f, slip, bond), of the element (A_m, A_f, L_b) and of
+    the time loop (d_t, t_max, k_max, tolerance, solver, stall_ratio).
+    The optional parameter line_search lists beta, c and n_max of the
+    LineSearch of the time loop. Return the histories of the force at
+    the loaded end and of the matrix stress and the reinforcement strain
+    at the integration points.
+    '''
+    global _model
+    if _model is None:
+        ts = TStepper()
+        _model = (ts, TLoop(ts=ts))
+    ts, tl = _model
+
+    ts.n_e_x = n_e_x
+    ts.L_x = L
+    tl.line_search = None
+    for name, value in params.items():
+        if name == 'line_search':
+            beta, c, n_max = value
+            tl.line_search = LineSearch(beta=beta, c=c, n_max=int(n_max))
+        elif name in _mats_params:
+            setattr(ts.mats_eval, name, list(value)
+                    if name in ('slip', 'bond') else value)
+        elif name in _fets_params:
+            setattr(ts.fets_eval, name, value)
+        elif name in _tl_params:
+            setattr(tl, name, value)
+        else:
+            raise KeyError('unknown parameter %s' % name)
+
+    n_dofs = ts.domain.n_dofs
+    ts.bc_list = [BCDof(var='u', dof=0, value=0.0),
+                  BCDof(var='u', dof=1, value=0.0),
+                  BCDof(var='u', dof=n_dofs - 1, value=w)]
+    tl.record_fields = {'F': [n_dofs - 1], 'sig_m': None, 'eps_f': None}
+    _, F_record, _, sig_m, eps_f = tl.eval()
+    return {'F': F_record[:, 0], 'sig_m': sig_m, 'eps_f': eps_f}
+
+
+def resample(sig_c, field, sig_c_arr):
+    '''linear interpolation of the rows of field recorded at the
+    nondecreasing composite stresses sig_c to the levels sig_c_arr
+    '''
+    n = len(sig_c)
+    i = np.clip(np.searchsorted(sig_c, sig_c_arr, side='right') - 1, 0, n - 2)
+    d_sig_c = sig_c[i + 1] - sig_c[i]
+    w = np.clip((sig_c_arr - sig_c[i]) /
+                np.where(d_sig_c > 0, d_sig_c, 1.), 0., 1.)[:, None]
+    return (1. - w) * field[i] + w * field[i + 1]
 
 
 if __name__ == '__main__':
     import matplotlib.pyplot as plt
-    from scipy.interpolate import interp2d
 
     def test_error(test_l=5, sig_c=12):
 
@@ -179,8 +317,7 @@ if __name__ == '__main__':
 
         x = np.linspace(0, test_l, 30)
 
-        interp = cb.interps_m[cb.get_interp_idx(test_l)]
-        y = interp(x, sig_c)
+        y = cb.get_sig_m_z(x, test_l, sig_c)
 
         plt.plot(x, y)
         plt.legend()
@@ -1,14 +1,17 @@
 import sys
 
+from cbfe.bond_law import PiecewiseLinearLaw
+from cbfe.geo_kernel import GeoKernel
+from cbfe.nls_control import LineSearch, StepControl
+from cbfe.recorder import Recorder
 from ibvpy.api import BCDof
 from ibvpy.fets.fets_eval import FETSEval, IFETSEval
 from ibvpy.mats.mats1D import MATS1DElastic
 from ibvpy.mats.mats1D5.mats1D5_bond import MATS1D5Bond
 from ibvpy.mesh.fe_grid import FEGrid
 from mathkit.matrix_la.sys_mtx_assembly import SysMtxAssembly
-from scipy.interpolate import interp1d
 from traits.api import provides, Int, Array, HasTraits, Instance, \
-    Property, cached_property, Constant, Float, List
+    Property, cached_property, Constant, Float, List, Enum, Dict
 
 import matplotlib.pyplot as plt
 import numpy as np
@@ -83,21 +86,18 @@ class MATSEval(HasTraits):
     slip = List
     bond = List
 
+    bond_law = Property(depends_on='slip[], bond[]')
+    '''Tabulated bond-slip law constructed from slip and bond.
+    '''
+    @cached_property
+    def _get_bond_law(self):
+        return PiecewiseLinearLaw(slip=self.slip, bond=self.bond)
+
     def b_s_law(self, x):
-        return np.sign(x) * np.interp(np.abs(x), self.slip, self.bond)
+        return self.bond_law.get_tau_G(x)[0]
 
     def G(self, x):
-        d = np.diff(self.bond) / np.diff(self.slip)
-        d = np.append(d, d[-1])
-        G = interp1d(
-            np.array(self.slip), d, kind='zero', fill_value=(0, 0), bounds_error=False)
-#         y = np.zeros_like(x)
-#         y[x < self.slip[0]] = d[0]
-#         y[x > self.slip[-1]] = d[-1]
-#         x[x < self.slip[0]] = self.slip[-1] + 10000.
-#         y[x <= self.slip[-1]] = G(x[x <= self.slip[-1]])
-#         return np.sign(x) * y
-        return G(np.abs(x))
+        return self.bond_law.get_tau_G(x)[1]
 
     n_e_x = Float
 
@@ -105,12 +105,12 @@ class MATSEval(HasTraits):
         n_e, n_ip, n_s = eps.shape
         D = np.zeros((n_e, n_ip, 3, 3))
         D[:, :, 0, 0] = self.E_m
-        D[:, :, 1, 1] = self.G(eps[:, :, 1])
+        tau, D[:, :, 1, 1] = self.bond_law.get_tau_G(eps[:, :, 1])
         D[:, :, 2, 2] = self.E_reinf(eps[:, :, 2])
 
         d_sig = np.einsum('...st,...t->...s', D, d_eps)
         sig += d_sig
-        sig[:, :, 1] = self.b_s_law(eps[:, :, 1])
+        sig[:, :, 1] = tau
         sig[:, :, 2] = self.reinf_law(eps[:, :, 2])
 
         return sig, D
@@ -309,10 +309,19 @@ class TStepper(HasTraits):
 
         return B
 
+    geo_kernel = Property(depends_on='n_e_x, L_x, fets_eval.A_f, '
+                          'fets_eval.A_m, fets_eval.L_b')
+    '''Geometric factors of the element matrices and internal forces.
+    '''
+    @cached_property
+    def _get_geo_kernel(self):
+        return GeoKernel(w_ip=self.fets_eval.ip_weights, A=self.A,
+                         B=self.B, J_det=self.J_det)
+
     def apply_essential_bc(self):
         '''Insert initial boundary conditions at the start up of the calculation.. 
         '''
-        self.K = SysMtxAssembly()
+        self.K = SysMtxAssembly(matrix_type='csr')
         for bc in self.bc_list:
             bc.apply_essential(self.K)
 
@@ -333,14 +342,9 @@ class TStepper(HasTraits):
         n_dof_r, n_dim_dof = self.fets_eval.dof_r.shape
         n_nodal_dofs = self.fets_eval.n_nodal_dofs
         n_el_dofs = n_dof_r * n_nodal_dofs
-        # [ i ]
-        w_ip = fets_eval.ip_weights
-
         d_u_e = d_U[elem_dof_map]
-        #[n_e, n_dof_r, n_dim_dof]
-        d_u_n = d_u_e.reshape(n_e, n_dof_r, n_nodal_dofs)
         #[n_e, n_ip, n_s]
-        d_eps = np.einsum('einsd,end->eis', self.B, d_u_n)
+        d_eps = self.geo_kernel.get_d_eps(d_u_e)
 
         # update strain
         eps += d_eps
@@ -352,22 +356,24 @@ class TStepper(HasTraits):
 
         # system matrix
         self.K.reset_mtx()
-        Ke = np.einsum('i,s,einsd,eist,eimtf,ei->endmf',
-                       w_ip, self.A, self.B, D, self.B, self.J_det)
+        Ke = self.geo_kernel.get_Ke(D)
 
         self.K.add_mtx_array(
             Ke.reshape(-1, n_el_dofs, n_el_dofs), elem_dof_map)
 
         # internal forces
-        # [n_e, n_n, n_dim_dof]
-        Fe_int = np.einsum('i,s,eis,einsd,ei->end',
-                           w_ip, self.A, sig, self.B, self.J_det)
+        # [n_e, n_el_dofs]
+        Fe_int = self.geo_kernel.get_Fe_int(sig)
         F_int = -np.bincount(elem_dof_map.flatten(), weights=Fe_int.flatten())
         self.apply_bc(step_flag, self.K, F_int, t_n, t_n1)
         return F_int, self.K, eps, sig
 
 
-class TLoop(HasTraits):
+class TLoop(StepControl):
+
+    '''Incremental solution of the pull-out response with the load steps
+    d_t, optionally adapted to the convergence, see StepControl.
+    '''
 
     ts = Instance(TStepper)
     d_t = Float(0.01)
@@ -375,60 +381,140 @@ class TLoop(HasTraits):
     k_max = Int(200)
     tolerance = Float(1e-6)
 
+    solver = Enum('newton', 'modified_newton', 'initial_stiffness')
+    '''Iteration strategy:
+    newton - the tangent stiffness is factorized in every iteration,
+    modified_newton - the factorization is reused within the load step,
+    initial_stiffness - the first factorization is reused over all
+    load steps until the convergence stalls.
+    The stiffness is still assembled and the essential boundary
+    conditions are eliminated in every iteration, only the LU
+    factorization is saved.
+    '''
+
+    stall_ratio = Float(0.5)
+    '''Refactorize the stiffness reused by modified_newton and
+    initial_stiffness if the residuum norm is not reduced below this
+    ratio of the previous one.
+    '''
+
+    line_search = Instance(LineSearch)
+    '''Optional backtracking line search along the corrector iterations.
+    '''
+
+    record_fields = Dict
+    '''Recorded fields ('U', 'F', 'sf', 'sig_m', 'eps_f') mapped to
+    the selected indices of the flattened field, None selects the whole
+    field, e.g. {'U': [n_dof], 'F': [n_dof]} records only the loaded end.
+    The history of a field not included is returned as None.
+    By default all fields are recorded completely.
+    '''
+
+    def get_recorder(self, **field_sizes):
+        '''Construct the recorder preallocated for the expected
+        number of load steps.
+        '''
+        selection = self.record_fields or dict.fromkeys(field_sizes)
+        recorder = Recorder(n_records=int(self.t_max / self.d_t) + 2,
+                            selection=selection)
+        recorder.setup(**field_sizes)
+        return recorder
+
+    def reuse_factor(self, k, norm_R, norm_R_prev):
+        '''Decide if the factorization of the last iteration can be reused.
+        '''
+        if self.solver == 'newton':
+            return False
+        if k > 0 and norm_R > self.stall_ratio * norm_R_prev:
+            # convergence stalls - refactorize
+            return False
+        if self.solver == 'initial_stiffness':
+            # kept over the load steps
+            return True
+        return k > 0
+
     def eval(self):
 
         self.ts.apply_essential_bc()
 
         t_n = 0.
         t_n1 = t_n
+        d_t = self.d_t
         n_dofs = self.ts.domain.n_dofs
         n_e = self.ts.domain.n_active_elems
         n_ip = self.ts.fets_eval.n_gp
         n_s = self.ts.mats_eval.n_s
-        U_record = np.zeros(n_dofs)
-        F_record = np.zeros(n_dofs)
         U_k = np.zeros(n_dofs)
         eps = np.zeros((n_e, n_ip, n_s))
         sig = np.zeros((n_e, n_ip, n_s))
 
-        sf_record = np.zeros(2 * n_e)  # shear flow
-
-        eps_f_record = np.zeros(2 * n_e)
-        sig_m_record = np.zeros(2 * n_e)
+        # sf - shear flow
+        recorder = self.get_recorder(U=n_dofs, F=n_dofs, sf=n_ip * n_e,
+                                     sig_m=n_ip * n_e, eps_f=n_ip * n_e)
+        recorder.record(U=U_k, F=np.zeros(n_dofs), sf=sig[:, :, 1],
+                        sig_m=sig[:, :, 0], eps_f=eps[:, :, 2])
 
         while t_n1 <= self.t_max:
-            t_n1 = t_n + self.d_t
+            if self.adaptive:
+                if self.t_max - t_n <= 1e-8 * self.d_t:
+                    break
+                t_n1 = min(t_n + d_t, self.t_max)
+            else:
+                t_n1 = t_n + d_t
             k = 0
             step_flag = 'predictor'
             d_U = np.zeros(n_dofs)
             d_U_k = np.zeros(n_dofs)
+            norm_R_prev = 0.
+            # state of the last converged step - the material
+            # model updates the stresses in place
+            state_n = (np.copy(eps), np.copy(sig))
+            converged = False
             while k < self.k_max:
-                R, K, eps, sig = self.ts.get_corr_pred(
-                    step_flag, d_U_k, eps, sig, t_n, t_n1)
-
-                F_ext = -R
-                K.apply_constraints(R)
-                d_U_k = K.solve()
+                if self.line_search is None or k < 2:
+                    R, K, eps, sig = self.ts.get_corr_pred(
+                        step_flag, d_U_k, eps, sig, t_n, t_n1)
+
+                    F_ext = -R
+                    K.apply_constraints(R)
+                    norm_R = np.linalg.norm(R)
+                    if not np.isfinite(norm_R):
+                        break
+                else:
+                    # only the correctors are scaled, the first increment
+                    # carries the prescribed displacements
+                    s, F_ext, R, K, eps, sig, norm_R = \
+                        self.line_search.search(self.ts, d_U_k, eps, sig,
+                                                norm_R_prev, t_n, t_n1)
+                    d_U += (s - 1.) * d_U_k
+                d_U_k = K.solve(
+                    reuse_factor=self.reuse_factor(k, norm_R, norm_R_prev))
+                norm_R_prev = norm_R
                 d_U += d_U_k
-                if np.linalg.norm(R) < self.tolerance:
-                    F_record = np.vstack((F_record, F_ext))
+                if norm_R < self.tolerance:
+                    converged = True
                     U_k += d_U
-                    U_record = np.vstack((U_record, U_k))
-                    sf_record = np.vstack((sf_record, sig[:, :, 1].flatten()))
-
-                    sig_m_record = np.vstack(
-                        (sig_m_record, sig[:, :, 0].flatten()))
-                    eps_f_record = np.vstack(
-                        (eps_f_record, eps[:, :, 2].flatten()))
-
+                    recorder.record(U=U_k, F=F_ext, sf=sig[:, :, 1],
+                                    sig_m=sig[:, :, 0], eps_f=eps[:, :, 2])
                     break
                 k += 1
-                if k == self.k_max:
-                    print('nonconvergence')
                 step_flag = 'corrector'
 
-            t_n = t_n1
-        return U_record, F_record, sf_record, sig_m_record, eps_f_record
+            if converged:
+                t_n = t_n1
+                d_t = self.get_next_step(d_t, k)
+            elif self.adaptive:
+                # cut back the step and restart from the converged state
+                d_t *= self.step_cutback
+                eps, sig = state_n
+                if d_t < self.d_t_min:
+                    print('nonconvergence at t = %g' % t_n1)
+                    break
+            else:
+                print('nonconvergence')
+                t_n = t_n1
+        return (recorder.get('U'), recorder.get('F'), recorder.get('sf'),
+                recorder.get('sig_m'), recorder.get('eps_f'))
 
 
 if __name__ == '__main__':
@@ -3,11 +3,12 @@ Created on 19.03.2017
 
 @author: Yingxiong
 '''
-from scipy.interpolate import interp1d
+import heapq
+
 from scipy.optimize import brentq, minimize_scalar, fmin, brute, newton
 from stats.misc.random_field.random_field_1D import RandomField
 from traits.api import Int, Array, HasTraits, Instance, \
-    Property, cached_property, Constant, Float, List
+    Property, cached_property, Constant, Float, List, Enum, on_trait_change
 
 import matplotlib.pyplot as plt
 import numpy as np
@@ -35,40 +36,69 @@ class CompositeTensileTest(HasTraits):
     # Description of cracked specimen
     #=========================================================================
     y = List([])  # the list to record the crack positions
-    z_x = Property(depends_on='n_x, L, y')
+
+    y_arr = Array(dtype=float)
+    '''the crack positions in ascending order, updated with y
+    '''
+
+    @on_trait_change('y, y_items')
+    def _update_y_arr(self, name, new):
+        if name == 'y_items' and len(new.added) == 1 and not new.removed:
+            # insert the new crack into the sorted array
+            y_i = new.added[0]
+            self.y_arr = np.insert(
+                self.y_arr, np.searchsorted(self.y_arr, y_i), y_i)
+        else:
+            self.y_arr = np.sort(self.y)
+
+    def get_nearest_crack(self, y):
+        '''Return the index of the nearest crack in the sorted crack
+        positions y for each material point, the left crack is taken
+        at equal distances.
+        '''
+        k = np.searchsorted(y, self.x)
+        k_l = np.maximum(k - 1, 0)
+        k_r = np.minimum(k, len(y) - 1)
+        return np.where(np.abs(self.x - y[k_l]) <= np.abs(y[k_r] - self.x),
+                        k_l, k_r)
+
+    z_x = Property(depends_on='n_x, L, y_arr')
     '''the array containing the distances from each material point to its 
     nearest crack position
     '''
     @cached_property
     def _get_z_x(self):
-        try:
-            y = np.array(self.y)
-            z_grid = np.abs(self.x[:, np.newaxis] - y[np.newaxis, :])
-            return np.amin(z_grid, axis=1)
-        except ValueError:  # no cracks exist
+        y = self.y_arr
+        if not len(y):  # no cracks exist
             return np.ones_like(self.x) * 2 * self.L
+        return np.abs(self.x - y[self.get_nearest_crack(y)])
 
-    BC_x = Property(depends_on='x, y, L')
+    BC_x = Property(depends_on='x, y_arr, L')
     '''the array containing the boundary condition for each material point
     '''
     @cached_property
     def _get_BC_x(self):
-        try:
-            y = np.sort(self.y)
-            d = (y[1:] - y[:-1]) / 2.0
-            # construct a piecewise function for interpolation
-            xp = np.hstack([self.x[0], y, self.x[-1]])
-            BC_arr = np.hstack([y[0], d, self.L - y[-1], np.NAN])
-            f = interp1d(xp, BC_arr, kind='zero')
-            return f(self.x)
-        except IndexError:
+        y = self.y_arr
+        if not len(y):
             return np.vstack([np.zeros_like(self.x), np.zeros_like(self.x)])
+        # piecewise constant between the cracks, a crack belongs to
+        # the segment on its right
+        BC_arr = np.hstack([y[0], (y[1:] - y[:-1]) / 2.0, self.L - y[-1]])
+        BC_x = BC_arr[np.searchsorted(y, self.x, side='right')]
+        BC_x[-1] = np.nan  # undefined at the end of the specimen
+        return BC_x
 
     #=========================================================================
     # Strength of the specimen
     #=========================================================================
     strength = Float(20.)  # [MPa]
 
+    solver = Enum('brentq', 'batch')
+    '''Root solver of the cracking loads:
+    brentq - get_sig_c_x_i, one brentq per material point,
+    batch - get_sig_c_x_batch, all material points at once.
+    '''
+
     #=========================================================================
     # Determine the cracking load level
     #=========================================================================
@@ -87,12 +117,52 @@ class CompositeTensileTest(HasTraits):
 
     get_sig_c_x_i = np.vectorize(get_sig_c_z)
 
+    def get_sig_c_x_batch(self, sig_mu_x, z_x, BC_x, sig_c_i_1):
+        '''Determine the cracking loads of all material points together,
+        the counterpart of get_sig_c_x_i.
+
+        The matrix stress of the tabulated crack bridge is linear in the
+        composite stress between the levels cb.sig_c_arr. The levels
+        enclosing the root are found by the bisection of the level index
+        for all points at once and the root is interpolated in the
+        enclosing interval.
+        '''
+        sig_c_arr = np.unique(np.clip(np.hstack(
+            (0., self.cb.sig_c_arr, self.strength)), 0., self.strength))
+
+        def fun(k):
+            return sig_mu_x - self.cb.get_sig_m_z(z_x, BC_x, sig_c_arr[k])
+
+        k_a = np.zeros(len(sig_mu_x), dtype=int)
+        k_b = np.full(len(sig_mu_x), len(sig_c_arr) - 1)
+        f_a, f_b = fun(k_a), fun(k_b)
+        # no solution, shielded zone
+        shielded = f_a * f_b > 0
+        while np.any(k_b - k_a > 1):
+            k_c = (k_a + k_b) // 2
+            f_c = fun(k_c)
+            left = (f_a * f_c <= 0) | shielded
+            k_b, f_b = np.where(left, k_c, k_b), np.where(left, f_c, f_b)
+            k_a, f_a = np.where(left, k_a, k_c), np.where(left, f_a, f_c)
+        d_f = f_a - f_b
+        sig_c = sig_c_arr[k_a] + (sig_c_arr[k_b] - sig_c_arr[k_a]) * \
+            np.where(d_f != 0, f_a / np.where(d_f != 0, d_f, 1.), 0.)
+        return np.where(shielded, 1e6, sig_c)
+
+    def get_sig_c_x(self, sig_mu_x, z_x, BC_x, sig_c_i_1):
+        '''Determine the cracking loads of the material points with
+        the selected solver.
+        '''
+        if self.solver == 'batch':
+            return self.get_sig_c_x_batch(sig_mu_x, z_x, BC_x, sig_c_i_1)
+        return self.get_sig_c_x_i(self, sig_mu_x, z_x, BC_x, sig_c_i_1)
+
     def get_sig_c_i(self, sig_c_i_1):
         '''Determine the new crack position and level of composite stress
         '''
         # for each material point find the load factor initiating a crack
-        sig_c_x_i = self.get_sig_c_x_i(self, self.sig_mu_x,
-                                       self.z_x, self.BC_x, sig_c_i_1)
+        sig_c_x_i = self.get_sig_c_x(self.sig_mu_x,
+                                     self.z_x, self.BC_x, sig_c_i_1)
         # get the position of the material point corresponding to
         # the minimum cracking load factor
         y_idx = np.argmin(sig_c_x_i)
@@ -100,11 +170,29 @@ class CompositeTensileTest(HasTraits):
         sig_c_i = sig_c_x_i[y_idx]
         return sig_c_i, y_i
 
+    def get_zone(self, y_i):
+        '''Return the slice of the material points between the existing
+        cracks next to the new crack position y_i, i.e. the points whose
+        z_x and BC_x are changed by the new crack.
+        '''
+        y = self.y_arr
+        k = np.searchsorted(y, y_i)
+        x_l = y[k - 1] if k > 0 else self.x[0]
+        x_r = y[k] if k < len(y) else self.x[-1]
+        return slice(np.searchsorted(self.x, x_l, side='left'),
+                     np.searchsorted(self.x, x_r, side='right'))
+
     #=========================================================================
     # determine the crack history
     #=========================================================================
     def get_cracking_history(self):
         '''Trace the response crack by crack.
+
+        The cracking loads of the material points are kept in a priority
+        queue. A new crack changes z_x and BC_x only between its
+        neighbouring cracks, the cracking loads are determined again for
+        these points only and the outdated entries of the queue are
+        skipped when the next crack is taken.
         '''
         z_x_lst = [self.z_x]  # record z array of each cracking state
         # record boundary condition of each cracking state
@@ -120,17 +208,33 @@ class CompositeTensileTest(HasTraits):
         z_x_lst.append(np.array(self.z_x))
         BC_x_lst.append(np.array(self.BC_x))
 
+        # cracking loads of all material points
+        sig_c_x = self.get_sig_c_x(self.sig_mu_x,
+                                   self.z_x, self.BC_x, sig_c_0)
+        queue = list(zip(sig_c_x, range(self.n_x)))
+        heapq.heapify(queue)
+
         # determine the following cracking load factors
         while True:
-            sig_c_i, y_i = self.get_sig_c_i(sig_c_lst[-1])
+            # skip the entries replaced after the previous cracks
+            while queue[0][0] != sig_c_x[queue[0][1]]:
+                heapq.heappop(queue)
+            sig_c_i, y_idx = queue[0]
+            y_i = self.x[y_idx]
             if sig_c_i >= self.strength or sig_c_i == 1e6:
                 break
             print(sig_c_i, y_i)
+            zone = self.get_zone(y_i)
             self.y.append(y_i)
             print('number of cracks:', len(self.y))
             sig_c_lst.append(sig_c_i)
             z_x_lst.append(np.array(self.z_x))
             BC_x_lst.append(np.array(self.BC_x))
+            # update the cracking loads between the neighbouring cracks
+            sig_c_x[zone] = self.get_sig_c_x(
+                self.sig_mu_x[zone], self.z_x[zone], self.BC_x[zone], sig_c_i)
+            for idx in range(zone.start, zone.stop):
+                heapq.heappush(queue, (sig_c_x[idx], idx))
 #             self.save_cracking_history(sig_c_i, z_x_lst, BC_x_lst)
 #             print 'strength', self.strength
         print('cracking history determined')
@@ -155,20 +259,13 @@ class CompositeTensileTest(HasTraits):
         '''function to evaluate specimen reinforcement strain profile
         at given load level and crack distribution
         '''
-        eps_f = np.zeros_like(self.x)
-        z_x_map = np.argsort(z_x)
-        eps_f[z_x_map] = self.cb.get_eps_f_z(
-            z_x[z_x_map], BC, sig_c)
-        return eps_f
+        return self.cb.get_eps_f_z(z_x, BC, sig_c)
 
     def get_sig_m_x(self, sig_c, z_x, BC):
         '''function to evaluate specimen matrix stress profile
         at given load level and crack distribution
         '''
-        eps_m = np.zeros_like(self.x)
-        z_x_map = np.argsort(z_x)
-        eps_m[z_x_map] = self.cb.get_sig_m_z(z_x[z_x_map], BC[z_x_map], sig_c)
-        return eps_m
+        return self.cb.get_sig_m_z(z_x, BC, sig_c)
 
     def get_eps_c_arr(self, sig_c_i, z_x_i, BC_x_i, load_arr):
         '''function to evaluate the average specimen strain array corresponding 
@@ -203,14 +300,22 @@ class CompositeTensileTest(HasTraits):
         '''evaluate the crack openings for gving load(single)'''
         eps_f_x = self.get_eps_f_x(load, z_x, BC_x)
         eps_m_x = self.get_sig_m_x(load, z_x, BC_x) / self.cb.E_m
-        y = self.x[z_x == 0]
-        distance = np.abs(self.x[:, np.newaxis] - y[np.newaxis, :])
-        nearest_crack = y[np.argmin(distance, axis=1)]
-        w_arr = np.array([np.trapz((eps_f_x[nearest_crack == y_i] -
-                                    eps_m_x[nearest_crack == y_i]),
-                                   self.x[nearest_crack == y_i])
-                          for y_i in y])
-        return w_arr
+        return self.get_w_arr(eps_f_x, eps_m_x, self.x[z_x == 0])
+
+    def get_w_arr(self, eps_f_x, eps_m_x, y):
+        '''evaluate the openings of the cracks y, i.e. the trapezoidal
+        integrals of the strain difference over the material points
+        nearest to each crack, as differences of the cumulative integral
+        '''
+        nearest = self.get_nearest_crack(y)
+        d_eps = eps_f_x - eps_m_x
+        cum = np.hstack(
+            (0., np.cumsum((d_eps[1:] + d_eps[:-1]) / 2. * np.diff(self.x))))
+        k = np.arange(len(y))
+        # first and last material point of each crack
+        i_0 = np.searchsorted(nearest, k, side='left')
+        i_1 = np.searchsorted(nearest, k, side='right') - 1
+        return cum[i_1] - cum[i_0]
 
     def get_w_dist(self, sig_c_i, z_x_i, BC_x_i, load_arr):
         '''function for evaluate the crack width
@@ -229,12 +334,7 @@ class CompositeTensileTest(HasTraits):
                 y = self.x[z_x == 0]
                 if not y.size:
                     continue
-                distance = np.abs(self.x[:, np.newaxis] - y[np.newaxis, :])
-                nearest_crack = y[np.argmin(distance, axis=1)]
-                w_arr = np.array([np.trapz((eps_f_x[nearest_crack == y_i] -
-                                            eps_m_x[nearest_crack == y_i]),
-                                           self.x[nearest_crack == y_i])
-                                  for y_i in y])
+                w_arr = self.get_w_arr(eps_f_x, eps_m_x, y)
             w_dist.append(w_arr)
 
         return w_dist
@@ -262,6 +362,23 @@ if __name__ == '__main__':
                                cb=cb,
                                sig_mu_x=random_field.random_field)
 
+    #=========================================================================
+    # benchmark of the cracking load solvers for all material points
+    #=========================================================================
+    import timeit
+
+    ctt.y = [50., 180., 320., 430.]
+    args = (ctt.sig_mu_x, ctt.z_x, ctt.BC_x, 0.)
+    sig_c_brentq = ctt.get_sig_c_x_i(ctt, *args)
+    sig_c_batch = ctt.get_sig_c_x_batch(*args)
+    assert np.allclose(sig_c_brentq, sig_c_batch)
+    t_brentq = timeit.timeit(lambda: ctt.get_sig_c_x_i(ctt, *args), number=1)
+    t_batch = timeit.timeit(lambda: ctt.get_sig_c_x_batch(*args), number=10) / 10
+    print('brentq %8.1f ms, batch %8.1f ms, speedup %5.1f' %
+          (t_brentq * 1e3, t_batch * 1e3, t_brentq / t_batch))
+    ctt.y = []
+
+    ctt.solver = 'batch'
     sig_c_i, z_x_i, BC_x_i, sig_c_u, n_crack = ctt.get_cracking_history()
     load_arr = np.unique(np.hstack((np.linspace(0, sig_c_u, 100), sig_c_i)))
     eps_c_arr = ctt.get_eps_c_arr(sig_c_i, z_x_i, BC_x_i, load_arr)
@@ -164,20 +164,13 @@ class CompositeTensileTest(HasTraits):
         '''function to evaluate specimen reinforcement strain profile
         at given load level and crack distribution
         '''
-        eps_f = np.zeros_like(self.x)
-        z_x_map = np.argsort(z_x)
-        eps_f[z_x_map] = self.cb.get_eps_f_z(
-            z_x[z_x_map], BC, sig_c)
-        return eps_f
+        return self.cb.get_eps_f_z(z_x, BC, sig_c)
 
     def get_sig_m_x(self, sig_c, z_x, BC):
         '''function to evaluate specimen matrix stress profile
         at given load level and crack distribution
         '''
-        eps_m = np.zeros_like(self.x)
-        z_x_map = np.argsort(z_x)
-        eps_m[z_x_map] = self.cb.get_sig_m_z(z_x[z_x_map], BC[z_x_map], sig_c)
-        return eps_m
+        return self.cb.get_sig_m_z(z_x, BC, sig_c)
 
     def get_eps_c_arr(self, sig_c_i, z_x_i, BC_x_i, load_arr):
         '''function to evaluate the average specimen strain array corresponding 
@@ -6,6 +6,7 @@ Created on 29.02.2016
 import matplotlib.pyplot as plt
 import numpy as np
 from cbfe.scratch.fe_nls_solver_incre1 import MATSEval, FETS1D52ULRH, TStepper, TLoop
+from cbfe.eval_cache import cached_eval
 from ibvpy.api import BCDof
 
 # 30-v1-r2
@@ -62,7 +63,7 @@ def plt_expri(L_x, slip, bond, fpath, label, color):
     tl.ts.L_x = L_x
     tl.ts.mats_eval.slip = slip.tolist()
     tl.ts.mats_eval.bond = bond.tolist()
-    U_record, F_record, tau = tl.eval()
+    U_record, F_record, tau = cached_eval(tl)
     n_dof = 2 * ts.domain.n_active_elems + 1
     plt.plot(U_record[:, n_dof], F_record[:, n_dof],
              marker='.', color='k', markevery=5)
@@ -94,7 +95,7 @@ def predict(L_x, slip, bond):
     tl.ts.L_x = L_x
     tl.ts.mats_eval.slip = slip.tolist()
     tl.ts.mats_eval.bond = bond.tolist()
-    U_record, F_record = tl.eval()
+    U_record, F_record = cached_eval(tl)
     n_dof = 2 * ts.domain.n_active_elems + 1
     plt.plot(U_record[:, n_dof], F_record[:, n_dof],
              marker='.', color='k', markevery=5)
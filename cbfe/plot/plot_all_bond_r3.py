@@ -6,6 +6,7 @@ Created on 03.02.2016
 import matplotlib.pyplot as plt
 import numpy as np
 from cbfe.scratch.fe_nls_solver_incre1 import MATSEval, FETS1D52ULRH, TStepper, TLoop
+from cbfe.eval_cache import cached_eval
 from ibvpy.api import BCDof
 
 
@@ -138,7 +139,7 @@ def plt_expri(L_x, slip, bond, fpath, label, color):
     tl.ts.L_x = L_x
     tl.ts.mats_eval.slip = slip.tolist()
     tl.ts.mats_eval.bond = bond.tolist()
-    U_record, F_record = tl.eval()
+    U_record, F_record = cached_eval(tl)
     n_dof = 2 * ts.domain.n_active_elems + 1
     plt.plot(U_record[:, n_dof], F_record[:, n_dof],
              color='k', markevery=5)
@@ -183,7 +184,7 @@ tl.ts.mats_eval.slip = x.tolist()
 tl.ts.mats_eval.bond = y.tolist()
 plt.figure()
 tl.ts.L_x = 250.
-U_record, F_record = tl.eval()
+U_record, F_record = cached_eval(tl)
 n_dof = 2 * ts.domain.n_active_elems + 1
 plt.plot(U_record[:, n_dof], F_record[:, n_dof],
          marker='.', color='k', markevery=5, label='predicted')
@@ -200,7 +201,7 @@ plt.ylim(0,)
 
 plt.figure()
 tl.ts.L_x = 300.
-U_record, F_record = tl.eval()
+U_record, F_record = cached_eval(tl)
 n_dof = 2 * ts.domain.n_active_elems + 1
 plt.plot(U_record[:, n_dof], F_record[:, n_dof],
          marker='.', color='k', label='predicted', markevery=5)
@@ -221,7 +222,7 @@ plt.ylim(0,)
 
 plt.figure()
 tl.ts.L_x = 350.
-U_record, F_record = tl.eval()
+U_record, F_record = cached_eval(tl)
 n_dof = 2 * ts.domain.n_active_elems + 1
 plt.plot(U_record[:, n_dof], F_record[:, n_dof],
          marker='.', color='k', label='predicted', markevery=5)
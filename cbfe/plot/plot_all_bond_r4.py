@@ -6,6 +6,7 @@ Created on 03.02.2016
 import matplotlib.pyplot as plt
 import numpy as np
 from cbfe.scratch.fe_nls_solver_incre1 import MATSEval, FETS1D52ULRH, TStepper, TLoop
+from cbfe.eval_cache import cached_eval
 from ibvpy.api import BCDof
 
 # 10-v1_r4
@@ -132,7 +133,7 @@ def plt_expri(L_x, slip, bond, fpath, label, color):
     tl.ts.L_x = L_x
     tl.ts.mats_eval.slip = slip.tolist()
     tl.ts.mats_eval.bond = bond.tolist()
-    U_record, F_record, sf_record = tl.eval()
+    U_record, F_record, sf_record = cached_eval(tl)
     n_dof = 2 * ts.domain.n_active_elems + 1
     plt.plot(U_record[:, n_dof], F_record[:, n_dof],
              marker='.', color='k', markevery=5)
@@ -188,7 +189,7 @@ tl.ts.mats_eval.bond = y.tolist()
 #
 plt.figure()
 tl.ts.L_x = 200.
-U_record, F_record, sf_record = tl.eval()
+U_record, F_record, sf_record = cached_eval(tl)
 n_dof = 2 * ts.domain.n_active_elems + 1
 plt.plot(U_record[:, n_dof], F_record[:, n_dof],
          marker='.', color='k', label='predicted', markevery=5)
@@ -210,7 +211,7 @@ plt.ylim(0,)
 
 plt.figure()
 tl.ts.L_x = 250.
-U_record, F_record, sf_record = tl.eval()
+U_record, F_record, sf_record = cached_eval(tl)
 n_dof = 2 * ts.domain.n_active_elems + 1
 plt.plot(U_record[:, n_dof], F_record[:, n_dof],
          marker='.', color='k', markevery=5, label='predicted')
@@ -230,7 +231,7 @@ plt.ylim(0,)
 
 plt.figure()
 tl.ts.L_x = 300.
-U_record, F_record, sf_record = tl.eval()
+U_record, F_record, sf_record = cached_eval(tl)
 n_dof = 2 * ts.domain.n_active_elems + 1
 plt.plot(U_record[:, n_dof], F_record[:, n_dof],
          marker='.', color='k', label='predicted', markevery=5)
@@ -251,7 +252,7 @@ plt.ylim(0,)
 
 plt.figure()
 tl.ts.L_x = 350.
-U_record, F_record, sf_record = tl.eval()
+U_record, F_record, sf_record = cached_eval(tl)
 n_dof = 2 * ts.domain.n_active_elems + 1
 plt.plot(U_record[:, n_dof], F_record[:, n_dof],
          marker='.', color='k', label='predicted', markevery=5)
@@ -384,7 +385,7 @@ def predict_max(L_x, slip, bond):
     tl.ts.L_x = L_x
     tl.ts.mats_eval.slip = slip.tolist()
     tl.ts.mats_eval.bond = bond.tolist()
-    U_record, F_record, sf_record = tl.eval()
+    U_record, F_record, sf_record = cached_eval(tl)
     n_dof = 2 * ts.domain.n_active_elems + 1
     max_F_idx = np.argmax(F_record[:, n_dof])
     U = np.reshape(U_record[max_F_idx, :], (-1, 2)).T
@@ -397,7 +398,7 @@ def predict_max_limited_slip(L_x, slip, bond, s_limit):
     tl.ts.L_x = L_x
     tl.ts.mats_eval.slip = slip.tolist()
     tl.ts.mats_eval.bond = bond.tolist()
-    U_record, F_record, sf_record = tl.eval()
+    U_record, F_record, sf_record = cached_eval(tl)
     n_dof = 2 * ts.domain.n_active_elems + 1
     slip_left = U_record[:, ts.domain.n_active_elems + 1] - U_record[:, 0]
     idx = np.argmin(np.abs(slip_left - s_limit))